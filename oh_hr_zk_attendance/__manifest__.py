@@ -21,7 +21,7 @@
 #############################################################################
 {
     'name': 'Open HRMS Biometric Device Integration',
-    'version': '16.0.1.0.0',
+    'version': '16.0.1.1.0',
     'summary': """Integrating Biometric Device With HR Attendance (Face + Thumb)""",
     'description': 'This module integrates Odoo with the biometric device(Model: ZKteco uFace 202)',
     'category': 'Generic Modules/Human Resources',
@@ -38,6 +38,15 @@
         'security/ir.model.access.csv',
         'views/zk_machine_view.xml',
         'views/zk_machine_attendance_view.xml',
+        'views/zk_machine_user_view.xml',
+        'views/zk_sync_run_view.xml',
+        'views/zk_attendance_day_view.xml',
+        'views/res_config_settings_view.xml',
+        'wizard/zk_enrolment_view.xml',
+        'wizard/zk_template_sync_view.xml',
+        'wizard/zk_fleet_command_view.xml',
+        'wizard/zk_purge_view.xml',
+        'wizard/zk_export_view.xml',
         'data/download_data.xml'
     ],
     'images': ['static/description/banner.png'],
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import hmac
+
+from odoo import fields, http
+from odoo.http import content_disposition, request
+from odoo.modules.registry import Registry
+
+from ..models.zkexport import EXPORT_ENCODERS, encode_batches
+from ..models.zkmetrics import render
+
+# System parameter holding the bearer token of the metrics endpoint, the
+# endpoint answers 404 while it is not set.
+METRICS_TOKEN_PARAM = 'oh_hr_zk_attendance.metrics_token'
+# Punches fetched from the server-side cursor of an export at a time
+EXPORT_BATCH_SIZE = 5000
+
+
+def _fetch_batches(dbname, query, params, labels):
+    """Yields the rows of query in lists of EXPORT_BATCH_SIZE, read from a
+    server-side cursor in a cursor of its own: the response is streamed after
+    the cursor of the request is closed. labels maps column indexes to the
+    labels replacing their values."""
+    with Registry(dbname).cursor() as cr:
+        cr.execute("SET TRANSACTION READ ONLY")
+        cr.execute("DECLARE zk_punch_export NO SCROLL CURSOR FOR " + query, params)
+        while True:
+            cr.execute("FETCH FORWARD %s FROM zk_punch_export", [EXPORT_BATCH_SIZE])
+            rows = cr.fetchall()
+            if not rows:
+                break
+            for index, mapping in labels.items():
+                rows = [row[:index] + (mapping.get(row[index], row[index]),) + row[index + 1:] for row in rows]
+            yield rows
+
+
+class ZkMetricsController(http.Controller):
+
+    @http.route('/zk_attendance/metrics', type='http', auth='none', methods=['GET'], csrf=False,
+                save_session=False)
+    def metrics(self, token=None, **kwargs):
+        """Prometheus text exposition of the sync metrics
+
+        Everything is read from the database, any worker answers the same
+        values: the gauges from the machines and their sync runs, the
+        counters and histograms from the series of zk.sync.metric, updated
+        by the process running the syncs when its transactions end. The
+        token is passed as a bearer
+        Authorization header or as the token query parameter."""
+        if not request.db:
+            return request.not_found()
+        expected = request.env['ir.config_parameter'].sudo().get_param(METRICS_TOKEN_PARAM)
+        if not expected:
+            return request.not_found()
+        auth = request.httprequest.headers.get('Authorization', '')
+        if auth.startswith('Bearer '):
+            token = auth[len('Bearer '):]
+        if not token or not hmac.compare_digest(token.encode(), expected.encode()):
+            return request.make_response('Unauthorized\n', status=401,
+                                         headers=[('WWW-Authenticate', 'Bearer')])
+        machines = request.env['zk.machine'].sudo().search_read(
+            [], ['name', 'port_no', 'device_type', 'next_poll_at', 'breaker_state'])
+        now = fields.Datetime.now()
+        backlog = sum(1 for machine in machines
+                      if machine['breaker_state'] != 'open'
+                      and (not machine['next_poll_at'] or machine['next_poll_at'] <= now))
+        extra = [
+            ('zk_machine_info', 'gauge', "Configured machines", [
+                ({'machine_id': machine['id'], 'machine': '%s:%s' % (machine['name'], machine['port_no']),
+                  'device_type': machine['device_type'], 'breaker_state': machine['breaker_state']}, 1)
+                for machine in machines]),
+            ('zk_sync_backlog_machines', 'gauge', "Machines whose poll is due and not done yet",
+             [({}, backlog)]),
+        ] + request.env['zk.machine'].sudo()._sync_gauges()
+        body = render(request.env['zk.sync.metric'].sudo()._series(), extra)
+        return request.make_response(body, headers=[('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')])
+
+
+class ZkExportController(http.Controller):
+
+    @http.route('/zk_attendance/export/<int:wizard_id>', type='http', auth='user', methods=['GET'])
+    def export_punches(self, wizard_id, **kwargs):
+        """Streams the punches selected by an export wizard
+
+        The body is produced while the punches are fetched, without a
+        Content-Length, so it goes out with chunked transfer encoding and
+        the worker holds one batch at a time."""
+        wizard = request.env['zk.export.wizard'].browse(wizard_id).exists()
+        if not wizard:
+            return request.not_found()
+        wizard.check_access_rule('read')
+        request.env['zk.machine.attendance'].check_access_rights('read')
+        # Read without the record rules, _export_query only selects the
+        # punches of the employees readable by the user.
+        query, params = wizard._export_query()
+        encoder = EXPORT_ENCODERS[wizard.file_format]()
+        batches = _fetch_batches(request.db, query, params, wizard._export_labels())
+        return request.make_response(encode_batches(encoder, batches), headers=[
+            ('Content-Type', encoder.content_type),
+            ('Content-Disposition', content_disposition(wizard._export_filename())),
+        ])
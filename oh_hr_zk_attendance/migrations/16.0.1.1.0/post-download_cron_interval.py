@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""The download cron only selects the machines whose poll is due since the
+adaptive scheduler, it has to run every minute for poll_min_interval and the
+peak hours to take effect. data/download_data.xml is noupdate, the interval
+of the existing cron is updated here unless it was changed by hand."""
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    cr.execute("""
+        UPDATE ir_cron c
+           SET interval_number = 1, interval_type = 'minutes'
+          FROM ir_model_data d
+         WHERE d.module = 'oh_hr_zk_attendance' AND d.name = 'cron_download_data'
+           AND d.model = 'ir.cron' AND c.id = d.res_id
+           AND c.interval_number = 10 AND c.interval_type = 'minutes'
+    """)
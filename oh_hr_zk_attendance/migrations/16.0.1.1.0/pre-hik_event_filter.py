@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""The narrow hik_event_filter default is meant for the new machines. The
+column is created empty before the update, so the ORM does not fill it with
+the default and the existing Hikvision machines keep searching every event."""
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    cr.execute("ALTER TABLE zk_machine ADD COLUMN IF NOT EXISTS hik_event_filter varchar")
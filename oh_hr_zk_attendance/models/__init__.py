@@ -22,6 +22,16 @@
 # -*- coding: utf-8 -*-
 
 from . import zk_machine
+from . import zk_machine_user
+from . import zk_template
+from . import zk_hik_users
+from . import zk_profile
+from . import zk_sync_run
+from . import zk_sync_profiler
+from . import zk_archive
 from . import machine_analysis
+from . import zk_partition
+from . import zk_attendance_day
+from . import res_config_settings
 from . import zklib
 
@@ -1,8 +1,15 @@
 # -*- coding: utf-8 -*-
 
+import logging
+
 from odoo import tools
 from odoo import models, fields, api, _
 
+_logger = logging.getLogger(__name__)
+
+# Punches updated per transaction by the machine backfill
+BACKFILL_BATCH_SIZE = 10000
+
 
 class HrEmployee(models.Model):
     _inherit = 'hr.employee'
@@ -33,8 +40,76 @@ class ZkMachine(models.Model):
                                         ('2', 'Type_2'),
                                         ('3', 'Password'),
                                         ('4', 'Card')], string='Category', help="Select the attendance type")
-    punching_time = fields.Datetime(string='Punching Time', help="Give the punching time")
+    punching_time = fields.Datetime(string='Punching Time', help="Give the punching time", index=True,
+                                    required=True)
     address_id = fields.Many2one('res.partner', string='Working Address', help="Address")
+    machine_id = fields.Many2one('zk.machine', string='Machine', ondelete='set null',
+                                 help="Machine the punch was downloaded from")
+    machine_unknown = fields.Boolean(string='Machine Unknown', readonly=True,
+                                     help="The punch was stored before the machines were recorded and "
+                                          "its machine could not be determined")
+
+    def init(self):
+        super().init()
+        # Incremental lookups of a machine, history of an employee and
+        # duplicate detection of a device user, all bounded in time.
+        tools.create_index(self._cr, 'zk_machine_attendance_machine_time_index', self._table,
+                           ['machine_id', 'punching_time'])
+        tools.create_index(self._cr, 'zk_machine_attendance_employee_time_index', self._table,
+                           ['employee_id', 'punching_time'])
+        tools.create_index(self._cr, 'zk_machine_attendance_device_time_index', self._table,
+                           ['device_id', 'punching_time'])
+        # The punches left to the machine backfill, empty once it is done
+        tools.create_index(self._cr, 'zk_machine_attendance_machine_backfill_index', self._table, ['id'],
+                           where='machine_id IS NULL AND machine_unknown IS NOT TRUE')
+
+    @api.model
+    def _cron_backfill_machine(self, batch_size=BACKFILL_BATCH_SIZE):
+        """Set the machine of the punches stored without one, in committed
+        batches.
+
+        A punch gets the only machine its device user is enrolled on at the
+        working address of the punch, or else the only machine its device
+        user is enrolled on. The punches matching no machine or several
+        machines are marked machine_unknown, they are not looked at again."""
+        query = """
+            WITH batch AS (
+                SELECT id, punching_time, device_id, address_id
+                  FROM zk_machine_attendance
+                 WHERE machine_id IS NULL AND machine_unknown IS NOT TRUE
+                 LIMIT %s
+            ), resolved AS (
+                SELECT b.id, b.punching_time,
+                       CASE WHEN c.at_address = 1 THEN c.address_machine_id
+                            WHEN c.enrolled = 1 THEN c.machine_id END AS machine_id
+                  FROM batch b
+            CROSS JOIN LATERAL (
+                    SELECT count(DISTINCT u.machine_id) AS enrolled, min(u.machine_id) AS machine_id,
+                           count(DISTINCT u.machine_id) FILTER (WHERE m.address_id = b.address_id) AS at_address,
+                           min(u.machine_id) FILTER (WHERE m.address_id = b.address_id) AS address_machine_id
+                      FROM zk_machine_user u
+                      JOIN zk_machine m ON m.id = u.machine_id
+                     WHERE u.user_id = b.device_id
+                   ) c
+            )
+            UPDATE zk_machine_attendance a
+               SET machine_id = r.machine_id, machine_unknown = r.machine_id IS NULL
+              FROM resolved r
+             WHERE a.id = r.id AND a.punching_time = r.punching_time
+         RETURNING a.machine_id
+        """
+        total = unknown = 0
+        while True:
+            self._cr.execute(query, [batch_size])
+            machines = [machine_id for machine_id, in self._cr.fetchall()]
+            total += len(machines)
+            unknown += machines.count(None)
+            self._cr.commit()
+            if len(machines) < batch_size:
+                break
+        if total:
+            _logger.info("Set the machine of %s punches, %s left unknown", total - unknown, unknown)
+        return total - unknown
 
 
 class ReportZkDevice(models.Model):
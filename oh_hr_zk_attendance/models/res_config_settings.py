@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models
+
+
+class ResConfigSettings(models.TransientModel):
+    _inherit = 'res.config.settings'
+
+    zk_attendance_retention_months = fields.Integer(
+        string='Punch Retention (months)', config_parameter='oh_hr_zk_attendance.retention_months',
+        help="Months of device punches kept in the punch table. Older monthly partitions are detached "
+             "and moved to the zk_attendance_archive schema by the daily maintenance. 0 keeps everything.")
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import time
+import zlib
+
+from odoo import api, fields, models, _
+from odoo.tools import config
+
+from .zkarchive import HIK_EVENTS, ZK_ATTLOG, LogArchive, pack_zk, unpack_zk, zk_delta
+from .zkbatch import PunchBatch
+
+_logger = logging.getLogger(__name__)
+
+
+class ZkMachine(models.Model):
+    _inherit = 'zk.machine'
+
+    archive_raw_logs = fields.Boolean(string='Archive Raw Logs', copy=False,
+                                      help="Keep a compressed copy of the raw payloads downloaded from the "
+                                           "device, so its punches can be replayed without downloading them "
+                                           "again. A payload identical to the previous one is not stored, "
+                                           "only the records added since the previous sync are kept from "
+                                           "the ZKTeco logs.")
+    archive_retention_days = fields.Integer(string='Archive Retention (Days)', default=90,
+                                            help="Days the archived payloads are kept, 0 keeps them forever")
+
+    def _log_archive(self):
+        self.ensure_one()
+        return LogArchive(os.path.join(config.filestore(self.env.cr.dbname), 'zk_archive', str(self.id)))
+
+    def _archive_payload(self, kind, payload):
+        """Append payload to the archive of the machine, a failure is only
+        logged and never stops the sync."""
+        try:
+            self._log_archive().append(kind, payload)
+        except OSError as e:
+            _logger.warning("Archiving the log of %s failed: %s", self.name, e)
+
+    def _archive_zk_log(self, data, records, users):
+        """Archive the records of a pyzk attendance buffer added since the
+        previous archived one, with what is needed to decode them again: the
+        uids of the users and the timezone and clock drift used by this
+        sync."""
+        if not self.archive_raw_logs:
+            return
+        try:
+            previous = self._log_archive().last(ZK_ATTLOG)
+        except (OSError, zlib.error) as e:
+            _logger.warning("Reading the archive of %s failed: %s", self.name, e)
+            previous = None
+        delta = zk_delta(data, records, unpack_zk(previous)[0] if previous else None)
+        if delta is None:
+            return
+        data, meta = delta
+        meta.update({
+            'users': {str(user.uid): str(user.user_id) for user in users},
+            'names': {str(user.user_id): user.name for user in users},
+            'tz': self.env.user.partner_id.tz or 'GMT',
+            'clock_drift': self.clock_drift,
+        })
+        self._archive_payload(ZK_ATTLOG, pack_zk(meta, data))
+
+    def _archive_hik_events(self, events):
+        if self.archive_raw_logs and events:
+            self._archive_payload(HIK_EVENTS, json.dumps(events).encode())
+
+    @api.autovacuum
+    def _gc_log_archives(self):
+        """Drop the archived payloads older than the retention of their machine"""
+        now = time.time()
+        for machine in self.search([('archive_retention_days', '>', 0)]):
+            try:
+                dropped = machine._log_archive().compact(now - machine.archive_retention_days * 86400)
+            except OSError as e:
+                _logger.warning("Compacting the archive of %s failed: %s", machine.name, e)
+                continue
+            if dropped:
+                _logger.info("Dropped %s archived payloads of %s", dropped, machine.name)
+
+    def action_replay_archive(self):
+        count = 0
+        for machine in self:
+            count += machine._replay_archive()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'type': 'success',
+                'message': _('%s punches replayed from the archive.', count),
+                'sticky': False,
+            },
+        }
+
+    def _replay_archive(self, since=None):
+        """Run the archived payloads of the machine through the ingestion,
+        oldest first. The punches already stored are skipped as during a
+        sync, nothing is read from the device.
+
+        since is an epoch, the payloads fetched before it are not replayed.
+        Returns the number of punches stored."""
+        self.ensure_one()
+        machine = self.with_context(zk_replay=True)
+        count = 0
+        for entry, payload in machine._log_archive().frames(since):
+            if entry.kind == ZK_ATTLOG:
+                meta, data = unpack_zk(payload)
+                users = {int(uid): user_id for uid, user_id in meta['users'].items()}
+                batch = PunchBatch.from_attlog(data, meta['records'], machine.id, users)
+                batch = machine._zk_localize(batch, meta['names'], meta['tz'], meta['clock_drift'])
+                count += machine._ingest_punches(batch, meta['names'])
+            elif entry.kind == HIK_EVENTS:
+                count += machine._hik_process_events(machine, json.loads(payload))
+        _logger.info("Replayed %s punches from the archive of %s", count, self.name)
+        return count
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+
+from odoo import api, fields, models
+from odoo.tools import split_every
+
+from .zkshift import PUNCH_OTHER, day_number, day_totals
+
+_logger = logging.getLogger(__name__)
+
+# Days recomputed by the daily cron, up to yesterday
+ATTENDANCE_DAY_LOOKBACK = 35
+# Days upserted per INSERT statement
+UPSERT_CHUNK_SIZE = 1000
+
+
+class ZkAttendanceDay(models.Model):
+    _name = 'zk.attendance.day'
+    _description = 'Biometric Attendance Day'
+    _order = 'date desc, employee_id'
+    _rec_name = 'date'
+
+    employee_id = fields.Many2one('hr.employee', string='Employee', required=True, ondelete='cascade',
+                                  index=True)
+    date = fields.Date(string='Date', required=True, index=True, help="Day in the timezone of the employee")
+    worked_hours = fields.Float(string='Worked Hours',
+                                help="Time between the check ins and check outs, breaks deducted")
+    break_hours = fields.Float(string='Break Hours', help="Time between the break outs and break ins")
+    overtime_hours = fields.Float(string='Overtime Hours',
+                                  help="Time between the overtime ins and overtime outs")
+    first_punch = fields.Datetime(string='First Punch')
+    last_punch = fields.Datetime(string='Last Punch')
+    punch_count = fields.Integer(string='Punches')
+    punch_signature = fields.Char(string='Punch Signature', readonly=True,
+                                  help="Digest of the punches the day was computed from")
+
+    _sql_constraints = [
+        ('employee_date_uniq', 'unique(employee_id, date)', 'An employee has one attendance day per date.'),
+    ]
+
+    def _punch_signatures(self, date_from, date_to, employee_ids=None):
+        """Returns a dict mapping the (employee_id, date) of the punches
+        between date_from and date_to (dates in the timezone of the
+        employees, included) to their (count, first, last, signature)."""
+        where = ["a.punching_time >= %s", "a.punching_time < %s"]
+        params = [date_from - datetime.timedelta(days=1), date_to + datetime.timedelta(days=2)]
+        if employee_ids:
+            where.append("a.employee_id IN %s")
+            params.append(tuple(employee_ids))
+        self.env['zk.machine.attendance'].flush_model(['employee_id', 'punching_time', 'punch_type'])
+        self.env.cr.execute("""
+            SELECT a.employee_id,
+                   (a.punching_time AT TIME ZONE 'UTC' AT TIME ZONE COALESCE(r.tz, 'UTC'))::date,
+                   count(*), min(a.punching_time), max(a.punching_time),
+                   md5(string_agg(EXTRACT(EPOCH FROM a.punching_time)::bigint || ':' || COALESCE(a.punch_type, ''),
+                                  ',' ORDER BY a.punching_time, a.id))
+              FROM zk_machine_attendance a
+              JOIN hr_employee e ON e.id = a.employee_id
+              JOIN resource_resource r ON r.id = e.resource_id
+             WHERE {}
+          GROUP BY 1, 2
+        """.format(' AND '.join(where)), params)
+        return {(employee_id, date): values for employee_id, date, *values in self.env.cr.fetchall()
+                if date_from <= date <= date_to}
+
+    def _fetch_punches(self, employee_ids, date_from, date_to):
+        """Returns the employees, epochs and punch types of the punches of
+        employee_ids around date_from and date_to, in one ordered query."""
+        self.env.cr.execute("""
+            SELECT employee_id, EXTRACT(EPOCH FROM punching_time)::bigint,
+                   CASE WHEN punch_type ~ '^[0-9]+$' THEN punch_type::int ELSE %s END
+              FROM zk_machine_attendance
+             WHERE employee_id IN %s AND punching_time >= %s AND punching_time < %s
+          ORDER BY employee_id, punching_time, id
+        """, [PUNCH_OTHER, tuple(employee_ids), date_from - datetime.timedelta(days=2),
+              date_to + datetime.timedelta(days=3)])
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return [], [], []
+        return [list(column) for column in zip(*rows)]
+
+    @api.model
+    def _compute_period(self, date_from, date_to, employee_ids=None):
+        """Compute the attendance days of the period, dates included.
+
+        Only the days whose punches changed since they were computed, and the
+        days before the changed or emptied ones, whose intervals may close on
+        them, are computed again. The days left without punches are deleted.
+        Returns the number of days written."""
+        signatures = self._punch_signatures(date_from, date_to, employee_ids)
+        domain = [('date', '>=', date_from), ('date', '<=', date_to)]
+        if employee_ids:
+            domain.append(('employee_id', 'in', list(employee_ids)))
+        stored = {(day['employee_id'][0], day['date']): day
+                  for day in self.search_read(domain, ['employee_id', 'date', 'punch_signature'])}
+        changed = {key for key, values in signatures.items()
+                   if key not in stored or stored[key]['punch_signature'] != values[3]}
+        emptied = {key for key in stored if key not in signatures}
+        # The day before a changed or emptied day may have an interval closing on it
+        changed |= {(employee_id, date - datetime.timedelta(days=1)) for employee_id, date in changed | emptied
+                    if (employee_id, date - datetime.timedelta(days=1)) in signatures}
+        removed = [stored[key]['id'] for key in emptied]
+        if removed:
+            self.browse(removed).unlink()
+        if not changed:
+            return 0
+        employees = {employee_id for employee_id, _date in changed}
+        first = min(date for _employee_id, date in changed)
+        last = max(date for _employee_id, date in changed)
+        timezones = {employee['id']: employee['tz'] for employee in self.env['hr.employee'].with_context(
+            active_test=False).search_read([('id', 'in', list(employees))], ['tz'])}
+        totals = day_totals(*self._fetch_punches(employees, first, last), timezones)
+        rows = []
+        for employee_id, date in changed:
+            count, first_punch, last_punch, signature = signatures[(employee_id, date)]
+            worked, breaks, overtime = totals.get((employee_id, day_number(date)), (0, 0, 0))
+            rows.append((employee_id, date, worked / 3600.0, breaks / 3600.0, overtime / 3600.0,
+                         first_punch, last_punch, count, signature))
+        self._upsert_days(rows)
+        _logger.info("Computed %s attendance days from %s to %s", len(rows), first, last)
+        return len(rows)
+
+    def _upsert_days(self, rows):
+        """Insert or update (employee_id, date, worked_hours, break_hours,
+        overtime_hours, first_punch, last_punch, punch_count,
+        punch_signature) rows with multi-row INSERT statements."""
+        query = """
+            INSERT INTO zk_attendance_day (employee_id, date, worked_hours, break_hours, overtime_hours,
+                                           first_punch, last_punch, punch_count, punch_signature,
+                                           create_uid, create_date, write_uid, write_date)
+            SELECT v.*, %s, now() AT TIME ZONE 'UTC', %s, now() AT TIME ZONE 'UTC'
+              FROM (VALUES {}) AS v(employee_id, date, worked_hours, break_hours, overtime_hours,
+                                    first_punch, last_punch, punch_count, punch_signature)
+                ON CONFLICT (employee_id, date) DO UPDATE
+               SET worked_hours = EXCLUDED.worked_hours,
+                   break_hours = EXCLUDED.break_hours,
+                   overtime_hours = EXCLUDED.overtime_hours,
+                   first_punch = EXCLUDED.first_punch,
+                   last_punch = EXCLUDED.last_punch,
+                   punch_count = EXCLUDED.punch_count,
+                   punch_signature = EXCLUDED.punch_signature,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """
+        params = [self.env.uid, self.env.uid]
+        for chunk in split_every(UPSERT_CHUNK_SIZE, rows, list):
+            self.env.cr.execute(query.format(', '.join(['%s'] * len(chunk))), params + chunk)
+        self.invalidate_model()
+
+    @api.model
+    def _cron_compute_days(self):
+        today = fields.Date.context_today(self)
+        self._compute_period(today - datetime.timedelta(days=ATTENDANCE_DAY_LOOKBACK),
+                             today - datetime.timedelta(days=1))
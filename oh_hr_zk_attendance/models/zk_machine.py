@@ -21,19 +21,32 @@
 #############################################################################
 import pytz
 import sys
+import time
+import calendar
 import datetime
 import logging
 import binascii
+import functools
+from collections import defaultdict
+from contextlib import contextmanager
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import requests
+import requests.adapters
 from requests.auth import HTTPBasicAuth
 
 from . import zklib
-from .zkconst import *
+from .zkconst import CMD_PREPARE_DATA
+from .zkprobe import probe_ports
+from .zkrecent import recent_keys
+from .zkpyzk import DeviceError, open_device, user_values
+from .zkbatch import PunchBatch, PUNCH_UNKNOWN, epoch_to_datetime, parse_iso_epoch
 from struct import unpack
 from odoo import api, fields, models
 from odoo import _
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import format_datetime, split_every
 
 _logger = logging.getLogger(__name__)
 try:
@@ -43,12 +56,146 @@ except ImportError:
 
 _logger = logging.getLogger(__name__)
 
+# AcsEvent results requested per page when the device profile has no limit.
+HIK_DEFAULT_PAGE_SIZE = 200
+# Punches per hour above which a machine is polled faster than its base interval.
+POLL_BUSY_RATE = 60.0
+# Weight of the latest poll in the punch rate moving average.
+POLL_RATE_ALPHA = 0.3
+# Seconds allowed to the fleet-wide reachability pre-check.
+PROBE_TIMEOUT = 2.0
+# Punches older than the last stored one by more than this are not new.
+ZK_WINDOW_OVERLAP = datetime.timedelta(days=1)
+# Punches further in the future than this (seconds) come from a wrong clock.
+ZK_FUTURE_TOLERANCE = 86400
+# Rows per INSERT statement when storing punches.
+INSERT_CHUNK_SIZE = 1000
+# Rows deleted per transaction when purging punches.
+PURGE_CHUNK_SIZE = 5000
+# Hikvision ranges longer than this are fetched in sub-windows (backfill).
+HIK_BACKFILL_SPAN = datetime.timedelta(days=1)
+# A backfill window matching more events than this is halved...
+HIK_WINDOW_MAX_MATCHES = 2000
+# ...unless it is already this short.
+HIK_WINDOW_MIN_SPAN = datetime.timedelta(minutes=15)
+# Keys of ingested Hikvision events remembered per machine.
+HIK_RECENT_KEYS_MAX = 50000
+
+
+class IsapiError(Exception):
+    """Failed ISAPI request. It is raised without the environment, from
+    any thread; status is the HTTP status, 'error' when the device could
+    not be reached or 'json' for an undecodable response."""
+
+    def __init__(self, status, detail=''):
+        super().__init__(status, detail)
+        self.status = status
+        self.detail = detail
+
+
+def isapi_post(session, url, payload, metrics, machine_id, journal=None):
+    """POST an ISAPI JSON request and returns the decoded response. The
+    environment is not used, the SyncMetrics metrics of machine_id and the
+    sync journal are updated, failures raise IsapiError."""
+    try:
+        resp = session.post(url, json=payload, timeout=20)
+    except Exception as e:
+        metrics.isapi_response(machine_id, 'error')
+        raise IsapiError('error', str(e))
+    metrics.isapi_response(machine_id, resp.status_code)
+    if journal:
+        journal.count('bytes', len(resp.content))
+    if resp.status_code >= 400:
+        raise IsapiError(resp.status_code, resp.text[:200])
+    try:
+        return resp.json()
+    except Exception:
+        raise IsapiError('json')
+
 
 class HrAttendance(models.Model):
     _inherit = 'hr.attendance'
 
     device_id = fields.Char(string='Biometric Device ID')
 
+    @contextmanager
+    def _zk_bulk_apply(self):
+        """Yields the model in a context where the worked hours, the
+        validity constraint and the overtime of the attendances created or
+        written are not computed per record. They are computed when the
+        block exits, once for all the attendances and employees touched in
+        it. Nested blocks are merged into the outer one."""
+        if self.env.context.get('zk_bulk_attendance') is not None:
+            yield self
+            return
+        pending = {'ids': set(), 'dates': defaultdict(set)}
+        yield self.with_context(zk_bulk_attendance=pending)
+        self.with_context(zk_bulk_attendance=None)._zk_apply_bulk(pending)
+
+    def _zk_apply_bulk(self, pending):
+        attendances = self.browse(pending['ids']).exists()
+        if attendances:
+            self.env.remove_to_compute(self._fields['worked_hours'], attendances)
+            self.flush_model(['employee_id', 'check_in', 'check_out'])
+            attendances._zk_check_validity_sql()
+            self.env.cr.execute("""
+                UPDATE hr_attendance
+                   SET worked_hours = COALESCE(EXTRACT(EPOCH FROM check_out - check_in) / 3600.0, 0)
+                 WHERE id IN %s
+            """, [tuple(attendances.ids)])
+            attendances.invalidate_recordset(['worked_hours'])
+        if pending['dates']:
+            self._update_overtime(pending['dates'])
+
+    def _zk_check_validity_sql(self):
+        """_check_validity of the attendances of self in one query: each is
+        compared to the previous and next attendances of its employee."""
+        self.env.cr.execute("""
+            SELECT a.employee_id, a.check_in, a.check_out IS NULL
+              FROM (SELECT id, employee_id, check_in, check_out,
+                           lag(check_out) OVER w AS previous_out,
+                           lead(check_in) OVER w AS next_in,
+                           count(*) FILTER (WHERE check_out IS NULL) OVER (PARTITION BY employee_id) AS open_count
+                      FROM hr_attendance
+                     WHERE employee_id IN (SELECT employee_id FROM hr_attendance WHERE id IN %s)
+                    WINDOW w AS (PARTITION BY employee_id ORDER BY check_in, id)) a
+             WHERE a.id IN %s
+               AND (a.previous_out > a.check_in
+                    OR a.check_out > a.next_in
+                    OR (a.check_out IS NULL AND a.open_count > 1))
+          ORDER BY a.check_in
+             LIMIT 1
+        """, [tuple(self.ids)] * 2)
+        row = self.env.cr.fetchone()
+        if not row:
+            return
+        employee_id, check_in, still_open = row
+        values = {
+            'empl_name': self.env['hr.employee'].browse(employee_id).name,
+            'datetime': format_datetime(self.env, check_in, dt_format=False),
+        }
+        if still_open:
+            raise ValidationError(_("Cannot create new attendance record for %(empl_name)s, the employee "
+                                    "hasn't checked out since %(datetime)s", **values))
+        raise ValidationError(_("Cannot create new attendance record for %(empl_name)s, the employee "
+                                "was already checked in on %(datetime)s", **values))
+
+    @api.constrains('check_in', 'check_out', 'employee_id')
+    def _check_validity(self):
+        pending = self.env.context.get('zk_bulk_attendance')
+        if pending is None:
+            return super()._check_validity()
+        pending['ids'].update(self.ids)
+
+    def _update_overtime(self, employee_attendance_dates=None):
+        pending = self.env.context.get('zk_bulk_attendance')
+        if pending is None:
+            return super()._update_overtime(employee_attendance_dates)
+        if employee_attendance_dates is None:
+            employee_attendance_dates = self._get_attendances_dates()
+        for employee, dates in employee_attendance_dates.items():
+            pending['dates'][employee] |= dates
+
 
 class ZkMachine(models.Model):
     _name = 'zk.machine'
@@ -65,7 +212,150 @@ class ZkMachine(models.Model):
     hik_username = fields.Char(string='Hikvision Username')
     hik_password = fields.Char(string='Hikvision Password')
     use_https = fields.Boolean(string='Use HTTPS', default=False)
+    hik_initial_days = fields.Integer(string='Initial History (days)', default=1,
+                                      help="Days of events downloaded by the first sync of the machine")
+    hik_overlap_minutes = fields.Integer(string='Fetch Overlap (min)', default=10,
+                                         help="Minutes of the previous window fetched again, to catch "
+                                              "the events stored late by the device")
+    hik_backfill_workers = fields.Integer(string='Backfill Concurrency', default=4,
+                                          help="Time windows fetched at once when downloading a long range")
+    hik_event_filter = fields.Char(string='Attendance Events', default='5:1,5:38,5:75',
+                                   help="Comma separated major:minor AcsEvent codes counted as attendance, "
+                                        "one search is sent to the device per code. A major alone (e.g. 5) "
+                                        "searches all its minors. Default: card, fingerprint and face "
+                                        "authentication passed, the machines existing before this option "
+                                        "keep an empty filter. Leave empty to search every event.")
     last_fetch_at = fields.Datetime(string='Last Fetch Time')
+    last_punch_at = fields.Datetime(string='Last Punch Time', readonly=True, copy=False,
+                                    help="Most recent punch stored from this machine")
+
+    poll_interval = fields.Integer(string='Polling Interval (min)', default=10,
+                                   help="Base interval between two downloads of this machine")
+    poll_min_interval = fields.Integer(string='Minimum Interval (min)', default=2,
+                                       help="Shortest interval used when the punch rate is high or during peak hours")
+    poll_max_interval = fields.Integer(string='Maximum Backoff (min)', default=240,
+                                       help="Longest interval used while the machine is unreachable")
+    poll_peak_hours = fields.Char(string='Peak Hours',
+                                  help="Comma separated local time ranges polled at the minimum interval, "
+                                       "e.g. 07:00-09:00,16:30-18:00")
+    next_poll_at = fields.Datetime(string='Next Poll', readonly=True, copy=False)
+    last_poll_at = fields.Datetime(string='Last Poll', readonly=True, copy=False)
+    poll_failures = fields.Integer(string='Consecutive Failures', readonly=True, copy=False)
+    punch_rate = fields.Float(string='Punch Rate (per hour)', readonly=True, copy=False,
+                              help="Moving average of the punches downloaded per hour")
+
+    breaker_state = fields.Selection([
+        ('closed', 'Closed'),
+        ('open', 'Open'),
+        ('half_open', 'Half-Open'),
+    ], string='Circuit Breaker', default='closed', required=True, readonly=True, copy=False,
+        help="Open: the machine is known to be down and is only probed on the probe interval.\n"
+             "Half-Open: a probe succeeded and the next poll decides whether the breaker closes.")
+    breaker_threshold = fields.Integer(string='Failures Before Opening', default=3,
+                                       help="Consecutive failed polls after which the circuit breaker opens")
+    breaker_probe_interval = fields.Integer(string='Probe Interval (min)', default=5,
+                                            help="Interval between two reachability probes while the breaker is open")
+    breaker_retry_at = fields.Datetime(string='Next Probe', readonly=True, copy=False)
+
+    device_user_ids = fields.One2many('zk.machine.user', 'machine_id', string='Device Users',
+                                      help="Users enrolled on the device, as read by the last sync")
+
+    rtt_srtt = fields.Float(string='Smoothed RTT (ms)', readonly=True, copy=False,
+                            help="Round trip time learned by the last ZKLib session")
+    rtt_var = fields.Float(string='RTT Variance (ms)', readonly=True, copy=False)
+
+    clock_drift = fields.Integer(string='Clock Drift (s)', readonly=True, copy=False,
+                                 help="Seconds the device clock is ahead of the server, as measured by the "
+                                      "last clock check. Subtracted from the punches at download.")
+    clock_checked_at = fields.Datetime(string='Clock Checked At', readonly=True, copy=False)
+    clock_drift_applied = fields.Integer(string='Applied Clock Drift (s)', readonly=True, copy=False,
+                                         help="Correction used by the last download")
+
+    @api.constrains('poll_interval', 'poll_min_interval', 'poll_max_interval')
+    def _check_poll_interval(self):
+        for machine in self:
+            if machine.poll_min_interval < 1 or machine.poll_interval < machine.poll_min_interval:
+                raise ValidationError(_("The polling interval must be at least the minimum interval (1 minute or more)."))
+            if machine.poll_max_interval < machine.poll_interval:
+                raise ValidationError(_("The maximum backoff must be at least the polling interval."))
+
+    @api.constrains('hik_event_filter')
+    def _check_hik_event_filter(self):
+        for machine in self:
+            try:
+                machine._hik_event_codes()
+            except ValueError:
+                raise ValidationError(_("Attendance events must look like 5:1,5:38,5:75."))
+
+    @api.constrains('poll_peak_hours')
+    def _check_poll_peak_hours(self):
+        for machine in self:
+            try:
+                machine._parse_peak_hours()
+            except ValueError:
+                raise ValidationError(_("Peak hours must look like 07:00-09:00,16:30-18:00."))
+
+    def _zk_params(self):
+        """Connection parameters of a pyzk session, as plain values that can
+        be handed to worker threads."""
+        self.ensure_one()
+        # Once the profile is known, the transport is not probed again and
+        # the reachability is left to the fleet pre-check.
+        return {'ip': self.name, 'port': self.port_no, 'timeout': 15,
+                'force_udp': self.zk_transport == 'udp', 'ommit_ping': bool(self.profile_refreshed_at)}
+
+    @api.model
+    def _zk_open(self, params):
+        """Open a pyzk connection from _zk_params() values, the worker
+        threads use zkpyzk.open_device instead."""
+        try:
+            return open_device(params)
+        except DeviceError as e:
+            raise UserError(self._zk_error_message(e))
+
+    @api.model
+    def _zk_error_message(self, error):
+        """Message of an exception raised by a zkpyzk session"""
+        if not isinstance(error, DeviceError):
+            return str(error)
+        if error.reason == 'pyzk':
+            return _("Pyzk module not Found. Please install it with 'pip3 install pyzk'.")
+        return _('Unable to connect, please check the parameters and network connections.')
+
+    @api.model
+    def _zk_user_values(self, user):
+        """Plain values of a pyzk User."""
+        return user_values(user)
+
+    def _enrolment_users(self):
+        """Returns the employees to enrol on the machine, as a dict mapping
+        their biometric device id to their name."""
+        self.ensure_one()
+        employees = self.env['hr.employee'].search_read([
+            ('device_id', '!=', False),
+            ('company_id', 'in', [self.company_id.id, False]),
+        ], ['device_id', 'name'])
+        return {employee['device_id']: employee['name'] for employee in employees}
+
+    def _update_device_users(self, users):
+        """Refresh the cached user table of the machine from the values of
+        _zk_user_values(), only the changed lines are written."""
+        self.ensure_one()
+        DeviceUser = self.env['zk.machine.user']
+        cached = {line.uid: line for line in self.device_user_ids}
+        employees = dict((emp['device_id'], emp['id']) for emp in self.env['hr.employee'].search_read(
+            [('device_id', 'in', [user['user_id'] for user in users])], ['device_id']))
+        to_create = []
+        for user in users:
+            vals = dict(user, employee_id=employees.get(user['user_id'], False))
+            line = cached.pop(user['uid'], None)
+            if line is None:
+                to_create.append(dict(vals, machine_id=self.id))
+            elif any(line[key] != value for key, value in vals.items() if key != 'employee_id') \
+                    or line.employee_id.id != vals['employee_id']:
+                line.write(vals)
+        DeviceUser.create(to_create)
+        DeviceUser.browse([line.id for line in cached.values()]).unlink()
 
     def device_connect(self, zk):
         try:
@@ -74,37 +364,120 @@ class ZkMachine(models.Model):
         except:
             return False
 
-    def clear_attendance(self):
-        for info in self:
-            if info.device_type == 'hik':
-                # Clearing attendance on Hikvision via ISAPI is not recommended
-                # and can vary by model/firmware. We avoid destructive operations.
-                raise UserError(_("مسح سجلات الحضور من أجهزة Hikvision غير مدعوم من الوحدة حفاظاً على السجلات."))
+    def _zklib(self):
+        """Returns a ZKLib client seeded with the round trip time learned by
+        the previous sessions of the machine."""
+        self.ensure_one()
+        return zklib.ZKLib(self.name, self.port_no,
+                           srtt=self.rtt_srtt / 1000.0 or None,
+                           rttvar=self.rtt_var / 1000.0 or None)
+
+    def _command_job(self, command):
+        """Plain values of a zkcommand.run_command job on the machine"""
+        self.ensure_one()
+        return {
+            'machine_id': self.id,
+            'command': command,
+            'ip': self.name,
+            'port': self.port_no,
+            'srtt': self.rtt_srtt / 1000.0 or None,
+            'rttvar': self.rtt_var / 1000.0 or None,
+            'tz': self.env.user.partner_id.tz or 'GMT',
+            'metrics': self.env['zk.sync.metric']._metrics(),
+        }
+
+    def _save_rtt(self, zk):
+        """Stores the round trip time estimated by the ZKLib session zk."""
+        self.ensure_one()
+        self.env['zk.sync.metric']._metrics().zklib_session(self.id, zk)
+        if zk.rtt.srtt is not None:
+            self.write({'rtt_srtt': zk.rtt.srtt * 1000.0,
+                        'rtt_var': zk.rtt.rttvar * 1000.0})
+
+    def test_connection(self):
+        self.ensure_one()
+        if self.device_type == 'hik':
+            url = f"{self._hik_base_url(self)}/ISAPI/System/deviceInfo"
+            auth = None
+            if self.hik_username and self.hik_password:
+                auth = HTTPBasicAuth(self.hik_username, self.hik_password)
             try:
-                machine_ip = info.name
-                zk_port = info.port_no
-                timeout = 30
-                try:
-                    zk = ZK(machine_ip, port=zk_port, timeout=timeout, password=0, force_udp=False, ommit_ping=False)
-                except NameError:
-                    raise UserError(_("Please install it with 'pip3 install pyzk'."))
-                conn = self.device_connect(zk)
-                if conn:
-                    conn.enable_device()
-                    clear_data = zk.get_attendance()
-                    if clear_data:
-                        # conn.clear_attendance()
-                        self._cr.execute("""delete from zk_machine_attendance""")
-                        conn.disconnect()
-                        raise UserError(_('Attendance Records Deleted.'))
-                    else:
-                        raise UserError(_('Unable to clear Attendance log. Are you sure attendance log is not empty.'))
-                else:
-                    raise UserError(
-                        _('Unable to connect to Attendance Device. Please use Test Connection button to verify.'))
+                resp = requests.get(url, auth=auth, timeout=20, verify=False)
+            except Exception as e:
+                raise UserError(_(f"تعذر الاتصال بجهاز Hikvision: {e}"))
+            if resp.status_code >= 400:
+                raise UserError(_(f"فشل طلب ISAPI ({resp.status_code}): {resp.text[:200]}"))
+        else:
+            zk = self._zklib()
+            try:
+                if not zk.connect():
+                    raise UserError(_('Unable to connect, please check the parameters and network connections.'))
+                zk.version()
+                zk.disconnect()
+            except UserError:
+                raise
             except Exception:
-                raise ValidationError(
-                    'Unable to clear Attendance log. Are you sure attendance device is connected & record is not empty.')
+                raise UserError(_('Unable to connect, please check the parameters and network connections.'))
+            finally:
+                zk.zkclient.close()
+                self._save_rtt(zk)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'type': 'success',
+                'message': _('Connection to %s succeeded.', self.name),
+                'sticky': False,
+            },
+        }
+
+    def clear_attendance(self):
+        """Open the purge of the punches stored from the machines, the devices
+        themselves are left untouched."""
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Purge Punches'),
+            'res_model': 'zk.purge.wizard',
+            'view_mode': 'form',
+            'target': 'new',
+            'context': {'active_model': self._name, 'active_ids': self.ids},
+        }
+
+    def _purge_punches(self, date_from=None, date_to=None, chunk_size=PURGE_CHUNK_SIZE):
+        """Delete the punches stored from the machine with date_from <=
+        punching_time < date_to, either bound may be omitted.
+
+        The rows are deleted chunk_size at a time, each chunk in its own
+        committed transaction, so the table is never locked for long and the
+        syncs of the other machines go on. Nothing is read from the device.
+        Returns the number of punches deleted."""
+        self.ensure_one()
+        # A device user id is not unique across the machines, only the
+        # punches known to come from this machine are deleted.
+        where = ["machine_id = %s"]
+        params = [self.id]
+        if date_from:
+            where.append("punching_time >= %s")
+            params.append(date_from)
+        if date_to:
+            where.append("punching_time < %s")
+            params.append(date_to)
+        query = """
+            DELETE FROM zk_machine_attendance
+             WHERE (id, punching_time) IN (SELECT id, punching_time FROM zk_machine_attendance
+                                            WHERE {} LIMIT %s)
+        """.format(' AND '.join(where))
+        deleted = 0
+        while True:
+            with self.env.registry.cursor() as cr:
+                cr.execute(query, params + [chunk_size])
+                count = cr.rowcount
+            deleted += count
+            if count < chunk_size:
+                break
+        self.env['zk.machine.attendance'].invalidate_model()
+        _logger.info("Purged %s punches of machine %s", deleted, self.name)
+        return deleted
 
     def getSizeUser(self, zk):
         """Checks a returned packet to see if it returned CMD_PREPARE_DATA,
@@ -128,21 +501,267 @@ class ZkMachine(models.Model):
 
     @api.model
     def cron_download(self):
-        machines = self.env['zk.machine'].search([])
+        """Poll the machines whose next poll time is due.
+
+        Machines with an open circuit breaker are only considered once their
+        probe time is reached. All the selected machines are probed together
+        first, so unreachable devices never cost a full connection timeout."""
+        now = fields.Datetime.now()
+        machines = self.env['zk.machine'].search([
+            '|',
+            '&', ('breaker_state', '!=', 'open'),
+            '|', ('next_poll_at', '=', False), ('next_poll_at', '<=', now),
+            '&', ('breaker_state', '=', 'open'),
+            '|', ('breaker_retry_at', '=', False), ('breaker_retry_at', '<=', now),
+        ])
+        reachable = machines._precheck()
         for machine in machines:
-            machine.download_attendance()
+            if not reachable[machine.id]:
+                machine._record_unreachable()
+                continue
+            if machine.breaker_state == 'open':
+                machine.breaker_state = 'half_open'
+            machine._poll()
+
+    def _precheck(self):
+        """Probe the port of every machine in self at once.
+
+        Returns a dict mapping machine ids to their reachability."""
+        # UDP devices do not accept connections, they are left to the poll.
+        # So are the ZK devices whose transport is not known yet: a UDP-only
+        # one would fail the probe forever and never get its profile read.
+        unprobed = self.filtered(lambda machine: machine.device_type == 'zk' and machine.zk_transport != 'tcp')
+        addresses = {machine.id: (machine.name, machine.port_no) for machine in self - unprobed}
+        status = probe_ports(set(addresses.values()), timeout=PROBE_TIMEOUT)
+        result = {machine_id: status[address] for machine_id, address in addresses.items()}
+        result.update(dict.fromkeys(unprobed.ids, True))
+        return result
+
+    def _record_unreachable(self):
+        self.ensure_one()
+        _logger.info("Machine %s:%s is unreachable, skipping it", self.name, self.port_no)
+        if self.breaker_state == 'open':
+            self.breaker_retry_at = fields.Datetime.now() + datetime.timedelta(
+                minutes=self.breaker_probe_interval)
+        else:
+            self._schedule_next_poll(False)
+
+    def _poll(self):
+        """Download one machine and schedule its next poll from the outcome."""
+        self.ensure_one()
+        recent = []
+        try:
+            with self.env.cr.savepoint():
+                count = self.with_context(zk_recent_pending=recent)._download_machine()
+        except Exception as e:
+            _logger.warning("Polling machine %s failed: %s", self.name, e)
+            # The device may have changed, read its profile again
+            self.profile_refreshed_at = False
+            self._schedule_next_poll(False)
+        else:
+            # The savepoint is released, the ingested keys are remembered
+            # once the transaction commits.
+            for keys, items in recent:
+                self.env.cr.postcommit.add(functools.partial(keys.add, items))
+            self._schedule_next_poll(count)
+
+    def _parse_peak_hours(self):
+        """Returns the peak hours as a list of (start, end) minutes of the day."""
+        ranges = []
+        for part in (self.poll_peak_hours or '').split(','):
+            if not part.strip():
+                continue
+            start, end = part.split('-')
+            bounds = []
+            for value in (start, end):
+                hour, _sep, minute = value.strip().partition(':')
+                hour, minute = int(hour), int(minute or 0)
+                if not (0 <= hour <= 24 and 0 <= minute < 60):
+                    raise ValueError(value)
+                bounds.append(hour * 60 + minute)
+            ranges.append(tuple(bounds))
+        return ranges
+
+    def _in_peak_hours(self, now):
+        ranges = self._parse_peak_hours()
+        if not ranges:
+            return False
+        local_tz = pytz.timezone(self.env.user.partner_id.tz or 'GMT')
+        local_now = pytz.utc.localize(now).astimezone(local_tz)
+        minute = local_now.hour * 60 + local_now.minute
+        for start, end in ranges:
+            if start <= end and start <= minute < end:
+                return True
+            if start > end and (minute >= start or minute < end):
+                return True
+        return False
+
+    def _schedule_next_poll(self, count):
+        """Compute the next poll time of the machine.
+
+        count is the number of punches downloaded by the last poll, or False
+        when the machine could not be polled. Unreachable machines back off
+        exponentially up to poll_max_interval, busy machines are polled faster
+        than poll_interval down to poll_min_interval."""
+        self.ensure_one()
+        now = fields.Datetime.now()
+        vals = {'last_poll_at': now}
+        if count is False:
+            failures = self.poll_failures + 1
+            interval = min(self.poll_max_interval, self.poll_interval * 2 ** min(failures, 16))
+            vals['poll_failures'] = failures
+            if self.breaker_state == 'half_open' or failures >= self.breaker_threshold:
+                vals.update(breaker_state='open', breaker_retry_at=now + datetime.timedelta(
+                    minutes=self.breaker_probe_interval))
+        else:
+            elapsed = (now - self.last_poll_at).total_seconds() if self.last_poll_at else 0
+            hours = max(elapsed, self.poll_interval * 60) / 3600.0
+            rate = POLL_RATE_ALPHA * (count / hours) + (1 - POLL_RATE_ALPHA) * self.punch_rate
+            interval = self.poll_interval
+            if rate > POLL_BUSY_RATE:
+                interval = self.poll_interval * POLL_BUSY_RATE / rate
+            if self._in_peak_hours(now):
+                interval = self.poll_min_interval
+            interval = max(self.poll_min_interval, interval)
+            vals.update(poll_failures=0, punch_rate=rate, breaker_state='closed', breaker_retry_at=False)
+        vals['next_poll_at'] = now + datetime.timedelta(minutes=interval)
+        self.write(vals)
 
     def _hik_base_url(self, info):
         scheme = 'https' if info.use_https else 'http'
         return f"{scheme}://{info.name}:{info.port_no}"
 
-    def _hik_fetch_events(self, info, start_dt, end_dt, max_results=200):
+    def _hik_session(self, info):
+        """Returns a requests session authenticated on the device, reused by
+        all the ISAPI requests of a sync."""
+        session = requests.Session()
+        session.verify = False
+        if info.hik_username and info.hik_password:
+            session.auth = HTTPBasicAuth(info.hik_username, info.hik_password)
+        return session
+
+    def _hik_post(self, session, url, payload):
+        """POST an ISAPI JSON request, returns the decoded response or raises
+        UserError"""
+        try:
+            return isapi_post(session, url, payload, self.env['zk.sync.metric']._metrics(), self.id,
+                              self.env.context.get('zk_journal'))
+        except IsapiError as e:
+            raise UserError(self._hik_error_message(e))
+
+    @api.model
+    def _hik_error_message(self, error):
+        """Message of the UserError of an IsapiError"""
+        if error.status == 'error':
+            return _(f"تعذر الاتصال بجهاز Hikvision: {error.detail}")
+        if error.status == 'json':
+            return _("استجابة غير صالحة من جهاز Hikvision (JSON).")
+        if error.status == 401:
+            return _("بيانات الدخول إلى جهاز Hikvision غير صحيحة (401).")
+        return _(f"فشل طلب ISAPI ({error.status}): {error.detail}")
+
+    def _hik_event_codes(self):
+        """Returns the (major, minor) pairs of the event filter profile, minor
+        is 0 for a whole major group. An empty profile searches every event."""
+        self.ensure_one()
+        codes = []
+        for part in (self.hik_event_filter or '').split(','):
+            if not part.strip():
+                continue
+            major, _sep, minor = part.partition(':')
+            codes.append((int(major), int(minor or 0)))
+        return codes or [(0, None)]
+
+    def _hik_fetch_events(self, info, start_dt, end_dt, max_results=200, session=None):
         """Fetch events from Hikvision device via ISAPI.
         start_dt, end_dt: aware/naive datetimes (assumed UTC if naive)
+        One search is issued per code of the machine event filter, the
+        results are merged in time order. Ranges longer than
+        HIK_BACKFILL_SPAN are fetched in backfill mode.
         Returns list of event dicts or raises UserError
         """
-        base = self._hik_base_url(info)
-        url = f"{base}/ISAPI/AccessControl/AcsEvent?format=json"
+        session = session or self._hik_session(info)
+        url = f"{self._hik_base_url(info)}/ISAPI/AccessControl/AcsEvent?format=json"
+        codes = info._hik_event_codes()
+        if not isinstance(start_dt, str) and not isinstance(end_dt, str) \
+                and end_dt - start_dt > HIK_BACKFILL_SPAN:
+            return self._hik_backfill_events(info, session, url, codes, start_dt, end_dt, max_results)
+        events = []
+        for major, minor in codes:
+            search_id = f"odoo-{info.id}-{major}-{minor or 0}"
+            events.extend(self._hik_search_events(session, url, search_id, start_dt, end_dt,
+                                                  major, minor, max_results)[0])
+        return self._hik_merge_events(events)
+
+    def _hik_backfill_events(self, info, session, url, codes, start_dt, end_dt, max_results=200):
+        """Fetch a long range of events in sub-windows, concurrently.
+
+        The range is cut in HIK_BACKFILL_SPAN windows. A window whose search
+        matches more than HIK_WINDOW_MAX_MATCHES events is halved, down to
+        HIK_WINDOW_MIN_SPAN. At most hik_backfill_workers windows are fetched
+        at once, over the connection pool of session. The worker threads only
+        do HTTP requests, they never use the environment: they get the
+        SyncMetrics of the transaction, the machine id and the sync journal,
+        none of them bound to the environment, and raise IsapiError, turned into a UserError here.
+        """
+        workers = max(1, info.hik_backfill_workers)
+        machine_id = info.id
+        post = functools.partial(isapi_post, session, url, metrics=self.env['zk.sync.metric']._metrics(),
+                                 machine_id=machine_id, journal=self.env.context.get('zk_journal'))
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        def fetch(window):
+            start, end, major, minor = window
+            search_id = f"odoo-{machine_id}-{major}-{minor or 0}-{int(start.timestamp())}"
+            max_matches = HIK_WINDOW_MAX_MATCHES if end - start > HIK_WINDOW_MIN_SPAN else None
+            events, _total = self._hik_search_events(session, url, search_id, start, end,
+                                                     major, minor, max_results, max_matches, post=post)
+            if events is None:
+                middle = start + (end - start) / 2
+                return None, [(start, middle, major, minor), (middle, end, major, minor)]
+            return events, None
+
+        windows = []
+        for major, minor in codes:
+            start = start_dt
+            while start < end_dt:
+                end = min(start + HIK_BACKFILL_SPAN, end_dt)
+                windows.append((start, end, major, minor))
+                start = end
+        events = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {executor.submit(fetch, window) for window in windows}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        found, split = future.result()
+                    except IsapiError as e:
+                        for other in pending:
+                            other.cancel()
+                        raise UserError(self._hik_error_message(e))
+                    if split:
+                        pending |= {executor.submit(fetch, window) for window in split}
+                    else:
+                        events.extend(found)
+        _logger.info("HIK: backfilled %s events from %s to %s", len(events), start_dt, end_dt)
+        return self._hik_merge_events(events)
+
+    @api.model
+    def _hik_search_events(self, session, url, search_id, start_dt, end_dt, major, minor=None,
+                           max_results=200, max_matches=None, post=None):
+        """Run one AcsEvent search, following its result pages.
+
+        post sends the search payload and returns the decoded response, by
+        default _hik_post. The backfill threads pass isapi_post bound to plain
+        values, nothing else of the search uses the environment.
+
+        When max_matches is given and the search matches more events, the
+        pages are not fetched and None is returned instead of the events.
+        Returns the list of event dicts and the total number of matches
+        reported by the device."""
         # Format times ISO8601 with timezone +00:00
         def to_iso(dt):
             if isinstance(dt, str):
@@ -150,234 +769,402 @@ class ZkMachine(models.Model):
             if dt.tzinfo is None:
                 dt = dt.replace(tzinfo=pytz.UTC)
             return dt.isoformat()
-        payload = {
-            "AcsEventCond": {
-                "searchID": "odoo-1",
-                "searchResultPosition": 0,
-                "maxResults": max_results,
-                "major": 0,
-                # Leave minor unspecified to include all; some firmwares reject arrays.
-                "startTime": to_iso(start_dt),
-                "endTime": to_iso(end_dt)
-            }
+        cond = {
+            "searchID": search_id,
+            "searchResultPosition": 0,
+            "maxResults": max_results,
+            "major": major,
+            "startTime": to_iso(start_dt),
+            "endTime": to_iso(end_dt)
         }
-        auth = None
-        if info.hik_username and info.hik_password:
-            auth = HTTPBasicAuth(info.hik_username, info.hik_password)
-        try:
-            resp = requests.post(url, json=payload, auth=auth, timeout=20, verify=False)
-        except Exception as e:
-            raise UserError(_(f"تعذر الاتصال بجهاز Hikvision: {e}"))
-        if resp.status_code == 401:
-            raise UserError(_("بيانات الدخول إلى جهاز Hikvision غير صحيحة (401)."))
-        if resp.status_code >= 400:
-            raise UserError(_(f"فشل طلب ISAPI ({resp.status_code}): {resp.text[:200]}"))
-        try:
-            data = resp.json()
-        except Exception:
-            raise UserError(_("استجابة غير صالحة من جهاز Hikvision (JSON)."))
-        # Normalize to list
+        if minor is not None:
+            # Some firmwares reject arrays, a single minor is always accepted.
+            cond["minor"] = minor
+        post = post or functools.partial(self._hik_post, session, url)
+        events = []
+        total = 0
+        while True:
+            data = post({"AcsEventCond": cond})
+            page, status, total = self._hik_parse_events(data)
+            if max_matches and not cond["searchResultPosition"] and total > max_matches:
+                return None, total
+            events.extend(page)
+            cond["searchResultPosition"] += len(page)
+            if status != 'MORE' or not page:
+                break
+        return events, total or len(events)
+
+    @api.model
+    def _hik_parse_events(self, data):
+        """Normalize an AcsEvent response.
+
+        Returns the list of event dicts, the responseStatusStrg ('OK', 'MORE'
+        or 'NO MATCH') and the totalMatches of the search."""
         events = []
+        status = 'OK'
+        total = 0
         if isinstance(data, dict):
-            # Common keys: 'AcsEvent', 'AcsEventArray', or 'Event'
-            for key in ('AcsEvent', 'AcsEventArray', 'Event'):
-                if key in data and isinstance(data[key], list):
-                    events = data[key]
-                    break
-            if not events and 'AcsEvent' in data and isinstance(data['AcsEvent'], dict):
-                events = [data['AcsEvent']]
+            acs = data.get('AcsEvent')
+            if isinstance(acs, dict) and 'InfoList' in acs:
+                events = acs.get('InfoList') or []
+                status = acs.get('responseStatusStrg') or 'OK'
+                total = acs.get('totalMatches') or 0
+            else:
+                # Common keys: 'AcsEvent', 'AcsEventArray', or 'Event'
+                for key in ('AcsEvent', 'AcsEventArray', 'Event'):
+                    if key in data and isinstance(data[key], list):
+                        events = data[key]
+                        break
+                if not events and isinstance(acs, dict):
+                    events = [acs]
         elif isinstance(data, list):
             events = data
-        return events
-
-    def _hik_process_events(self, info, events):
-        zk_attendance = self.env['zk.machine.attendance']
-        att_obj = self.env['hr.attendance']
+        return events, status, total
 
-        def parse_time(ts):
-            # Expect formats like '2023-08-22T12:34:56+08:00' or '2023-08-22T12:34:56Z'
-            try:
-                ts2 = ts.replace('Z', '+00:00')
-                dt_obj = datetime.datetime.fromisoformat(ts2)
-            except Exception:
-                try:
-                    dt_obj = datetime.datetime.strptime(ts[:19], '%Y-%m-%dT%H:%M:%S')
-                except Exception:
-                    _logger.warning("HIK: Unable to parse time %s", ts)
-                    return None
-            # Convert to UTC then to string Odoo format
-            if dt_obj.tzinfo is None:
-                dt_obj = dt_obj.replace(tzinfo=pytz.UTC)
-            utc_dt = dt_obj.astimezone(pytz.UTC)
-            return fields.Datetime.to_string(utc_dt)
+    @api.model
+    def _hik_event_key(self, ev):
+        """Identity of an event: its serialNo, or its employee and time."""
+        return ev.get('serialNo') or (ev.get('employeeNoString') or ev.get('employeeNo') or ev.get('cardNo'),
+                                      ev.get('time'))
 
+    @api.model
+    def _hik_merge_events(self, events):
+        """Merge the results of several searches: drop the events returned
+        twice and sort them by time."""
+        merged = {}
         for ev in events:
-            ts = ev.get('time') or ev.get('Time') or ev.get('timeStr') or ev.get('eventTime')
-            if not ts:
-                continue
-            atten_time = parse_time(ts)
-            if not atten_time:
-                continue
-            # Identify employee by employeeNoString or cardNo
-            dev_id = ev.get('employeeNoString') or ev.get('employeeNo') or ev.get('cardNo') or ev.get('cardNumber')
-            if dev_id is None:
-                # Some events may carry personId
-                dev_id = ev.get('personId') or ev.get('userId')
-            if dev_id is None:
-                continue
-            dev_id = str(dev_id)
+            merged.setdefault(self._hik_event_key(ev), ev)
+        return sorted(merged.values(), key=lambda ev: parse_iso_epoch(ev.get('time') or '') or 0)
 
-            # Determine attendance_type
-            minor = ev.get('minor')
-            attendance_type = '4'  # default Card
-            try:
-                minor_int = int(minor) if minor is not None else None
-                if minor_int in (75, 76, 77, 78):  # face related (approx)
-                    attendance_type = '15'
-            except Exception:
-                pass
-
-            # Upsert attendance line and hr.attendance check-in/out heuristic
-            get_user_id = self.env['hr.employee'].search([('device_id', '=', dev_id)], limit=1)
-            if not get_user_id:
-                # Optionally create employee placeholder with name from event
-                emp_name = ev.get('name') or f"Device User {dev_id}"
-                get_user_id = self.env['hr.employee'].create({'device_id': dev_id, 'name': emp_name})
-                # Create a check-in record directly
-                att_obj.create({'employee_id': get_user_id.id, 'check_in': atten_time})
-
-            # Skip duplicate
-            duplicate = zk_attendance.search([
-                ('device_id', '=', dev_id),
-                ('punching_time', '=', atten_time)
-            ], limit=1)
-            if duplicate:
-                continue
+    def _hik_process_events(self, info, events):
+        """Store the punches of Hikvision AcsEvent dicts.
 
-            # Heuristic punch type: open check-in without checkout -> checkout, else check-in
-            att_open = att_obj.search([('employee_id', '=', get_user_id.id), ('check_out', '=', False)], limit=1)
-            punch_type = '1' if att_open else '0'
-
-            zk_attendance.create({
-                'employee_id': get_user_id.id,
-                'device_id': dev_id,
-                'attendance_type': attendance_type,
-                'punch_type': punch_type,
-                'punching_time': atten_time,
-                'address_id': info.address_id.id
-            })
-
-            if punch_type == '0':
-                if not att_open:
-                    att_obj.create({'employee_id': get_user_id.id, 'check_in': atten_time})
-            else:
-                if att_open:
-                    att_open.write({'check_out': atten_time})
-                else:
-                    # if no open, attach to last attendance
-                    last_att = att_obj.search([('employee_id', '=', get_user_id.id)], order='check_in desc', limit=1)
-                    if last_att:
-                        last_att.write({'check_out': atten_time})
+        Returns the number of new punches."""
+        with info._sync_stage('decode'):
+            batch, names = PunchBatch.from_hik_events(events, info.id, info._hik_card_owners())
+        known = {line.user_id for line in info.device_user_ids}
+        # A replay of the archive reads nothing from the device
+        if not self.env.context.get('zk_replay') and any(
+                user_id not in known for user_id in batch.present_user_ids()):
+            # Persons enrolled since the last sync: read them before ingesting
+            # so the punches resolve to named employees.
+            try:
+                with info._sync_stage('fetch'):
+                    synced = info._hik_sync_users()
+                if synced:
+                    with info._sync_stage('decode'):
+                        batch, names = PunchBatch.from_hik_events(events, info.id, info._hik_card_owners())
+            except UserError as e:
+                _logger.warning("HIK: person sync of %s failed: %s", info.name, e)
+        return info._ingest_punches(batch, names)
 
     def download_attendance(self):
         _logger.info("++++++++++++Cron Executed++++++++++++++++++++++")
-        zk_attendance = self.env['zk.machine.attendance']
-        att_obj = self.env['hr.attendance']
         for info in self:
-            if info.device_type == 'hik':
-                start_dt = info.last_fetch_at or (fields.Datetime.now() and (fields.Datetime.from_string(fields.Datetime.now()) - datetime.timedelta(days=1)))
-                end_dt = fields.Datetime.now()
-                try:
-                    events = self._hik_fetch_events(info, start_dt, end_dt)
-                except UserError as e:
-                    raise e
-                except Exception as e:
-                    raise UserError(_(f"حدث خطأ أثناء جلب سجلات Hikvision: {e}"))
-                if not events:
-                    raise UserError(_("لا توجد سجلات حضور جديدة على جهاز Hikvision."))
-                self._hik_process_events(info, events)
-                info.last_fetch_at = end_dt
-                return True
+            if not info._download_machine() and info.device_type == 'hik':
+                raise UserError(_("لا توجد سجلات حضور جديدة على جهاز Hikvision."))
+        return True
 
-            # Default: ZKTeco path (existing)
-            machine_ip = info.name
-            zk_port = info.port_no
-            timeout = 15
+    def _download_machine(self):
+        """Download the logs of a single machine, the run is recorded in the
+        sync journal.
+
+        Returns the number of punches fetched from the device."""
+        return self._journaled(lambda info: info._download_device())
+
+    def _download_device(self):
+        self.ensure_one()
+        with self._sync_stage('connect'):
+            self._ensure_profile()
+        if self.device_type == 'hik':
+            return self._download_hik()
+        return self._download_zk()
+
+    def _download_hik(self):
+        info = self
+        start_dt = info.last_fetch_at or (fields.Datetime.now() and (fields.Datetime.from_string(fields.Datetime.now()) - datetime.timedelta(days=info.hik_initial_days or 1)))
+        if info.last_fetch_at:
+            # Re-fetch the end of the previous window to catch the events
+            # stored late by the device (clock skew, offline buffering).
+            start_dt -= datetime.timedelta(minutes=info.hik_overlap_minutes)
+        end_dt = fields.Datetime.now()
+        if not info.hik_users_synced_at or end_dt - info.hik_users_synced_at > datetime.timedelta(
+                hours=info.hik_user_resync_hours):
             try:
-                zk = ZK(machine_ip, port=zk_port, timeout=timeout, password=0, force_udp=False, ommit_ping=False)
-            except NameError:
-                raise UserError(_("Pyzk module not Found. Please install it with 'pip3 install pyzk'."))
-            conn = self.device_connect(zk)
-            if conn:
-                # conn.disable_device() #Device Cannot be used during this time.
-                try:
-                    user = conn.get_users()
-                except Exception:
-                    user = False
-                try:
-                    attendance = conn.get_attendance()
-                except Exception:
-                    attendance = False
-                if attendance:
-                    for each in attendance:
-                        atten_time = each.timestamp
-                        atten_time = datetime.datetime.strptime(atten_time.strftime('%Y-%m-%d %H:%M:%S'), '%Y-%m-%d %H:%M:%S')
-                        local_tz = pytz.timezone(
-                            self.env.user.partner_id.tz or 'GMT')
-                        local_dt = local_tz.localize(atten_time, is_dst=None)
-                        utc_dt = local_dt.astimezone(pytz.utc)
-                        utc_dt = utc_dt.strftime("%Y-%m-%d %H:%M:%S")
-                        atten_time = datetime.datetime.strptime(
-                            utc_dt, "%Y-%m-%d %H:%M:%S")
-                        atten_time = fields.Datetime.to_string(atten_time)
-                        if user:
-                            for uid in user:
-                                if uid.user_id == each.user_id:
-                                    get_user_id = self.env['hr.employee'].search(
-                                        [('device_id', '=', each.user_id)])
-                                    if get_user_id:
-                                        duplicate_atten_ids = zk_attendance.search(
-                                            [('device_id', '=', each.user_id), ('punching_time', '=', atten_time)])
-                                        if duplicate_atten_ids:
-                                            continue
-                                        else:
-                                            zk_attendance.create({'employee_id': get_user_id.id,
-                                                                  'device_id': each.user_id,
-                                                                  'attendance_type': str(each.status),
-                                                                  'punch_type': str(each.punch),
-                                                                  'punching_time': atten_time,
-                                                                  'address_id': info.address_id.id})
-                                            att_var = att_obj.search([('employee_id', '=', get_user_id.id),
-                                                                      ('check_out', '=', False)])
-                                            if each.punch == 0:  # check-in
-                                                if not att_var:
-                                                    att_obj.create({'employee_id': get_user_id.id,
-                                                                    'check_in': atten_time})
-                                            if each.punch == 1:  # check-out
-                                                if len(att_var) == 1:
-                                                    att_var.write({'check_out': atten_time})
-                                                else:
-                                                    att_var1 = att_obj.search([('employee_id', '=', get_user_id.id)])
-                                                    if att_var1:
-                                                        att_var1[-1].write({'check_out': atten_time})
-
-                                    else:
-                                        employee = self.env['hr.employee'].create(
-                                            {'device_id': each.user_id, 'name': uid.name})
-                                        zk_attendance.create({'employee_id': employee.id,
-                                                              'device_id': each.user_id,
-                                                              'attendance_type': str(each.status),
-                                                              'punch_type': str(each.punch),
-                                                              'punching_time': atten_time,
-                                                              'address_id': info.address_id.id})
-                                        att_obj.create({'employee_id': employee.id,
-                                                        'check_in': atten_time})
-                                else:
-                                    pass
-                    # zk.enableDevice()
-                    conn.disconnect
-                    return True
-                else:
-                    raise UserError(_('Unable to get the attendance log, please try again later.'))
+                with info._sync_stage('fetch'):
+                    info._hik_sync_users()
+            except UserError as e:
+                _logger.warning("HIK: person sync of %s failed: %s", info.name, e)
+        try:
+            with info._sync_stage('fetch'):
+                events = self._hik_fetch_events(info, start_dt, end_dt,
+                                                max_results=info.hik_event_page_size or HIK_DEFAULT_PAGE_SIZE)
+        except UserError as e:
+            raise e
+        except Exception as e:
+            raise UserError(_(f"حدث خطأ أثناء جلب سجلات Hikvision: {e}"))
+        info._sync_count('records', len(events))
+        # Drop the events already ingested from the overlap before they
+        # reach the ORM.
+        recent = recent_keys(self.env.cr.dbname, info.id, HIK_RECENT_KEYS_MAX)
+        recent.evict(calendar.timegm(start_dt.timetuple()))
+        fresh = []
+        for ev in events:
+            key = self._hik_event_key(ev)
+            if key not in recent:
+                fresh.append((key, ev))
+        info._sync_count('duplicates', len(events) - len(fresh))
+        # The events of the overlap already ingested were archived with them
+        info._archive_hik_events([ev for key, ev in fresh])
+        count = self._hik_process_events(info, [ev for key, ev in fresh]) if fresh else 0
+        info.last_fetch_at = end_dt
+        # Only remember the keys once they are committed, a rolled back sync
+        # must fetch them again. Within a poll, they are left to _poll which
+        # knows whether its savepoint was rolled back.
+        items = [(key, parse_iso_epoch(ev.get('time') or '') or 0) for key, ev in fresh]
+        pending = self.env.context.get('zk_recent_pending')
+        if pending is not None:
+            pending.append((recent, items))
+        else:
+            self.env.cr.postcommit.add(functools.partial(recent.add, items))
+        return count
+
+    def _download_zk(self):
+        info = self
+        with info._sync_stage('connect'):
+            conn = self._zk_open(info._zk_params())
+        # conn.disable_device() #Device Cannot be used during this time.
+        try:
+            with info._sync_stage('fetch'):
+                users = conn.get_users()
+        except Exception:
+            users = False
+        if users is not False:
+            with info._sync_stage('resolve'):
+                info._update_device_users([self._zk_user_values(uid) for uid in users])
+        try:
+            batch = self._zk_fetch_punches(conn, users or [])
+        except Exception:
+            batch = False
+        # zk.enableDevice()
+        conn.disconnect()
+        if batch is False:
+            raise UserError(_('Unable to get the attendance log, please try again later.'))
+        info._sync_count('records', len(batch))
+        with info._sync_stage('decode'):
+            names = {uid.user_id: uid.name for uid in users or []}
+            batch = info._zk_localize(batch, names, self.env.user.partner_id.tz or 'GMT', info.clock_drift)
+            # The device returns its whole log, only the punches around or after
+            # the last stored one can be new.
+            start = None
+            last_punch_at = info.last_punch_at or info._punch_watermark()
+            if last_punch_at:
+                start = calendar.timegm((last_punch_at - ZK_WINDOW_OVERLAP).timetuple())
+            batch = batch.window(start, time.time() + ZK_FUTURE_TOLERANCE)
+        # The punches of the overlap were stored with the previous correction
+        count = info._ingest_punches(batch, names, tolerance=abs(info.clock_drift - info.clock_drift_applied))
+        if info.clock_drift_applied != info.clock_drift:
+            info.clock_drift_applied = info.clock_drift
+        return count
+
+    def _zk_fetch_punches(self, conn, users):
+        """Read the attendance log of a pyzk connection as a PunchBatch,
+        decoding the raw buffer instead of building Attendance objects."""
+        with self._sync_stage('fetch'):
+            conn.read_sizes()
+            if not conn.records:
+                return PunchBatch()
+            data, size = conn.read_with_buffer(const.CMD_ATTLOG_RRQ)
+        self._sync_count('bytes', size)
+        self._archive_zk_log(data[:size], conn.records, users)
+        with self._sync_stage('decode'):
+            return PunchBatch.from_attlog(data[:size], conn.records, self.id,
+                                          {uid.uid: uid.user_id for uid in users})
+
+    def _zk_localize(self, batch, names, tz, clock_drift):
+        """Returns the punches of batch made by the users in names, with
+        their epochs converted from the device local time in the timezone
+        tz to UTC and corrected by clock_drift seconds."""
+        # Only the punches of the users enrolled on the device are stored
+        batch = batch.select_users(names)
+        batch.shift_to_utc(pytz.timezone(tz))
+        batch.shift(-clock_drift)
+        return batch
+
+    def _ingest_punches(self, batch, names, tolerance=0):
+        """Store the new punches of batch and pair them into hr.attendance.
+
+        The epochs of batch must be in UTC. names maps the device user ids to
+        the name of the employees created for unknown users. A punch is
+        already stored when a stored punch of its user lies within tolerance
+        seconds.
+        Returns the number of punches stored."""
+        self.ensure_one()
+        fetched = len(batch)
+        with self._sync_stage('resolve'):
+            batch = batch.unique()
+            cutoff = self.env['zk.machine.attendance']._retention_cutoff()
+            if cutoff:
+                # The months past the retention are archived, their punches
+                # would be stored and paired again.
+                batch = batch.window(calendar.timegm(cutoff.timetuple()))
+            if len(batch):
+                batch = batch.exclude(self._known_punches(batch, tolerance), tolerance)
+            self._sync_count('duplicates', fetched - len(batch))
+            if not len(batch):
+                return 0
+            employees, created = self._resolve_employees(batch.present_user_ids(), names)
+        with self._sync_stage('pair'):
+            batch = batch.sort()
+            rows = self._pair_punches(batch, employees, created)
+        with self._sync_stage('insert'):
+            self._insert_punches(rows)
+        self._sync_count('stored', len(rows))
+        last_punch_at = epoch_to_datetime(batch.epochs[-1])
+        if not self.last_punch_at or last_punch_at > self.last_punch_at:
+            self.last_punch_at = last_punch_at
+        return len(rows)
+
+    def _punch_watermark(self):
+        """Returns the time of the latest punch stored from the machine, an
+        index only scan of (machine_id, punching_time)."""
+        self.ensure_one()
+        self.env['zk.machine.attendance'].flush_model(['machine_id', 'punching_time'])
+        self.env.cr.execute("SELECT max(punching_time) FROM zk_machine_attendance WHERE machine_id = %s",
+                            [self.id])
+        return self.env.cr.fetchone()[0]
+
+    def _known_punches(self, batch, tolerance=0):
+        """Returns the (device_id, epoch) keys of the stored punches of the
+        machine that fall in the time range of batch, widened by tolerance
+        seconds. A device user id is not unique across the machines: the
+        punches of the other machines are left out, the ones stored without
+        a machine are kept."""
+        self.ensure_one()
+        self.env['zk.machine.attendance'].flush_model(['device_id', 'punching_time', 'machine_id'])
+        self.env.cr.execute("""
+            SELECT device_id, EXTRACT(EPOCH FROM punching_time)::bigint
+              FROM zk_machine_attendance
+             WHERE device_id IN %s
+               AND punching_time BETWEEN to_timestamp(%s) AT TIME ZONE 'UTC'
+                                     AND to_timestamp(%s) AT TIME ZONE 'UTC'
+               AND (machine_id = %s OR machine_id IS NULL)
+        """, (tuple(batch.user_ids), min(batch.epochs) - tolerance, max(batch.epochs) + tolerance, self.id))
+        return set(self.env.cr.fetchall())
+
+    def _resolve_employees(self, user_ids, names):
+        """Map device user ids to employee ids, creating the missing employees
+        in one batch.
+
+        Returns the mapping and the set of the created employee ids."""
+        Employee = self.env['hr.employee']
+        employees = {}
+        for employee in Employee.search_read([('device_id', 'in', list(user_ids))], ['device_id']):
+            employees.setdefault(employee['device_id'], employee['id'])
+        missing = [user_id for user_id in user_ids if user_id not in employees]
+        created = Employee.create([{
+            'device_id': user_id,
+            'name': names.get(user_id) or f"Device User {user_id}",
+        } for user_id in missing])
+        employees.update(zip(missing, created.ids))
+        return employees, set(created.ids)
+
+    def _pair_punches(self, batch, employees, created):
+        """Open and close the hr.attendance of the punches of batch, in time
+        order. Punches of unknown type (PUNCH_UNKNOWN) check out an open
+        attendance and check in otherwise, the first punch of a created
+        employee always checks in. The punches are paired in memory, then the
+        new attendances are created at once and the stored ones closed with
+        one write per check out time. The worked hours and the validity of
+        the attendances are computed once at the end, per employee.
+
+        Returns the (employee_id, device_id, attendance_type, punch_type, epoch)
+        rows to insert."""
+        Attendance = self.env['hr.attendance']
+        employee_ids = tuple(set(employees.values()))
+        # The attendances are the ids of the stored ones or the values of the
+        # ones to create, which are created together at the end.
+        open_atts = {}
+        for att in Attendance.search_read([('employee_id', 'in', employee_ids), ('check_out', '=', False)],
+                                          ['employee_id'], order='check_in'):
+            open_atts[att['employee_id'][0]] = att['id']
+        Attendance.flush_model(['employee_id', 'check_in'])
+        self.env.cr.execute("""
+            SELECT DISTINCT ON (employee_id) employee_id, id
+              FROM hr_attendance
+             WHERE employee_id IN %s
+          ORDER BY employee_id, check_in DESC, id DESC
+        """, [employee_ids])
+        last_atts = dict(self.env.cr.fetchall())
+        created = set(created)
+        vals_list = []
+        check_outs = {}
+        rows = []
+        for user_id, epoch, status, punch, _machine_id in batch.rows():
+            employee_id = employees[user_id]
+            atten_time = epoch_to_datetime(epoch)
+            att_open = open_atts.get(employee_id)
+            if employee_id in created:
+                created.discard(employee_id)
+                if punch == PUNCH_UNKNOWN:
+                    punch = 0
+                check_in = True
             else:
-                raise UserError(_('Unable to connect, please check the parameters and network connections.'))
+                if punch == PUNCH_UNKNOWN:
+                    punch = 1 if att_open else 0
+                check_in = punch == 0 and not att_open
+            if check_in:
+                vals = {'employee_id': employee_id, 'check_in': atten_time}
+                vals_list.append(vals)
+                open_atts[employee_id] = last_atts[employee_id] = vals
+            elif punch == 1:  # check-out
+                # if no open, attach to last attendance
+                att = open_atts.pop(employee_id, None) or last_atts.get(employee_id)
+                if isinstance(att, dict):
+                    att['check_out'] = atten_time
+                elif att:
+                    check_outs[att] = atten_time
+            rows.append((employee_id, user_id, status, punch, epoch))
+        with Attendance._zk_bulk_apply() as att_obj:
+            att_obj.create(vals_list)
+            closed = defaultdict(list)
+            for att_id, check_out in check_outs.items():
+                closed[check_out].append(att_id)
+            for check_out, att_ids in closed.items():
+                att_obj.browse(att_ids).write({'check_out': check_out})
+        return rows
+
+    def _insert_punches(self, rows):
+        """Insert (employee_id, device_id, attendance_type, punch_type, epoch)
+        rows in zk_machine_attendance with multi-row INSERT statements.
+
+        The columns are filled as the ORM would: the codes missing from the
+        selections are stored empty, check_in is the punch time and the
+        worked hours of a punch without check out are 0."""
+        self.ensure_one()
+        Attendance = self.env['zk.machine.attendance']
+        statuses = set(Attendance._fields['attendance_type'].get_values(self.env))
+        punches = set(Attendance._fields['punch_type'].get_values(self.env))
+        department = Attendance._fields.get('department_id')
+        with_department = bool(department and department.store and department.column_type)
+        query = """
+            INSERT INTO zk_machine_attendance (employee_id, device_id, attendance_type, punch_type,
+                                               punching_time, check_in, worked_hours, address_id, machine_id,
+                                               create_uid, create_date, write_uid, write_date{department})
+            SELECT v.employee_id, v.device_id, v.status, v.punch,
+                   to_timestamp(v.epoch) AT TIME ZONE 'UTC', to_timestamp(v.epoch) AT TIME ZONE 'UTC', 0, %s, %s,
+                   %s, now() AT TIME ZONE 'UTC', %s, now() AT TIME ZONE 'UTC'{department_value}
+              FROM (VALUES {values}) AS v(employee_id, device_id, status, punch, epoch)
+              JOIN hr_employee e ON e.id = v.employee_id
+        """
+        params = [self.address_id.id or None, self.id, self.env.uid, self.env.uid]
+        rows = [(employee_id, device_id,
+                 str(status) if str(status) in statuses else None,
+                 str(punch) if str(punch) in punches else None,
+                 epoch) for employee_id, device_id, status, punch, epoch in rows]
+        for chunk in split_every(INSERT_CHUNK_SIZE, rows, list):
+            self.env.cr.execute(query.format(
+                department=', department_id' if with_department else '',
+                department_value=', e.department_id' if with_department else '',
+                values=', '.join(['%s'] * len(chunk)),
+            ), params + chunk)
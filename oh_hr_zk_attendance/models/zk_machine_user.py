@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models
+
+
+class ZkMachineUser(models.Model):
+    _name = 'zk.machine.user'
+    _description = 'Biometric Device User'
+    _order = 'machine_id, uid'
+
+    machine_id = fields.Many2one('zk.machine', string='Machine', required=True, ondelete='cascade', index=True)
+    uid = fields.Integer(string='Device UID', help="Internal index of the user on the device")
+    user_id = fields.Char(string='Biometric Device ID', index=True)
+    name = fields.Char(string='Name')
+    privilege = fields.Integer(string='Privilege')
+    card = fields.Char(string='Card')
+    employee_id = fields.Many2one('hr.employee', string='Employee', ondelete='set null')
+
+    _sql_constraints = [
+        ('machine_uid_uniq', 'unique(machine_id, uid)', 'A device user index must be unique per machine.'),
+    ]
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+import re
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import api, fields, models, tools
+
+_logger = logging.getLogger(__name__)
+
+# Months of partitions created ahead of the current one
+PARTITION_MONTHS_AHEAD = 2
+# Schema receiving the partitions detached by the retention policy
+ARCHIVE_SCHEMA = 'zk_attendance_archive'
+# System parameter holding the months of punches kept in the table, 0 keeps all
+RETENTION_PARAM = 'oh_hr_zk_attendance.retention_months'
+# Key of the advisory lock serialising the partition maintenance
+PARTITION_LOCK = 'zk_machine_attendance_partitions'
+# Punches up to which the module update partitions the table. The copy holds
+# an exclusive lock on it: a larger table is left as is, to be converted with
+# _convert_to_partitioned() from a shell in a maintenance window followed by
+# an update of the module, which restores the indexes and foreign keys.
+CONVERT_MAX_ROWS = 1000000
+
+_PARTITION_NAME = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+class _PartitionedTableFilter(logging.Filter):
+    """Odoo 16 only takes the r, v and m relations for tables: at every
+    registry load the partitioned punch table is reported missing, after its
+    init() ran again without harm. That error is dropped."""
+
+    def filter(self, record):
+        return not (record.msg == "Model %s has no table." and record.args == ('zk.machine.attendance',))
+
+
+logging.getLogger('odoo.modules.registry').addFilter(_PartitionedTableFilter())
+
+
+class ZkMachineAttendance(models.Model):
+    _inherit = 'zk.machine.attendance'
+
+    def _table_kind(self):
+        """relkind of the table, None when it does not exist"""
+        self.env.cr.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [self._table])
+        return (self.env.cr.fetchone() or [None])[0]
+
+    def _auto_init(self):
+        if self._table_kind() != 'p':
+            return super()._auto_init()
+        # Odoo 16 does not see the partitioned table and would create it
+        # again: only its columns and constraints are updated.
+        self._check_removed_columns(log=False)
+        columns = tools.table_columns(self._cr, self._table)
+        update_custom_fields = self._context.get('update_custom_fields', False)
+        to_compute = [field.name for field in self._fields.values()
+                      if field.store and (update_custom_fields or not field.manual)
+                      and field.update_db(self, columns)]
+        self._add_sql_constraints()
+        if to_compute:
+            @self.pool.post_init
+            def mark_fields_to_compute():
+                records = self.with_context(active_test=False).search([], order='id')
+                for name in to_compute:
+                    self.env.add_to_compute(records._fields[name], records)
+
+    def init(self):
+        # Converted first, the indexes created by the other init() methods
+        # then land on the partitioned table.
+        kind = self._table_kind()
+        if kind == 'r':
+            self.env.cr.execute(f'SELECT count(*) FROM (SELECT 1 FROM "{self._table}" LIMIT %s) rows',
+                                [CONVERT_MAX_ROWS + 1])
+            if self.env.cr.fetchone()[0] > CONVERT_MAX_ROWS:
+                _logger.warning("%s holds more than %s punches and is not partitioned by the update, run "
+                                "env['zk.machine.attendance']._convert_to_partitioned() from a shell in a "
+                                "maintenance window, then update the module", self._table, CONVERT_MAX_ROWS)
+            else:
+                self._convert_to_partitioned()
+        elif kind == 'p':
+            self._ensure_primary_key()
+        super().init()
+
+    def _convert_to_partitioned(self):
+        """Replace the punch table by a table partitioned by month of
+        punching_time, the rows are copied in the monthly partitions.
+
+        The punches without punching_time get their creation time, the
+        primary key of a partitioned table must contain the partition key:
+        it is (id, punching_time). The punches of a month without partition
+        land in the default partition until the maintenance moves them.
+
+        The table is locked exclusively until the transaction ends, the
+        update only runs it up to CONVERT_MAX_ROWS punches."""
+        cr = self.env.cr
+        table = self._table
+        legacy = f"{table}_unpartitioned"
+        _logger.info("Partitioning %s by month", table)
+        tools.drop_view_if_exists(cr, 'zk_report_daily_attendance')
+        cr.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+        cr.execute(f"""UPDATE "{legacy}" SET punching_time = COALESCE(create_date, now() AT TIME ZONE 'UTC')
+                        WHERE punching_time IS NULL""")
+        cr.execute(f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) PARTITION BY RANGE (punching_time)')
+        cr.execute(f'ALTER SEQUENCE "{table}_id_seq" OWNED BY "{table}".id')
+        cr.execute(f'CREATE TABLE "{table}_pdefault" PARTITION OF "{table}" DEFAULT')
+        cr.execute(f"""SELECT DISTINCT date_trunc('month', punching_time)::date FROM "{legacy}"
+                        WHERE punching_time IS NOT NULL""")
+        for month, in cr.fetchall():
+            self._create_partition(month)
+        cr.execute(f'INSERT INTO "{table}" SELECT * FROM "{legacy}"')
+        cr.execute(f'DROP TABLE "{legacy}"')
+        self._ensure_primary_key()
+        self.env['zk.report.daily.attendance'].init()
+
+    def _ensure_primary_key(self):
+        """Give the partitioned table its (id, punching_time) primary key,
+        the empty punching times are set to the creation time first."""
+        cr = self.env.cr
+        table = self._table
+        cr.execute("SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [table])
+        if cr.fetchone():
+            return
+        cr.execute(f"""UPDATE "{table}" SET punching_time = COALESCE(create_date, now() AT TIME ZONE 'UTC')
+                        WHERE punching_time IS NULL""")
+        cr.execute(f'ALTER TABLE "{table}" ALTER COLUMN punching_time SET NOT NULL')
+        cr.execute(f'DROP INDEX IF EXISTS "{table}_id_index"')
+        cr.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id, punching_time)')
+
+    def _partitions(self):
+        """Returns a dict mapping the first day of a month to the name of
+        its partition"""
+        self.env.cr.execute("""
+            SELECT c.relname
+              FROM pg_inherits i
+              JOIN pg_class c ON c.oid = i.inhrelid
+             WHERE i.inhparent = %s::regclass
+        """, [self._table])
+        partitions = {}
+        for name, in self.env.cr.fetchall():
+            match = _PARTITION_NAME.search(name)
+            if match:
+                partitions[datetime.date(int(match.group(1)), int(match.group(2)), 1)] = name
+        return partitions
+
+    def _create_partition(self, month):
+        """Create and attach the partition of month (its first day). The
+        rows of the month stored in the default partition are moved in it
+        before it is attached."""
+        cr = self.env.cr
+        table = self._table
+        name = f"{table}_p{month:%Y%m}"
+        start, end = month.isoformat(), (month + relativedelta(months=1)).isoformat()
+        cr.execute(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS)')
+        cr.execute(f"""
+            WITH moved AS (
+                DELETE FROM "{table}_pdefault"
+                 WHERE punching_time >= %s AND punching_time < %s
+             RETURNING *
+            )
+            INSERT INTO "{name}" SELECT * FROM moved
+        """, [start, end])
+        # Attaching locks the parent less than CREATE TABLE ... PARTITION OF,
+        # the syncs keep inserting meanwhile.
+        cr.execute(f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)', [start, end])
+        _logger.info("Created partition %s", name)
+        return name
+
+    def _archived_tables(self):
+        """Returns the names of the tables of ARCHIVE_SCHEMA"""
+        self.env.cr.execute("SELECT tablename FROM pg_tables WHERE schemaname = %s", [ARCHIVE_SCHEMA])
+        return {name for name, in self.env.cr.fetchall()}
+
+    def _move_rows(self, source, target, where='TRUE', params=()):
+        """Move the rows of the table source matching where into the table
+        target, by the columns they have in common. The names are given as
+        quoted, possibly schema qualified, identifiers."""
+        cr = self.env.cr
+        cr.execute("""
+            SELECT t.attname
+              FROM pg_attribute t
+              JOIN pg_attribute s ON s.attrelid = %s::regclass AND s.attname = t.attname
+                                 AND s.attnum > 0 AND NOT s.attisdropped
+             WHERE t.attrelid = %s::regclass AND t.attnum > 0 AND NOT t.attisdropped
+          ORDER BY t.attnum
+        """, [source, target])
+        columns = ', '.join(f'"{column}"' for column, in cr.fetchall())
+        cr.execute(f"""
+            WITH moved AS (DELETE FROM {source} WHERE {where} RETURNING *)
+            INSERT INTO {target} ({columns}) SELECT {columns} FROM moved
+        """, params)
+        return cr.rowcount
+
+    def _archive_partition(self, name):
+        """Detach a partition and move it to ARCHIVE_SCHEMA, without the
+        foreign keys that would let deletions cascade into it. The rows of a
+        month archived before are merged in its archived table."""
+        cr = self.env.cr
+        cr.execute(f'ALTER TABLE "{self._table}" DETACH PARTITION "{name}"')
+        cr.execute(f'CREATE SCHEMA IF NOT EXISTS "{ARCHIVE_SCHEMA}"')
+        if name in self._archived_tables():
+            self._move_rows(f'"{name}"', f'"{ARCHIVE_SCHEMA}"."{name}"')
+            cr.execute(f'DROP TABLE "{name}"')
+            _logger.info("Merged partition %s in the archived one", name)
+            return
+        cr.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'", [name])
+        for constraint, in cr.fetchall():
+            cr.execute(f'ALTER TABLE "{name}" DROP CONSTRAINT "{constraint}"')
+        cr.execute(f'ALTER TABLE "{name}" SET SCHEMA "{ARCHIVE_SCHEMA}"')
+        _logger.info("Archived partition %s in schema %s", name, ARCHIVE_SCHEMA)
+
+    def _archive_month(self, month):
+        """Move the rows of month (its first day) stored in the default
+        partition to the archived table of the month, created when missing.
+        No partition is created for a month older than the retention."""
+        cr = self.env.cr
+        table = self._table
+        name = f"{table}_p{month:%Y%m}"
+        cr.execute(f'CREATE SCHEMA IF NOT EXISTS "{ARCHIVE_SCHEMA}"')
+        if name not in self._archived_tables():
+            cr.execute(f'CREATE TABLE "{ARCHIVE_SCHEMA}"."{name}" (LIKE "{table}" INCLUDING DEFAULTS)')
+        count = self._move_rows(f'"{table}_pdefault"', f'"{ARCHIVE_SCHEMA}"."{name}"',
+                                "punching_time >= %s AND punching_time < %s",
+                                [month.isoformat(), (month + relativedelta(months=1)).isoformat()])
+        _logger.info("Archived %s punches of %s from the default partition", count, f"{month:%Y-%m}")
+
+    @api.model
+    def _retention_cutoff(self):
+        """Returns the first day of the oldest month kept in the table, None
+        when the retention keeps every month"""
+        retention = int(self.env['ir.config_parameter'].sudo().get_param(RETENTION_PARAM) or 0)
+        if retention <= 0:
+            return None
+        return fields.Date.today().replace(day=1) - relativedelta(months=retention)
+
+    @api.model
+    def _cron_maintain_partitions(self):
+        """Create the partitions of the coming months and of the months found
+        in the default partition, then archive the partitions older than the
+        retention period. The rows of the default partition older than the
+        retention go to the archived table of their month."""
+        cr = self.env.cr
+        if self._table_kind() != 'p':
+            return
+        cr.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [PARTITION_LOCK])
+        partitions = self._partitions()
+        current = fields.Date.today().replace(day=1)
+        months = {current + relativedelta(months=ahead) for ahead in range(PARTITION_MONTHS_AHEAD + 1)}
+        cr.execute(f"""SELECT DISTINCT date_trunc('month', punching_time)::date FROM "{self._table}_pdefault"
+                        WHERE punching_time IS NOT NULL""")
+        months.update(month for month, in cr.fetchall())
+        cutoff = self._retention_cutoff()
+        for month in sorted(months - set(partitions)):
+            if cutoff and month < cutoff:
+                self._archive_month(month)
+            else:
+                partitions[month] = self._create_partition(month)
+        if cutoff:
+            for month, name in sorted(partitions.items()):
+                if month < cutoff:
+                    self._archive_partition(name)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+from xml.etree import ElementTree
+
+from odoo import fields, models, _
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+
+class ZkMachine(models.Model):
+    _inherit = 'zk.machine'
+
+    profile_refreshed_at = fields.Datetime(string='Profile Read At', readonly=True, copy=False,
+                                           help="The capability profile is read again when it gets older than "
+                                                "the refresh delay or after a failed download")
+    profile_refresh_days = fields.Integer(string='Profile Refresh (days)', default=30)
+    device_name = fields.Char(string='Device Name', readonly=True, copy=False)
+    serial_number = fields.Char(string='Serial Number', readonly=True, copy=False)
+    platform = fields.Char(string='Platform', readonly=True, copy=False)
+    firmware_version = fields.Char(string='Firmware', readonly=True, copy=False)
+    zk_transport = fields.Selection([('tcp', 'TCP'), ('udp', 'UDP')], string='Transport', readonly=True,
+                                    copy=False, help="Protocol accepted by the device, TCP is tried first")
+    user_packet_size = fields.Integer(string='User Record Size', readonly=True, copy=False)
+    face_support = fields.Boolean(string='Face Recognition', readonly=True, copy=False)
+    pin_width = fields.Integer(string='PIN Width', readonly=True, copy=False)
+    extend_format = fields.Integer(string='Extended Format', readonly=True, copy=False)
+    hik_event_page_size = fields.Integer(string='Event Page Size', readonly=True, copy=False,
+                                         help="Largest AcsEvent search page accepted by the device")
+    hik_user_page_size = fields.Integer(string='Person Page Size', readonly=True, copy=False,
+                                        help="Largest UserInfo and CardInfo search page accepted by the device")
+
+    def action_refresh_profile(self):
+        for info in self:
+            info._refresh_profile()
+        return True
+
+    def _ensure_profile(self):
+        """Read the capability profile when it is missing or too old, a
+        failure is logged and leaves the previous profile in place."""
+        self.ensure_one()
+        if self.profile_refreshed_at and fields.Datetime.now() - self.profile_refreshed_at < datetime.timedelta(
+                days=self.profile_refresh_days):
+            return
+        try:
+            self._refresh_profile()
+        except UserError as e:
+            _logger.warning("Reading the profile of %s failed: %s", self.name, e)
+
+    def _refresh_profile(self):
+        self.ensure_one()
+        if self.device_type == 'hik':
+            vals = self._hik_read_profile()
+        else:
+            vals = self._zk_read_profile()
+        vals['profile_refreshed_at'] = fields.Datetime.now()
+        self.write(vals)
+
+    def _zk_read_profile(self):
+        """Connect over TCP then UDP, and read the device options"""
+        params = dict(self._zk_params(), ommit_ping=True)
+        conn = None
+        for transport in ('tcp', 'udp'):
+            try:
+                conn = self._zk_open(dict(params, force_udp=transport == 'udp'))
+                break
+            except UserError:
+                continue
+        if conn is None:
+            raise UserError(_('Unable to connect, please check the parameters and network connections.'))
+
+        def option(getter):
+            try:
+                return getter()
+            except Exception:
+                return False
+        try:
+            vals = {
+                'zk_transport': transport,
+                'user_packet_size': conn.user_packet_size,
+                'device_name': option(conn.get_device_name) or False,
+                'serial_number': option(conn.get_serialnumber) or False,
+                'platform': option(conn.get_platform) or False,
+                'firmware_version': option(conn.get_firmware_version) or False,
+                'face_support': bool(option(conn.get_face_fun_on)),
+                'pin_width': option(conn.get_pin_width) or 0,
+                'extend_format': option(conn.get_extend_fmt) or 0,
+            }
+        finally:
+            conn.disconnect()
+        return vals
+
+    def _hik_read_profile(self):
+        """Read the device information and the search page limits"""
+        session = self._hik_session(self)
+        base = self._hik_base_url(self)
+        vals = {}
+        try:
+            resp = session.get(f"{base}/ISAPI/System/deviceInfo", timeout=20)
+        except Exception as e:
+            raise UserError(_(f"تعذر الاتصال بجهاز Hikvision: {e}"))
+        if resp.status_code < 400:
+            try:
+                info = {node.tag.rsplit('}', 1)[-1]: (node.text or '').strip()
+                        for node in ElementTree.fromstring(resp.content)}
+            except ElementTree.ParseError:
+                info = {}
+            vals.update(device_name=info.get('deviceName') or info.get('model') or False,
+                        serial_number=info.get('serialNumber') or False,
+                        platform=info.get('model') or False,
+                        firmware_version=info.get('firmwareVersion') or False)
+        events = self._hik_get(session, f"{base}/ISAPI/AccessControl/AcsEvent/capabilities?format=json") or {}
+        users = self._hik_get(session, f"{base}/ISAPI/AccessControl/UserInfo/capabilities?format=json") or {}
+        vals.update(
+            hik_event_page_size=self._hik_max_results(events.get('AcsEvent'), 'AcsEventCond'),
+            hik_user_page_size=self._hik_max_results(users.get('UserInfo'), 'UserInfoSearchCond'),
+            face_support=bool(((users.get('UserInfo') or {}).get('FaceInfo'))),
+        )
+        return vals
+
+    def _hik_max_results(self, capabilities, cond_key):
+        """Returns the maxResults limit of a search capability, or 0"""
+        limit = (((capabilities or {}).get(cond_key) or {}).get('maxResults') or {})
+        try:
+            return int(limit.get('@max') or 0) if isinstance(limit, dict) else 0
+        except (TypeError, ValueError):
+            return 0
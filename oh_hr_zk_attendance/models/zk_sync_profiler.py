@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import base64
+import logging
+
+from odoo import fields, models, _
+
+from .zkprofiler import SyncProfiler
+
+_logger = logging.getLogger(__name__)
+
+# Name prefix of the attachments holding the sync profiles
+SYNC_PROFILE_PREFIX = 'sync-profile-'
+
+
+class ZkMachine(models.Model):
+    _inherit = 'zk.machine'
+
+    profile_next_sync = fields.Boolean(string='Profile Next Sync', copy=False,
+                                       help="Run the next download of this machine under the profiler and "
+                                            "attach the collapsed stacks and the slowest queries to the "
+                                            "machine. The option turns itself off after one sync.")
+
+    def _download_machine(self):
+        if not self.profile_next_sync:
+            return super()._download_machine()
+        self.profile_next_sync = False
+        profiler = SyncProfiler()
+        try:
+            with profiler:
+                return super()._download_machine()
+        finally:
+            self._queue_sync_profile(profiler)
+
+    def _poll(self):
+        profiled = self.profile_next_sync
+        super()._poll()
+        if profiled:
+            # Turned off again outside the savepoint of the poll, which rolls
+            # back the write of _download_machine when the sync fails.
+            self.profile_next_sync = False
+
+    def _queue_sync_profile(self, profiler):
+        """Attach the results of profiler to the machine when the transaction
+        commits, a rolled back sync keeps its profile."""
+        self.ensure_one()
+        profiles = self.env.cr.precommit.data.setdefault('zk.machine.sync.profile', [])
+        if not profiles:
+            self.env.cr.precommit.add(self._flush_sync_profiles)
+        stamp = fields.Datetime.now().strftime('%Y%m%d-%H%M%S')
+        for suffix, content in (('.folded', profiler.collapsed()), ('.txt', profiler.report())):
+            profiles.append({
+                'name': f"{SYNC_PROFILE_PREFIX}{stamp}{suffix}",
+                'type': 'binary',
+                'datas': base64.b64encode(content.encode()),
+                'mimetype': 'text/plain',
+                'res_model': self._name,
+                'res_id': self.id,
+            })
+        _logger.info("Profiled the sync of %s: %.3f s", self.name, profiler.duration)
+
+    def _flush_sync_profiles(self):
+        profiles = self.env.cr.precommit.data.pop('zk.machine.sync.profile', [])
+        if profiles:
+            self.env['ir.attachment'].sudo().create(profiles)
+
+    def action_view_sync_profiles(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Sync Profiles'),
+            'res_model': 'ir.attachment',
+            'view_mode': 'tree,form',
+            'domain': [('res_model', '=', self._name), ('res_id', '=', self.id),
+                       ('name', '=like', SYNC_PROFILE_PREFIX + '%')],
+        }
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import datetime
+import functools
+import json
+import logging
+
+from odoo import SUPERUSER_ID, api, fields, models, tools
+from odoo.modules.registry import Registry
+
+from .zkjournal import SyncJournal
+from .zkmetrics import SyncMetrics
+
+_logger = logging.getLogger(__name__)
+
+# Days the sync runs are kept
+SYNC_RUN_RETENTION_DAYS = 90
+
+
+class ZkMachineSyncRun(models.Model):
+    _name = 'zk.machine.sync.run'
+    _description = 'Biometric Device Sync Run'
+    _order = 'started_at desc, id desc'
+    _rec_name = 'started_at'
+
+    machine_id = fields.Many2one('zk.machine', string='Machine', required=True, ondelete='cascade', index=True)
+    started_at = fields.Datetime(string='Started At', required=True, index=True)
+    state = fields.Selection([
+        ('done', 'Done'),
+        ('empty', 'No New Punch'),
+        ('failed', 'Failed'),
+    ], string='Outcome', required=True)
+    error = fields.Text(string='Error')
+    duration = fields.Float(string='Duration (s)', digits=(16, 3))
+    connect_time = fields.Float(string='Connect (s)', digits=(16, 3),
+                                help="Connection and capability profile reading")
+    fetch_time = fields.Float(string='Fetch (s)', digits=(16, 3),
+                              help="Download of the device users and logs")
+    decode_time = fields.Float(string='Decode (s)', digits=(16, 3),
+                               help="Decoding of the downloaded records into punches")
+    resolve_time = fields.Float(string='Resolve (s)', digits=(16, 3),
+                                help="Duplicate detection, device user and employee lookups")
+    pair_time = fields.Float(string='Pair (s)', digits=(16, 3),
+                             help="Check in and check out of the attendances")
+    insert_time = fields.Float(string='Insert (s)', digits=(16, 3),
+                               help="Storage of the punches")
+    bytes_received = fields.Integer(string='Bytes Received')
+    records_fetched = fields.Integer(string='Records Fetched')
+    duplicates_skipped = fields.Integer(string='Duplicates Skipped')
+    records_stored = fields.Integer(string='Punches Stored')
+    query_count = fields.Integer(string='SQL Queries')
+
+    def init(self):
+        super().init()
+        # Last run of every machine, read by the gauges at each scrape
+        tools.create_index(self._cr, 'zk_machine_sync_run_machine_started_index', self._table,
+                           ['machine_id', 'started_at DESC', 'id DESC'])
+
+    @api.model
+    def _record(self, machine, journal, error=None):
+        """Queue the run of journal, the runs of a transaction are created
+        together just before it commits."""
+        runs = self.env.cr.precommit.data.setdefault('zk.machine.sync.run', [])
+        if not runs:
+            self.env.cr.precommit.add(self._flush_runs)
+        stored = journal.counters['stored']
+        vals = {
+            'machine_id': machine.id,
+            'started_at': datetime.datetime.utcfromtimestamp(int(journal.started_at)),
+            'state': 'failed' if error else 'done' if stored else 'empty',
+            'error': str(error) if error else False,
+            'duration': journal.duration,
+            'bytes_received': journal.counters['bytes'],
+            'records_fetched': journal.counters['records'],
+            'duplicates_skipped': journal.counters['duplicates'],
+            'records_stored': stored,
+            'query_count': journal.queries,
+        }
+        vals.update({f'{stage}_time': seconds for stage, seconds in journal.timings.items()})
+        runs.append(vals)
+
+    def _flush_runs(self):
+        runs = self.env.cr.precommit.data.pop('zk.machine.sync.run', [])
+        if runs:
+            self.sudo().create(runs)
+
+    @api.autovacuum
+    def _gc_sync_runs(self):
+        limit = fields.Datetime.now() - datetime.timedelta(days=SYNC_RUN_RETENTION_DAYS)
+        self.sudo().search([('started_at', '<', limit)]).unlink()
+
+
+class ZkSyncMetric(models.Model):
+    _name = 'zk.sync.metric'
+    _description = 'Biometric Device Sync Metric'
+    _log_access = False
+
+    machine_id = fields.Many2one('zk.machine', string='Machine', required=True, ondelete='cascade')
+    name = fields.Char(string='Metric', required=True)
+    labels = fields.Char(string='Labels', required=True, default='{}',
+                         help="JSON object of the labels of the series, besides the machine")
+    value = fields.Float(string='Value')
+
+    _sql_constraints = [
+        ('series_uniq', 'unique (machine_id, name, labels)', "A metric series is stored once."),
+    ]
+
+    @api.model
+    def _metrics(self):
+        """Returns the SyncMetrics of the current transaction. They are added
+        to the stored series from a cursor of their own when the transaction
+        ends, also when it rolls back: the failed syncs count too."""
+        cr = self.env.cr
+        metrics = cr.postcommit.data.get('zk.sync.metric')
+        if metrics is None:
+            metrics = cr.postcommit.data['zk.sync.metric'] = SyncMetrics()
+            flush = functools.partial(_flush_metrics, cr.dbname, metrics)
+            cr.postcommit.add(flush)
+            cr.postrollback.add(flush)
+        return metrics
+
+    @api.model
+    def _add_series(self, rows):
+        """Add the (name, machine id, labels JSON, value) increments of
+        SyncMetrics.drain() to the stored series"""
+        for name, machine_id, labels, value in rows:
+            self.env.cr.execute("""
+                INSERT INTO zk_sync_metric (machine_id, name, labels, value)
+                     SELECT id, %s, %s, %s FROM zk_machine WHERE id = %s
+                ON CONFLICT (machine_id, name, labels)
+                  DO UPDATE SET value = zk_sync_metric.value + EXCLUDED.value
+            """, [name, labels, value, machine_id])
+
+    @api.model
+    def _series(self):
+        """Returns the (name, labels, value) of the stored series, the labels
+        including the machine_id"""
+        self.env.cr.execute("SELECT name, machine_id, labels, value FROM zk_sync_metric")
+        return [(name, dict(json.loads(labels), machine_id=machine_id), value)
+                for name, machine_id, labels, value in self.env.cr.fetchall()]
+
+
+def _flush_metrics(dbname, metrics):
+    rows = metrics.drain()
+    if not rows:
+        return
+    try:
+        with Registry(dbname).cursor() as cr:
+            api.Environment(cr, SUPERUSER_ID, {})['zk.sync.metric']._add_series(rows)
+    except Exception:
+        _logger.warning("Storing the sync metrics of %s failed", dbname, exc_info=True)
+
+
+class ZkMachine(models.Model):
+    _inherit = 'zk.machine'
+
+    sync_run_ids = fields.One2many('zk.machine.sync.run', 'machine_id', string='Sync Runs')
+
+    @api.model
+    def _sync_gauges(self):
+        """Returns the (name, type, help, [(labels, value)]) metric families
+        of the last successful sync run of every machine. They are read from
+        the database, every process serves the same values."""
+        self.env['zk.machine.sync.run'].flush_model()
+        self.env.cr.execute("""
+            SELECT DISTINCT ON (machine_id) machine_id,
+                   EXTRACT(EPOCH FROM (now() AT TIME ZONE 'UTC') - started_at) - duration,
+                   CASE WHEN duration > 0 THEN records_stored / duration ELSE 0 END
+              FROM zk_machine_sync_run
+             WHERE state != 'failed'
+          ORDER BY machine_id, started_at DESC, id DESC
+        """)
+        rows = self.env.cr.fetchall()
+        return [
+            ('zk_sync_last_success_age_seconds', 'gauge', "Seconds since the last successful sync of the machine",
+             [({'machine_id': machine_id}, float(age)) for machine_id, age, _rate in rows]),
+            ('zk_punches_per_second', 'gauge', "Punches stored per second of the last successful sync",
+             [({'machine_id': machine_id}, float(rate)) for machine_id, _age, rate in rows]),
+        ]
+
+    def _journaled(self, func):
+        """Run func(machine) with a SyncJournal in the context and record
+        the run, also when func raises."""
+        self.ensure_one()
+        journal = SyncJournal(self.env.cr)
+        runs = self.env['zk.machine.sync.run']
+        metrics = self.env['zk.sync.metric']._metrics()
+        try:
+            result = func(self.with_context(zk_journal=journal))
+        except Exception as e:
+            runs._record(self, journal, e)
+            metrics.sync_done(self.id, journal, e)
+            raise
+        runs._record(self, journal)
+        metrics.sync_done(self.id, journal)
+        return result
+
+    def _sync_stage(self, stage):
+        """Context manager timing stage in the journal of the running sync"""
+        journal = self.env.context.get('zk_journal')
+        return journal.stage(stage) if journal else contextlib.nullcontext()
+
+    def _sync_count(self, counter, value):
+        journal = self.env.context.get('zk_journal')
+        if journal:
+            journal.count(counter, value)
+
+    def action_view_sync_runs(self):
+        self.ensure_one()
+        action = self.env['ir.actions.act_window']._for_xml_id('oh_hr_zk_attendance.zk_machine_sync_run_action')
+        action['domain'] = [('machine_id', '=', self.id)]
+        action['context'] = {'default_machine_id': self.id}
+        return action
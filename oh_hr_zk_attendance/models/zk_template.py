@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+import logging
+
+from odoo import fields, models
+
+_logger = logging.getLogger(__name__)
+
+# pyzk only transfers fingerprint templates, one slot per finger index
+TEMPLATE_SLOTS = [(str(index), 'Finger %s' % index) for index in range(10)]
+
+
+class ZkEmployeeTemplate(models.Model):
+    _name = 'zk.employee.template'
+    _description = 'Biometric Template'
+    _order = 'employee_id, slot'
+
+    employee_id = fields.Many2one('hr.employee', string='Employee', required=True, ondelete='cascade', index=True)
+    slot = fields.Selection(TEMPLATE_SLOTS, string='Slot', required=True,
+                            help="Finger index of the template on the device")
+    template = fields.Binary(string='Template', attachment=False, required=True)
+    checksum = fields.Char(string='SHA-1', required=True, index=True)
+    valid = fields.Integer(string='Valid Flag', default=1)
+    source_machine_id = fields.Many2one('zk.machine', string='Enrolled On', ondelete='set null')
+
+    _sql_constraints = [
+        ('employee_slot_uniq', 'unique(employee_id, slot)', 'An employee has one template per slot.'),
+    ]
+
+
+class ZkMachineTemplate(models.Model):
+    _name = 'zk.machine.template'
+    _description = 'Biometric Template on Device'
+
+    machine_id = fields.Many2one('zk.machine', string='Machine', required=True, ondelete='cascade', index=True)
+    employee_id = fields.Many2one('hr.employee', string='Employee', required=True, ondelete='cascade')
+    slot = fields.Selection(TEMPLATE_SLOTS, string='Slot', required=True)
+    checksum = fields.Char(string='SHA-1', required=True)
+
+    _sql_constraints = [
+        ('machine_employee_slot_uniq', 'unique(machine_id, employee_id, slot)',
+         'A device holds one template per employee and slot.'),
+    ]
+
+
+class ZkMachine(models.Model):
+    _inherit = 'zk.machine'
+
+    template_ids = fields.One2many('zk.machine.template', 'machine_id', string='Templates on Device')
+
+    def _store_templates(self, templates):
+        """Store the templates downloaded from the machine and record them as
+        present on it.
+
+        A template is added to the store when the employee has none for the
+        slot, and replaced only by a re-enrolment on the machine it came from.
+        Returns the number of templates added or replaced."""
+        self.ensure_one()
+        Template = self.env['zk.employee.template']
+        employees = dict((emp['device_id'], emp['id']) for emp in self.env['hr.employee'].search_read(
+            [('device_id', 'in', list({user_id for user_id, *_rest in templates}))], ['device_id']))
+        stored = {(tmpl.employee_id.id, tmpl.slot): tmpl for tmpl in Template.search(
+            [('employee_id', 'in', list(employees.values()))])}
+        present = {}
+        to_create = []
+        changed = 0
+        for user_id, slot, valid, data in templates:
+            employee_id = employees.get(user_id)
+            if not employee_id:
+                continue
+            checksum = hashlib.sha1(data).hexdigest()
+            present[(employee_id, slot)] = checksum
+            tmpl = stored.get((employee_id, slot))
+            vals = {'template': base64.b64encode(data), 'checksum': checksum, 'valid': valid,
+                    'source_machine_id': self.id}
+            if not tmpl:
+                to_create.append(dict(vals, employee_id=employee_id, slot=slot))
+                changed += 1
+            elif tmpl.checksum != checksum and tmpl.source_machine_id == self:
+                tmpl.write(vals)
+                changed += 1
+        Template.create(to_create)
+        self._set_template_presence(present, replace=True)
+        return changed
+
+    def _set_template_presence(self, present, replace=False):
+        """Record the {(employee_id, slot): checksum} templates held by the
+        machine, replace drops the ones not listed."""
+        self.ensure_one()
+        lines = {(line.employee_id.id, line.slot): line for line in self.template_ids}
+        to_create = []
+        for key, checksum in present.items():
+            line = lines.pop(key, None)
+            if line is None:
+                to_create.append({'machine_id': self.id, 'employee_id': key[0], 'slot': key[1],
+                                  'checksum': checksum})
+            elif line.checksum != checksum:
+                line.checksum = checksum
+        self.env['zk.machine.template'].create(to_create)
+        if replace:
+            self.env['zk.machine.template'].browse([line.id for line in lines.values()]).unlink()
+
+    def _missing_templates(self):
+        """Returns the stored templates of the employees enrolled on the
+        machine that it does not hold with the same content, as
+        {user_id: [(slot, valid, template bytes)]}."""
+        self.ensure_one()
+        enrolled = {user.employee_id.id: user.user_id for user in self.device_user_ids if user.employee_id}
+        held = {(line.employee_id.id, line.slot): line.checksum for line in self.template_ids}
+        missing = {}
+        for tmpl in self.env['zk.employee.template'].search([('employee_id', 'in', list(enrolled))]):
+            if held.get((tmpl.employee_id.id, tmpl.slot)) != tmpl.checksum:
+                missing.setdefault(enrolled[tmpl.employee_id.id], []).append(
+                    (tmpl.slot, tmpl.valid, base64.b64decode(tmpl.template)))
+        return missing
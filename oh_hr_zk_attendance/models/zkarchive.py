@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Kinds of archived payloads
+ZK_ATTLOG = 1       # pyzk CMD_ATTLOG_RRQ buffer, prefixed by its JSON metadata
+HIK_EVENTS = 2      # JSON list of the AcsEvent dicts of a sync
+
+# offset and compressed length in log.bin, raw length, fetch epoch, crc32 of
+# the raw payload, kind
+INDEX = struct.Struct('<QIIdIB')
+_META_SIZE = struct.Struct('<I')
+
+Entry = namedtuple('Entry', 'offset length raw_length fetched_at crc kind')
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _path_lock(path):
+    with _locks_lock:
+        return _locks.setdefault(path, threading.Lock())
+
+
+class LogArchive:
+    """Append-only archive of the raw payloads downloaded from one machine
+
+    log.bin holds the zlib compressed payloads back to back, index.bin one
+    INDEX record per payload. A payload is written before its index record,
+    so an interrupted append only leaves unreferenced bytes at the end of
+    log.bin. The payloads are read back through a memory map of log.bin.
+
+    A compaction writes the kept payloads to log.bin.new and index.bin.new,
+    then moves log.bin.new and index.bin.new over the files in that order.
+    An interrupted compaction is finished, or dropped when log.bin was not
+    replaced yet, the next time the archive is locked."""
+
+    def __init__(self, path):
+        self.path = path
+        self.data_path = os.path.join(path, 'log.bin')
+        self.index_path = os.path.join(path, 'index.bin')
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.path, exist_ok=True)
+        with _path_lock(self.path), open(os.path.join(self.path, 'lock'), 'ab') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            self._recover()
+            yield
+
+    def _recover(self):
+        data_new, index_new = self.data_path + '.new', self.index_path + '.new'
+        if os.path.exists(index_new):
+            if os.path.exists(data_new):
+                os.remove(data_new)
+                os.remove(index_new)
+            else:
+                os.replace(index_new, self.index_path)
+
+    def entries(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        data = data[:len(data) - len(data) % INDEX.size]
+        return [Entry(*values) for values in INDEX.iter_unpack(data)]
+
+    def append(self, kind, payload, fetched_at=None):
+        """Archive payload (bytes), unless it repeats the last payload of its
+        kind. Returns whether it was written."""
+        crc = zlib.crc32(payload)
+        compressed = zlib.compress(payload)
+        with self._locked(), open(self.data_path, 'ab') as data:
+            for entry in reversed(self.entries()):
+                if entry.kind == kind:
+                    if entry.crc == crc and entry.raw_length == len(payload):
+                        return False
+                    break
+            data.seek(0, os.SEEK_END)
+            offset = data.tell()
+            data.write(compressed)
+            data.flush()
+            os.fsync(data.fileno())
+            with open(self.index_path, 'ab') as index:
+                index.write(INDEX.pack(offset, len(compressed), len(payload),
+                                       fetched_at or time.time(), crc, kind))
+        return True
+
+    def last(self, kind):
+        """Returns the last archived payload of kind, None when there is none"""
+        if not os.path.isdir(self.path):
+            return None
+        with self._locked():
+            for entry in reversed(self.entries()):
+                if entry.kind == kind:
+                    with open(self.data_path, 'rb') as f:
+                        f.seek(entry.offset)
+                        return zlib.decompress(f.read(entry.length))
+        return None
+
+    def frames(self, since=None):
+        """Iterate over the (entry, payload) of the archive in append order,
+        the ones fetched before the epoch since are skipped"""
+        if not os.path.isdir(self.path):
+            return
+        # The memory map keeps reading the file it was opened on, even if a
+        # compaction replaces it meanwhile.
+        with self._locked():
+            entries = [entry for entry in self.entries() if since is None or entry.fetched_at >= since]
+            if not entries:
+                return
+            f = open(self.data_path, 'rb')
+        with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            for entry in entries:
+                yield entry, zlib.decompress(view[entry.offset:entry.offset + entry.length])
+
+    def compact(self, before):
+        """Drop the payloads fetched before the epoch before, except the last
+        one of every kind which the next appends are compared with.
+        Returns the number of payloads dropped."""
+        if not os.path.isdir(self.path):
+            return 0
+        with self._locked():
+            entries = self.entries()
+            last = {entry.kind: entry for entry in entries}
+            kept = [entry for entry in entries if entry.fetched_at >= before or last[entry.kind] == entry]
+            if len(kept) == len(entries):
+                return 0
+            data_new, index_new = self.data_path + '.new', self.index_path + '.new'
+            with open(self.data_path, 'rb') as source, open(data_new, 'wb') as data, \
+                    open(index_new, 'wb') as index:
+                offset = 0
+                for entry in kept:
+                    source.seek(entry.offset)
+                    data.write(source.read(entry.length))
+                    index.write(INDEX.pack(offset, *entry[1:]))
+                    offset += entry.length
+                for f in (data, index):
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(data_new, self.data_path)
+            os.replace(index_new, self.index_path)
+        return len(entries) - len(kept)
+
+
+def pack_zk(meta, data):
+    """ZK_ATTLOG payload of the buffer data and its metadata dict"""
+    meta = json.dumps(meta).encode()
+    return _META_SIZE.pack(len(meta)) + meta + bytes(data)
+
+
+def zk_delta(data, records, meta=None):
+    """Returns the buffer of the records of the pyzk CMD_ATTLOG_RRQ buffer
+    data which follow the ones archived by the ZK_ATTLOG payload of metadata
+    meta, with the records, end and tail items of its own metadata. The
+    whole log is taken again when the device log no longer holds the last
+    archived record at the same position (cleared or rewritten log).
+    Returns None when there is no new record."""
+    if len(data) < 4 or not records:
+        return None
+    size = struct.unpack_from('<I', data)[0] // records
+    if not size:
+        return None
+    body = bytes(data[4:4 + size * records])
+    start = 0
+    if meta:
+        end = meta.get('end', meta['records'])
+        tail = meta.get('tail')
+        if 0 < end <= records and (tail is None or zlib.crc32(body[(end - 1) * size:end * size]) == tail):
+            start = end
+    if start >= records:
+        return None
+    chunk = body[start * size:]
+    bounds = {'records': records - start, 'end': records, 'tail': zlib.crc32(body[-size:])}
+    return struct.pack('<I', len(chunk)) + chunk, bounds
+
+
+def unpack_zk(payload):
+    """Returns the metadata dict and the buffer of a ZK_ATTLOG payload"""
+    size = _META_SIZE.unpack_from(payload)[0]
+    start = _META_SIZE.size
+    return json.loads(payload[start:start + size]), payload[start + size:]
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import calendar
+import datetime
+import struct
+from array import array
+
+import pytz
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Punch value of the records whose punch type is not known by the device
+# (Hikvision events), it is decided when pairing the attendances.
+PUNCH_UNKNOWN = 255
+
+# Epoch of the first day of every month encoded by the clocks, which count
+# months from January 2000 (see zkconst.decode_time).
+_MONTH_STARTS = array('q', (
+    calendar.timegm((2000 + month // 12, month % 12 + 1, 1, 0, 0, 0))
+    for month in range(0xFFFFFFFF // (86400 * 31) + 1)
+))
+
+# pyzk buffered attendance records, keyed by record size. The 4 bytes of the
+# timestamp are read as an unsigned int instead of being decoded to datetime.
+_ATTLOG_FORMATS = {
+    8: struct.Struct('<HBIB'),          # uid, status, timestamp, punch
+    16: struct.Struct('<IIBB2xI'),      # user_id, timestamp, status, punch, workcode
+    40: struct.Struct('<H24sBIB8x'),    # uid, user_id, status, timestamp, punch
+}
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _as_numpy(column):
+    """Zero-copy numpy view of an array column"""
+    if not len(column):
+        return np.empty(0, dtype=column.typecode)
+    return np.frombuffer(column, dtype=column.typecode)
+
+
+def zk_time_to_epoch(t):
+    """Convert a timestamp encoded by the timeclock to seconds since the epoch
+
+    Same arithmetic as zkconst.decode_time but without building a datetime"""
+    day_code, seconds = divmod(t, 86400)
+    month_code, day = divmod(day_code, 31)
+    return _MONTH_STARTS[month_code] + day * 86400 + seconds
+
+
+class PunchBatch:
+    """Columnar batch of punches
+
+    Each punch is stored as one item of compact typed columns instead of an
+    object per record. User ids are interned: the user_codes column indexes
+    user_ids, which holds every distinct device user id once.
+
+    The epochs column holds seconds since the epoch, in the device local time
+    until shift_to_utc() is called. The filtering methods return a new batch
+    and use numpy when it is installed."""
+
+    __slots__ = ('user_ids', '_codes', 'user_codes', 'epochs', 'status', 'punch', 'machine_ids')
+
+    def __init__(self):
+        self.user_ids = []
+        self._codes = {}
+        self.user_codes = array('I')
+        self.epochs = array('q')
+        self.status = array('B')
+        self.punch = array('B')
+        self.machine_ids = array('I')
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def _code(self, user_id):
+        code = self._codes.get(user_id)
+        if code is None:
+            code = self._codes[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+        return code
+
+    def append(self, user_id, epoch, status, punch, machine_id):
+        self.user_codes.append(self._code(user_id))
+        self.epochs.append(epoch)
+        self.status.append(status)
+        self.punch.append(punch)
+        self.machine_ids.append(machine_id)
+
+    # Decoders
+
+    @classmethod
+    def from_attlog(cls, data, records, machine_id, users=None):
+        """Decode the buffer of a pyzk CMD_ATTLOG_RRQ read
+
+        data is the raw buffer starting with its 4 bytes total size, records
+        the number of attendance records of the device. users maps the uid of
+        the device users to their user_id, it is needed by the 8 bytes
+        records which do not carry the user_id."""
+        batch = cls()
+        if len(data) < 4 or not records:
+            return batch
+        total_size = struct.unpack_from('<I', data)[0]
+        record_size = total_size // records
+        fmt = _ATTLOG_FORMATS.get(record_size, _ATTLOG_FORMATS[40])
+        view = memoryview(data)[4:]
+        view = view[:len(view) - len(view) % fmt.size]
+        users = users or {}
+        if fmt.size == 8:
+            for uid, status, timestamp, punch in fmt.iter_unpack(view):
+                user_id = users.get(uid) or str(uid)
+                batch.append(user_id, zk_time_to_epoch(timestamp), status, punch, machine_id)
+        elif fmt.size == 16:
+            for user_id, timestamp, status, punch, _workcode in fmt.iter_unpack(view):
+                batch.append(str(user_id), zk_time_to_epoch(timestamp), status, punch, machine_id)
+        else:
+            for _uid, user_id, status, timestamp, punch in fmt.iter_unpack(view):
+                user_id = user_id.split(b'\x00', 1)[0].decode(errors='ignore')
+                batch.append(user_id, zk_time_to_epoch(timestamp), status, punch, machine_id)
+        return batch
+
+    @classmethod
+    def from_hik_events(cls, events, machine_id, cards=None):
+        """Decode Hikvision AcsEvent dicts, the epochs are in UTC
+
+        cards maps the card numbers to the device user id of their owner, for
+        the events carrying only the card.
+        Returns the batch and a dict of the names carried by the events, keyed
+        by device user id."""
+        batch = cls()
+        names = {}
+        cards = cards or {}
+        for ev in events:
+            ts = ev.get('time') or ev.get('Time') or ev.get('timeStr') or ev.get('eventTime')
+            if not ts:
+                continue
+            epoch = parse_iso_epoch(ts)
+            if epoch is None:
+                continue
+            # Identify employee by employeeNoString or cardNo
+            dev_id = ev.get('employeeNoString') or ev.get('employeeNo')
+            if not dev_id:
+                card = ev.get('cardNo') or ev.get('cardNumber')
+                dev_id = cards.get(str(card), card) if card else None
+            if dev_id is None:
+                # Some events may carry personId
+                dev_id = ev.get('personId') or ev.get('userId')
+            if dev_id is None:
+                continue
+            dev_id = str(dev_id)
+            status = 4  # default Card
+            try:
+                if int(ev.get('minor')) in (75, 76, 77, 78):  # face related (approx)
+                    status = 15
+            except (TypeError, ValueError):
+                pass
+            if ev.get('name'):
+                names.setdefault(dev_id, ev['name'])
+            batch.append(dev_id, epoch, status, PUNCH_UNKNOWN, machine_id)
+        return batch, names
+
+    # Vectorised operations
+
+    _COLUMNS = ('user_codes', 'epochs', 'status', 'punch', 'machine_ids')
+
+    def _take(self, index):
+        """Returns the batch of the punches selected by index, a sequence of
+        positions or a numpy boolean mask"""
+        batch = PunchBatch()
+        batch.user_ids = self.user_ids
+        batch._codes = self._codes
+        if np is not None:
+            if not isinstance(index, np.ndarray):
+                index = np.asarray(index, dtype=np.intp)
+            for name in self._COLUMNS:
+                column = getattr(self, name)
+                values = _as_numpy(column)[index]
+                setattr(batch, name, array(column.typecode, values.tobytes()))
+            return batch
+        for name in self._COLUMNS:
+            column = getattr(self, name)
+            setattr(batch, name, array(column.typecode, (column[i] for i in index)))
+        return batch
+
+    def shift_to_utc(self, tz):
+        """Convert the epochs from the local time of the pytz timezone tz to UTC
+
+        The offset is computed once per distinct hour of the batch."""
+        if not len(self):
+            return
+        if np is not None:
+            hours = np.unique(_as_numpy(self.epochs) // 3600).tolist()
+        else:
+            hours = set(e // 3600 for e in self.epochs)
+        offsets = {}
+        for hour in hours:
+            local = _EPOCH + datetime.timedelta(hours=hour)
+            try:
+                offset = tz.localize(local, is_dst=None).utcoffset()
+            except (pytz.AmbiguousTimeError, pytz.NonExistentTimeError):
+                offset = tz.localize(local, is_dst=False).utcoffset()
+            offsets[hour] = int(offset.total_seconds())
+        if np is not None:
+            epochs = _as_numpy(self.epochs)
+            keys = np.array(hours, dtype='q')
+            values = np.array([offsets[hour] for hour in hours], dtype='q')
+            shifted = epochs - values[np.searchsorted(keys, epochs // 3600)]
+            self.epochs = array('q', shifted.tobytes())
+        else:
+            self.epochs = array('q', (e - offsets[e // 3600] for e in self.epochs))
+
+    def shift(self, seconds):
+        """Add seconds to every epoch"""
+        if not seconds or not len(self):
+            return
+        if np is not None:
+            self.epochs = array('q', (_as_numpy(self.epochs) + seconds).tobytes())
+        else:
+            self.epochs = array('q', (e + seconds for e in self.epochs))
+
+    def window(self, start=None, end=None):
+        """Returns the punches with start <= epoch < end"""
+        if np is not None:
+            epochs = _as_numpy(self.epochs)
+            keep = np.ones(len(epochs), dtype=bool)
+            if start is not None:
+                keep &= epochs >= start
+            if end is not None:
+                keep &= epochs < end
+            return self._take(keep)
+        return self._take([i for i, e in enumerate(self.epochs)
+                           if (start is None or e >= start) and (end is None or e < end)])
+
+    def unique(self):
+        """Returns the batch without the repeated (user, epoch) punches, the
+        first occurrence is kept"""
+        if np is not None:
+            keys = np.empty(len(self), dtype=[('epoch', 'q'), ('code', 'I')])
+            keys['epoch'] = _as_numpy(self.epochs)
+            keys['code'] = _as_numpy(self.user_codes)
+            _keys, first = np.unique(keys, return_index=True)
+            return self._take(np.sort(first))
+        seen = set()
+        index = []
+        for i, key in enumerate(zip(self.user_codes, self.epochs)):
+            if key not in seen:
+                seen.add(key)
+                index.append(i)
+        return self._take(index)
+
+    def exclude(self, known, tolerance=0):
+        """Returns the punches whose (user_id, epoch) is not in the set known
+
+        With a tolerance, a punch is also dropped when a known punch of its
+        user lies within tolerance seconds."""
+        epochs_by_code = {}
+        for user_id, epoch in known:
+            code = self._codes.get(user_id)
+            if code is not None:
+                epochs_by_code.setdefault(code, set()).add(epoch)
+        if not epochs_by_code:
+            return self
+        if tolerance:
+            sorted_epochs = {code: sorted(epochs) for code, epochs in epochs_by_code.items()}
+
+            def is_known(code, epoch):
+                epochs = sorted_epochs.get(code)
+                if not epochs:
+                    return False
+                i = bisect.bisect_left(epochs, epoch - tolerance)
+                return i < len(epochs) and epochs[i] <= epoch + tolerance
+        else:
+            def is_known(code, epoch):
+                return epoch in epochs_by_code.get(code, ())
+        return self._take([i for i, (code, epoch) in enumerate(zip(self.user_codes, self.epochs))
+                           if not is_known(code, epoch)])
+
+    def sort(self):
+        """Returns the batch ordered by epoch"""
+        if np is not None:
+            return self._take(np.argsort(_as_numpy(self.epochs), kind='stable'))
+        return self._take(sorted(range(len(self)), key=self.epochs.__getitem__))
+
+    def select_users(self, user_ids):
+        """Returns the punches of the device users in user_ids"""
+        codes = {code for user_id, code in self._codes.items() if user_id in user_ids}
+        return self._take([i for i, code in enumerate(self.user_codes) if code in codes])
+
+    def present_user_ids(self):
+        """Returns the distinct user ids having punches in the batch"""
+        return [self.user_ids[code] for code in sorted(set(self.user_codes))]
+
+    def rows(self):
+        """Iterate over the punches as (user_id, epoch, status, punch, machine_id) tuples"""
+        user_ids = self.user_ids
+        for code, epoch, status, punch, machine_id in zip(
+                self.user_codes, self.epochs, self.status, self.punch, self.machine_ids):
+            yield user_ids[code], epoch, status, punch, machine_id
+
+
+def epoch_to_datetime(epoch):
+    """Naive datetime of seconds since the epoch, as stored by Odoo"""
+    return _EPOCH + datetime.timedelta(seconds=epoch)
+
+
+def parse_iso_epoch(ts):
+    """Convert an ISO 8601 time like '2023-08-22T12:34:56+08:00' or
+    '2023-08-22T12:34:56Z' to seconds since the epoch, naive times are UTC"""
+    try:
+        dt_obj = datetime.datetime.fromisoformat(ts.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        try:
+            dt_obj = datetime.datetime.strptime(ts[:19], '%Y-%m-%dT%H:%M:%S')
+        except (TypeError, ValueError):
+            return None
+    if dt_obj.tzinfo is None:
+        return calendar.timegm(dt_obj.timetuple())
+    return int(dt_obj.timestamp())
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import calendar
+import datetime
+import time
+
+import pytz
+
+from .zklib import ZKLib
+
+# getTime requests sent to measure a clock, the one with the shortest round
+# trip is kept
+CLOCK_SAMPLES = 3
+
+
+def _device_value(reply):
+    """Value of a '~Option=value' device reply"""
+    if not reply:
+        return False
+    return reply.split(b'=', 1)[-1].split(b'\x00', 1)[0].decode(errors='ignore').strip()
+
+
+def _local_epoch(dt, tz):
+    """Seconds since the epoch of a naive datetime in the pytz timezone tz"""
+    try:
+        local = tz.localize(dt, is_dst=None)
+    except (pytz.AmbiguousTimeError, pytz.NonExistentTimeError):
+        local = tz.localize(dt, is_dst=False)
+    return calendar.timegm(local.utctimetuple())
+
+
+def read_info(zk, job):
+    """Device name, serial number, platform and firmware version"""
+    return {
+        'device_name': _device_value(zk.deviceName()),
+        'serial_number': _device_value(zk.serialNumber()),
+        'platform': _device_value(zk.platform()),
+        'firmware': _device_value(zk.version()),
+    }
+
+
+def measure_clock(zk, job):
+    """Drift of the device clock against the local clock, in seconds, the
+    device being ahead when positive
+
+    The device time is compared to the middle of the round trip of the
+    request. The device answers in whole seconds, half a second is added to
+    its time to center the truncation error."""
+    tz = pytz.timezone(job['tz'])
+    best = None
+    for _i in range(CLOCK_SAMPLES):
+        sent = time.time()
+        device_time = zk.getTime()
+        received = time.time()
+        if not device_time:
+            continue
+        rtt = received - sent
+        if best is None or rtt < best[0]:
+            best = (rtt, device_time, sent + rtt / 2)
+    if best is None:
+        raise RuntimeError("The device did not return its time")
+    rtt, device_time, reference = best
+    drift = _local_epoch(device_time, tz) + 0.5 - reference
+    return {'clock_drift': int(round(drift)), 'clock_rtt': rtt * 1000.0}
+
+
+def set_clock(zk, job):
+    """Set the device clock to the local time, then measure it again
+
+    The time sent is ahead by half the smoothed round trip, the delay before
+    the device applies it."""
+    tz = pytz.timezone(job['tz'])
+    delay = (zk.rtt.srtt or 0) / 2
+    now = datetime.datetime.fromtimestamp(round(time.time() + delay), tz).replace(tzinfo=None)
+    if zk.setTime(now) is False:
+        raise RuntimeError("The device did not accept the time")
+    return measure_clock(zk, job)
+
+
+FLEET_COMMANDS = {
+    'info': read_info,
+    'clock': measure_clock,
+    'set_clock': set_clock,
+}
+
+
+def run_command(job):
+    """Run FLEET_COMMANDS[job['command']] in a ZKLib session of one device
+
+    job holds the plain connection values of the machine (ip, port, srtt,
+    rttvar, tz) and the SyncMetrics of the transaction. Returns the values
+    of the command, with the round trip estimate of the session."""
+    zk = ZKLib(job['ip'], job['port'], srtt=job.get('srtt'), rttvar=job.get('rttvar'))
+    try:
+        if not zk.connect():
+            raise RuntimeError("Unable to connect to the device")
+        try:
+            result = FLEET_COMMANDS[job['command']](zk, job)
+        finally:
+            zk.disconnect()
+    finally:
+        zk.zkclient.close()
+        if job.get('metrics'):
+            job['metrics'].zklib_session(job['machine_id'], zk)
+    result.update(srtt=zk.rtt.srtt, rttvar=zk.rtt.rttvar)
+    return result
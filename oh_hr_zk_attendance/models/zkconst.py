@@ -29,6 +29,7 @@ CMD_VERSION = 1100
 CMD_DEVICE = 11
 
 CMD_CLEAR_ADMIN = 20
+CMD_GET_FREE_SIZES = 50
 CMD_SET_USER = 8
 
 LEVEL_USER = 0
@@ -49,19 +50,19 @@ def decode_time(t):
 
     copied from zkemsdk.c - DecodeTime"""
     second = t % 60
-    t = t / 60
+    t = t // 60
 
     minute = t % 60
-    t = t / 60
+    t = t // 60
 
     hour = t % 24
-    t = t / 24
+    t = t // 24
 
     day = t % 31+1
-    t = t / 31
+    t = t // 31
 
     month = t % 12+1
-    t = t / 12
+    t = t // 12
 
     year = t + 2000
 
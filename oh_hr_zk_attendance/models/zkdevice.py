@@ -1,60 +1,38 @@
 # -*- coding: utf-8 -*-
 
-from struct import pack, unpack
+from struct import unpack_from
 from .zkconst import *
 
 
 def zkdevicename(self):
-    """Start a connection with the time clock"""
-    command = CMD_DEVICE
-    command_string = '~DeviceName'
-    chksum = 0
-    session_id = self.session_id
-    reply_id = unpack('HHHH', self.data_recv[:8])[3]
-
-    buf = self.createHeader(command, chksum, session_id,
-        reply_id, command_string)
-    self.zkclient.sendto(buf, self.address)
-    try:
-        self.data_recv, addr = self.zkclient.recvfrom(1024)
-        self.session_id = unpack('HHHH', self.data_recv[:8])[2]
-        return self.data_recv[8:]
-    except:
-        return False
+    """Name of the time clock, as the raw '~DeviceName=value' reply"""
+    return self.option('~DeviceName')
     
 
 def zkenabledevice(self):
-    """Start a connection with the time clock"""
-    command = CMD_ENABLEDEVICE
-    command_string = ''
-    chksum = 0
-    session_id = self.session_id
-    reply_id = unpack('HHHH', self.data_recv[:8])[3]
-
-    buf = self.createHeader(command, chksum, session_id,
-        reply_id, command_string)
-    self.zkclient.sendto(buf, self.address)
+    """Enable the time clock after a disableDevice"""
     try:
-        self.data_recv, addr = self.zkclient.recvfrom(1024)
-        self.session_id = unpack('HHHH', self.data_recv[:8])[2]
-        return self.data_recv[8:]
-    except:
+        return bytes(self.request(CMD_ENABLEDEVICE, retries=0))
+    except Exception:
         return False
 
+
 def zkdisabledevice(self):
-    """Start a connection with the time clock"""
-    command = CMD_DISABLEDEVICE
-    command_string = '\x00\x00'
-    chksum = 0
-    session_id = self.session_id
-    reply_id = unpack('HHHH', self.data_recv[:8])[3]
-
-    buf = self.createHeader(command, chksum, session_id,
-        reply_id, command_string)
-    self.zkclient.sendto(buf, self.address)
+    """Lock the keyboard and sensors of the time clock"""
+    try:
+        return bytes(self.request(CMD_DISABLEDEVICE, b'\x00\x00', retries=0))
+    except Exception:
+        return False
+
+
+def zkgetsizes(self):
+    """Number of users, fingerprints and attendance records of the time
+    clock, as a dict, or False"""
     try:
-        self.data_recv, addr = self.zkclient.recvfrom(1024)
-        self.session_id = unpack('HHHH', self.data_recv[:8])[2]
-        return self.data_recv[8:]
-    except:
+        payload = self.request(CMD_GET_FREE_SIZES)
+    except Exception:
+        return False
+    if len(payload) < 80:
         return False
+    fields = unpack_from('<20i', payload)
+    return {'users': fields[4], 'fingers': fields[6], 'records': fields[8]}
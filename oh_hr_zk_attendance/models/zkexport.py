@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import io
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Columns of an export, in the order the export query selects them. The
+# first one is the UTC punching time, the others are text.
+EXPORT_COLUMNS = ('punching_time', 'employee', 'device_id', 'machine', 'punch_type', 'attendance_type',
+                  'address')
+
+
+class CsvEncoder:
+    """Encodes batches of export rows as UTF-8 CSV"""
+
+    extension = 'csv'
+    content_type = 'text/csv; charset=utf-8'
+
+    def __init__(self, columns=EXPORT_COLUMNS):
+        self.columns = columns
+
+    def header(self):
+        return self.encode([self.columns])
+
+    def encode(self, rows):
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        return buf.getvalue().encode()
+
+    def close(self):
+        return b''
+
+
+class _Spool:
+    """Write-only file handing out what was written since the last drain"""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._size = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._size
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self._chunks = b''.join(self._chunks), []
+        return data
+
+
+class ParquetEncoder:
+    """Encodes batches of export rows as the row groups of a Parquet file,
+    each batch is flushed as soon as it is encoded. Needs pyarrow."""
+
+    extension = 'parquet'
+    content_type = 'application/vnd.apache.parquet'
+
+    def __init__(self, columns=EXPORT_COLUMNS):
+        self.columns = columns
+        self.schema = pyarrow.schema([(columns[0], pyarrow.timestamp('s'))]
+                                     + [(column, pyarrow.string()) for column in columns[1:]])
+        self._spool = _Spool()
+        self._writer = pyarrow.parquet.ParquetWriter(self._spool, self.schema)
+
+    def header(self):
+        return self._spool.drain()
+
+    def encode(self, rows):
+        arrays = [pyarrow.array(values, type=field.type)
+                  for values, field in zip(zip(*rows), self.schema)]
+        self._writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+        return self._spool.drain()
+
+    def close(self):
+        self._writer.close()
+        return self._spool.drain()
+
+
+EXPORT_ENCODERS = {
+    'csv': CsvEncoder,
+    'parquet': ParquetEncoder,
+}
+
+
+def encode_batches(encoder, batches):
+    """Yields the bytes of an export of the row batches, empty chunks are
+    skipped as they would end a chunked transfer."""
+    for data in _encoded(encoder, batches):
+        if data:
+            yield data
+
+
+def _encoded(encoder, batches):
+    yield encoder.header()
+    for rows in batches:
+        yield encoder.encode(rows)
+    yield encoder.close()
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Devices handled at once by the fleet operations
+FLEET_WORKERS = 8
+
+
+def fleet_map(func, jobs, max_workers=FLEET_WORKERS):
+    """Run func(job) for every job in worker threads
+
+    The jobs must hold plain values: the threads cannot use the Odoo
+    environment, whose cursor belongs to the calling thread.
+
+    Returns a list of (job, result, exception) in the order of jobs, the
+    exception is None when func returned"""
+    jobs = list(jobs)
+    if not jobs:
+        return []
+
+    def run(job):
+        try:
+            return job, func(job), None
+        except Exception as e:
+            return job, None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        return list(executor.map(run, jobs))
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Stages of a machine sync, in pipeline order
+STAGES = ('connect', 'fetch', 'decode', 'resolve', 'pair', 'insert')
+COUNTERS = ('bytes', 'records', 'duplicates', 'stored')
+
+
+class SyncJournal:
+    """Wall time per stage and counters of one machine sync
+
+    Stages accumulate, a stage entered several times is summed. A stage
+    entered inside another one pauses it, so every second is counted in a
+    single stage. The counters can be updated by worker threads, the stages
+    belong to the thread running the sync."""
+
+    def __init__(self, cr=None):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._cr = cr
+        self._queries = cr.sql_log_count if cr is not None else 0
+        self.timings = dict.fromkeys(STAGES, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._stack = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            outer = self._stack[-1]
+            self.timings[outer[0]] += now - outer[1]
+        self._stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            name, since = self._stack.pop()
+            self.timings[name] += now - since
+            if self._stack:
+                self._stack[-1][1] = now
+
+    def count(self, counter, value):
+        with self._lock:
+            self.counters[counter] += value
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self._start
+
+    @property
+    def queries(self):
+        """SQL queries run on the cursor since the start of the sync"""
+        if self._cr is None:
+            return 0
+        return self._cr.sql_log_count - self._queries
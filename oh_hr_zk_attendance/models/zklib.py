@@ -1,4 +1,8 @@
-from socket import *
+import random
+import struct
+import time
+from socket import socket, timeout, AF_INET, SOCK_DGRAM
+from .zkconst import USHRT_MAX, CMD_ACK_OK, CMD_ACK_DATA, CMD_PREPARE_DATA, CMD_DATA, CMD_DEVICE
 from .zkconnect import *
 from .zkversion import *
 from .zkos import *
@@ -14,73 +18,221 @@ from .zkdevice import *
 from .zkuser import *
 from .zkattendance import *
 from .zktime import *
+from .zkrtt import RttEstimator
+
+# Retransmissions of an idempotent command before giving up
+CMD_RETRIES = 3
+
+# command, checksum, session id, reply id
+HEADER = struct.Struct('<4H')
+# Largest UDP datagram sent by the devices, header included
+MAX_PACKET = 1032
+
+
+def checksum(packet):
+    """Checksum of a packet whose checksum field is zero, copied from
+    zkemsdk.c
+
+    The words are summed at once, the result is the one of the original
+    loop that subtracted USHRT_MAX each time the sum overflowed."""
+    view = memoryview(packet)
+    words = len(view) // 2
+    total = sum(struct.unpack_from('<%dH' % words, view)) if words else 0
+    if len(view) % 2:
+        total += view[-1]
+    if total:
+        total = (total - 1) % USHRT_MAX + 1
+    chksum = ~total
+    while chksum < 0:
+        chksum += USHRT_MAX
+    return chksum
+
 
 class ZKLib:
     
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, srtt=None, rttvar=None):
+        """srtt and rttvar (seconds) seed the round trip estimator with the
+        values learned by a previous session"""
         self.address = (ip, port)
         self.zkclient = socket(AF_INET, SOCK_DGRAM)
-        self.zkclient.settimeout(3)
+        self.rtt = RttEstimator(srtt, rttvar)
+        self.zkclient.settimeout(self.rtt.timeout())
         self.session_id = 0
-        self.userdata = []
-        self.attendancedata = []
+        self.reply_id = USHRT_MAX - 1
+        self.reply_command = None
+        self.data_recv = b''
+        self.retransmits = 0
+        self.timeouts = 0
+        self._packet = bytearray(MAX_PACKET)
+    
+    
+    def sendrecv(self, buf, bufsize=1024, retries=CMD_RETRIES):
+        """Send a command packet and wait for its reply
+
+        The timeout follows the round trip estimator. Only idempotent read
+        commands may be retransmitted, write commands and the commands
+        starting a data transfer pass retries=0. Retransmissions wait a
+        random jitter and double the timeout, and their replies are not
+        sampled (Karn's algorithm).
+
+        The device echoes the reply id of the command: the packets with
+        another reply id or session, such as a late reply to a previous
+        command, are discarded.
+
+        Returns the (data, address) pair of recvfrom"""
+        _command, _chksum, session_id, reply_id = HEADER.unpack_from(buf)
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            deadline = start + self.rtt.timeout()
+            self.zkclient.sendto(buf, self.address)
+            try:
+                reply = self._recv_reply(bufsize, session_id, reply_id, deadline)
+            except timeout:
+                self.timeouts += 1
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                self.retransmits += 1
+                self.rtt.expire()
+                time.sleep(random.uniform(0, self.rtt.timeout() / 2))
+                continue
+            if not attempt:
+                self.rtt.sample(time.monotonic() - start)
+            return reply
+    
+    
+    def _recv_reply(self, bufsize, session_id, reply_id, deadline):
+        """Receive the reply to the command sent with session_id and
+        reply_id before the monotonic deadline. The session is not checked
+        while it is 0, the device assigns it in the reply to CMD_CONNECT."""
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise timeout('timed out')
+            self.zkclient.settimeout(remaining)
+            reply = self.zkclient.recvfrom(bufsize)
+            if len(reply[0]) < HEADER.size:
+                continue
+            _command, _chksum, reply_session, reply_reply_id = HEADER.unpack_from(reply[0])
+            if reply_reply_id == reply_id and (not session_id or reply_session == session_id):
+                return reply
+    
+    
+    def drain(self):
+        """Discard the packets waiting in the socket, such as the late
+        duplicates of a previous reply"""
+        self.zkclient.setblocking(False)
+        try:
+            while True:
+                self.zkclient.recvfrom(MAX_PACKET)
+        except (BlockingIOError, OSError):
+            pass
+        finally:
+            self.zkclient.settimeout(self.rtt.timeout())
+    
+    
+    def recvchunk(self, bufsize):
+        """Receive the next data chunk of a bulk transfer"""
+        self.zkclient.settimeout(self.rtt.chunk_timeout())
+        try:
+            return self.zkclient.recvfrom(bufsize)
+        except timeout:
+            self.timeouts += 1
+            raise
     
     
     def createChkSum(self, p):
         """This function calculates the chksum of the packet to be sent to the 
-        time clock
-
-        Copied from zkemsdk.c"""
-        l = len(p)
-        chksum = 0
-        while l > 1:
-            chksum += unpack('H', pack('BB', p[0], p[1]))[0]
-            
-            p = p[2:]
-            if chksum > USHRT_MAX:
-                chksum -= USHRT_MAX
-            l -= 2
-        
-        
-        if l:
-            chksum = chksum + p[-1]
-            
-        while chksum > USHRT_MAX:
-            chksum -= USHRT_MAX
-        
-        chksum = ~chksum
-        
-        while chksum < 0:
-            chksum += USHRT_MAX
-        
-        return pack('H', chksum)
+        time clock"""
+        return struct.pack('<H', checksum(p))
 
 
     def createHeader(self, command, chksum, session_id, reply_id, 
                                 command_string):
         """This function puts a the parts that make up a packet together and 
         packs them into a byte string"""
-        buf = pack('HHHH', command, chksum, session_id, reply_id) + command_string.encode(encoding='utf_8', errors='strict')
-        
-        buf = unpack('8B'+'%sB' % len(command_string), buf)
-        
-        chksum = unpack('H', self.createChkSum(buf))[0]
+        if isinstance(command_string, str):
+            command_string = command_string.encode(encoding='utf_8', errors='strict')
+        buf = bytearray(HEADER.size + len(command_string))
+        # As in zkemsdk.c the checksum covers the previous reply id
+        HEADER.pack_into(buf, 0, command, chksum, session_id, reply_id)
+        buf[HEADER.size:] = command_string
+        chksum = checksum(buf)
         reply_id += 1
         if reply_id >= USHRT_MAX:
             reply_id -= USHRT_MAX
+        HEADER.pack_into(buf, 0, command, chksum, session_id, reply_id)
+        return bytes(buf)
+    
+    
+    def request(self, command, command_string=b'', retries=CMD_RETRIES):
+        """Send a command and return the payload of its reply
 
-        buf = pack('HHHH', command, chksum, session_id, reply_id)
-        return buf + command_string.encode(encoding='utf_8', errors='strict')
+        The session and reply ids are taken from the reply header. The
+        payload is a memoryview of the reply, valid until the next request."""
+        buf = self.createHeader(command, 0, self.session_id, self.reply_id, command_string)
+        self.data_recv, _addr = self.sendrecv(buf, retries=retries)
+        self.reply_command, _chksum, self.session_id, self.reply_id = HEADER.unpack_from(self.data_recv)
+        return memoryview(self.data_recv)[HEADER.size:]
+    
+    
+    def option(self, name):
+        """Read a '~Option=value' device option, returns the raw reply
+        payload or False"""
+        try:
+            return bytes(self.request(CMD_DEVICE, name.encode() + b'\x00'))
+        except Exception:
+            return False
+    
+    
+    def read_data(self, command, command_string=b''):
+        """Send a command answered with a data transfer and return the data
+        as a memoryview
+
+        The device announces the size with CMD_PREPARE_DATA and streams
+        CMD_DATA packets, which are received straight into one buffer of
+        that size, then acknowledges the end of the transfer. Small results
+        come back inline in a CMD_ACK_DATA reply. The command is not
+        retransmitted, a lost reply fails the transfer."""
+        # A retransmitted command would start a second transfer whose
+        # packets mix with the first one: stale packets are discarded first
+        # and the command is sent once.
+        self.drain()
+        payload = self.request(command, command_string, retries=0)
+        if self.reply_command == CMD_ACK_DATA:
+            return payload
+        if self.reply_command != CMD_PREPARE_DATA:
+            return memoryview(b'')
+        size = struct.unpack_from('<I', payload)[0]
+        data = bytearray(size)
+        view = memoryview(data)
+        packet = memoryview(self._packet)
+        received = 0
+        self.zkclient.settimeout(self.rtt.chunk_timeout())
+        while received < size:
+            try:
+                length, _addr = self.zkclient.recvfrom_into(self._packet)
+            except timeout:
+                self.timeouts += 1
+                raise
+            if length < HEADER.size:
+                continue
+            chunk_command, _chksum, chunk_session, _reply_id = HEADER.unpack_from(self._packet)
+            if chunk_command != CMD_DATA or chunk_session != self.session_id:
+                continue
+            chunk = min(length - HEADER.size, size - received)
+            view[received:received + chunk] = packet[HEADER.size:HEADER.size + chunk]
+            received += chunk
+        # Final acknowledgement of the transfer
+        self.data_recv, _addr = self.recvchunk(1024)
+        return view
     
     
     def checkValid(self, reply):
         """Checks a returned packet to see if it returned CMD_ACK_OK,
         indicating success"""
-        command = unpack('HHHH', reply[:8])[0]
-        if command == CMD_ACK_OK:
-            return True
-        else:
-            return False
+        return HEADER.unpack_from(reply)[0] == CMD_ACK_OK
             
     def connect(self):
         return zkconnect(self)
@@ -129,6 +281,9 @@ class ZKLib:
     
     def enableDevice(self):
         return zkenabledevice(self)
+    
+    def getSizes(self):
+        return zkgetsizes(self)
         
     def getUser(self):
         return zkgetuser(self)
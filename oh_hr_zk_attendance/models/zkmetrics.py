@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import json
+import threading
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# name: (type, help)
+METRICS = {
+    'zk_sync_runs_total': ('counter', "Machine syncs by outcome"),
+    'zk_sync_duration_seconds': ('histogram', "Wall time of the machine syncs"),
+    'zk_sync_fetch_seconds': ('histogram', "Time spent downloading from the device per sync"),
+    'zk_punches_ingested_total': ('counter', "Punches stored from the machine"),
+    'zk_zklib_retransmits_total': ('counter', "UDP requests retransmitted by ZKLib"),
+    'zk_zklib_timeouts_total': ('counter', "UDP reads of ZKLib that timed out"),
+    'zk_isapi_responses_total': ('counter', "ISAPI responses by HTTP status code, 'error' when no response"),
+}
+
+
+class SyncMetrics:
+    """Counters and histograms of the device syncs accounted by one
+    transaction
+
+    They are added to the series of the zk.sync.metric table once the
+    transaction ends, committed or rolled back, so any process renders the
+    same values. Nothing here uses the environment, the device threads of
+    the transaction update them too. Histograms are stored as one counter
+    per bucket, with an le label, and a _sum counter. Series are keyed by
+    name, machine id and a tuple of (label, value) pairs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, name, machine_id, labels=None, value=1):
+        key = (name, machine_id, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, machine_id, value):
+        bound = LATENCY_BUCKETS[bisect.bisect_left(LATENCY_BUCKETS, value):][:1] or ('+Inf',)
+        self.inc(name + '_bucket', machine_id, {'le': str(bound[0])})
+        self.inc(name + '_sum', machine_id, value=value)
+
+    def sync_done(self, machine_id, journal, error=None):
+        """Account the sync of a machine recorded by a SyncJournal"""
+        self.inc('zk_sync_runs_total', machine_id, {'outcome': 'failed' if error else 'done'})
+        self.observe('zk_sync_duration_seconds', machine_id, journal.duration)
+        self.observe('zk_sync_fetch_seconds', machine_id, journal.timings['fetch'])
+        if not error:
+            self.inc('zk_punches_ingested_total', machine_id, value=journal.counters['stored'])
+
+    def zklib_session(self, machine_id, zk):
+        """Account the retransmissions and timeouts of a ZKLib session"""
+        self.inc('zk_zklib_retransmits_total', machine_id, value=zk.retransmits)
+        self.inc('zk_zklib_timeouts_total', machine_id, value=zk.timeouts)
+
+    def isapi_response(self, machine_id, status):
+        self.inc('zk_isapi_responses_total', machine_id, {'code': str(status)})
+
+    def drain(self):
+        """Returns the (name, machine id, labels JSON, value) increments
+        accounted since the previous drain and forgets them"""
+        with self._lock:
+            values, self._values = self._values, {}
+        return [(name, machine_id, json.dumps(dict(labels), sort_keys=True), value)
+                for (name, machine_id, labels), value in values.items() if value]
+
+
+def render(series, extra=()):
+    """Prometheus text exposition of the stored series
+
+    series holds the (name, labels, value) rows of zk.sync.metric, the labels
+    including the machine_id. extra holds (name, type, help, [(labels,
+    value)]) families added by the caller."""
+    families = {}
+    for name, labels, value in series:
+        families.setdefault(name, []).append((labels, value))
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        if kind == 'histogram':
+            buckets = {}
+            for labels, value in families.get(name + '_bucket', []):
+                labels = dict(labels)
+                bound = labels.pop('le')
+                buckets.setdefault(tuple(sorted(labels.items())), {})[bound] = value
+            if not buckets:
+                continue
+            sums = {tuple(sorted(labels.items())): value for labels, value in families.get(name + '_sum', [])}
+            lines += ["# HELP %s %s" % (name, help_text), "# TYPE %s histogram" % name]
+            for key, counts in sorted(buckets.items()):
+                labels = dict(key)
+                cumulative = 0
+                for bound in LATENCY_BUCKETS + ('+Inf',):
+                    cumulative += counts.get(str(bound), 0)
+                    lines.append("%s_bucket%s %s" % (name, _labels(dict(labels, le=str(bound))),
+                                                     _number(cumulative)))
+                lines.append("%s_sum%s %s" % (name, _labels(labels), _number(sums.get(key, 0.0))))
+                lines.append("%s_count%s %s" % (name, _labels(labels), _number(cumulative)))
+        elif name in families:
+            lines += _family(name, kind, help_text, families[name])
+    for name, kind, help_text, series in extra:
+        lines += _family(name, kind, help_text, series)
+    return '\n'.join(lines) + '\n'
+
+
+def _family(name, kind, help_text, series):
+    lines = ["# HELP %s %s" % (name, help_text), "# TYPE %s %s" % (name, kind)]
+    for labels, value in sorted(series, key=lambda item: sorted((k, str(v)) for k, v in item[0].items())):
+        lines.append("%s%s %s" % (name, _labels(labels), _number(value)))
+    return lines
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                                         .replace('\n', '\\n'))
+                             for key, value in sorted(labels.items()))
+
+
+def _number(value):
+    if isinstance(value, float):
+        if value.is_integer():
+            return str(int(value))
+        return repr(round(value, 6))
+    return str(value)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import errno
+import selectors
+import socket
+import time
+
+
+def probe_ports(addresses, timeout=2.0):
+    """Open a TCP connection to every (host, port) in addresses at once
+
+    All the connections are started without blocking and awaited together,
+    so probing a whole fleet costs at most timeout seconds.
+
+    Returns a dict mapping each address to True when it accepted the
+    connection"""
+    result = dict.fromkeys(addresses, False)
+    selector = selectors.DefaultSelector()
+    try:
+        for address in result:
+            try:
+                family, socktype, proto, _name, sockaddr = socket.getaddrinfo(
+                    address[0], address[1], 0, socket.SOCK_STREAM)[0]
+                sock = socket.socket(family, socktype, proto)
+            except (OSError, ValueError):
+                continue
+            sock.setblocking(False)
+            err = sock.connect_ex(sockaddr)
+            if err == 0:
+                result[address] = True
+                sock.close()
+            elif err in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                selector.register(sock, selectors.EVENT_WRITE, address)
+            else:
+                sock.close()
+
+        deadline = time.monotonic() + timeout
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _mask in selector.select(remaining):
+                sock = key.fileobj
+                if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    result[key.data] = True
+                selector.unregister(sock)
+                sock.close()
+    finally:
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+    return result
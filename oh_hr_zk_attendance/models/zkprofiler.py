@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Seconds between two stack samples of the profiled thread
+SAMPLE_INTERVAL = 0.005
+# Distinct queries kept in the report, slowest total time first
+SLOW_QUERIES = 50
+# Functions listed in the report, by cumulative time
+PSTATS_LINES = 60
+
+_SPACES = re.compile(r'\s+')
+
+
+class SyncProfiler:
+    """Profile the calling thread: cProfile, stack samples and SQL queries
+
+    Used as a context manager around the code to profile. The stacks are
+    sampled from a helper thread, the queries are captured through the
+    query_hooks of the thread, which the Odoo cursors call after each
+    execute. Only the calling thread is observed."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.profile = cProfile.Profile()
+        self.samples = Counter()
+        self.queries = {}
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._sampler = None
+
+    def __enter__(self):
+        self._thread = threading.current_thread()
+        if not hasattr(self._thread, 'query_hooks'):
+            self._thread.query_hooks = []
+        self._thread.query_hooks.append(self._query_hook)
+        self._sampler = threading.Thread(target=self._sample, args=(self._thread.ident,), daemon=True)
+        self._start = time.perf_counter()
+        self._sampler.start()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.disable()
+        self.duration = time.perf_counter() - self._start
+        self._stop.set()
+        self._sampler.join()
+        self._thread.query_hooks.remove(self._query_hook)
+
+    def _query_hook(self, cr, query, params, start, delay, *args):
+        query = _SPACES.sub(' ', query.decode() if isinstance(query, bytes) else str(query)).strip()
+        stats = self.queries.get(query)
+        if stats is None:
+            stats = self.queries[query] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += delay
+        stats[2] = max(stats[2], delay)
+
+    def _sample(self, ident):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(ident)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s (%s:%s)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """The stack samples in the collapsed format read by flamegraph.pl
+        and speedscope: one 'frame;frame;frame count' line per stack"""
+        return ''.join("%s %s\n" % (stack, count) for stack, count in self.samples.most_common())
+
+    def report(self):
+        """Text report of the slowest queries and functions"""
+        out = io.StringIO()
+        total = sum(stats[1] for stats in self.queries.values())
+        out.write("Duration: %.3f s, %d samples\n" % (self.duration, sum(self.samples.values())))
+        out.write("SQL: %d queries, %.3f s\n\n" % (sum(stats[0] for stats in self.queries.values()), total))
+        out.write("Slowest queries (total s, calls, max s):\n")
+        slowest = sorted(self.queries.items(), key=lambda item: item[1][1], reverse=True)[:SLOW_QUERIES]
+        for query, (count, seconds, longest) in slowest:
+            out.write("%10.4f %7d %9.4f  %s\n" % (seconds, count, longest, query[:2000]))
+        out.write("\n")
+        stats = pstats.Stats(self.profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(PSTATS_LINES)
+        return out.getvalue()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+# pyzk sessions of the fleet operations. They run in worker threads: the jobs
+# hold plain values and nothing here uses the Odoo environment.
+
+try:
+    from zk import ZK
+    from zk.finger import Finger
+except ImportError:
+    ZK = Finger = None
+
+# Bytes of the name in the pyzk user records, by record size
+USER_NAME_SIZES = {28: 8, 72: 24}
+# Users sent per buffered template upload
+TEMPLATE_BATCH_SIZE = 50
+
+
+class DeviceError(Exception):
+    """Failure to open a pyzk session, raised without the environment.
+    reason is 'pyzk' when the library is missing and 'connect' when the
+    device could not be reached; zk.machine _zk_error_message gives its
+    translated message."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def open_device(params):
+    """Open a pyzk connection from zk.machine _zk_params() values"""
+    if ZK is None:
+        raise DeviceError('pyzk')
+    zk = ZK(params['ip'], port=params['port'], timeout=params['timeout'], password=0,
+            force_udp=params['force_udp'], ommit_ping=params['ommit_ping'])
+    try:
+        conn = zk.connect()
+    except Exception:
+        conn = None
+    if not conn:
+        raise DeviceError('connect')
+    return conn
+
+
+def user_values(user):
+    """Plain values of a pyzk User"""
+    return {'uid': user.uid, 'user_id': str(user.user_id), 'name': user.name,
+            'privilege': user.privilege, 'card': str(user.card or '')}
+
+
+def stored_name(name, packet_size):
+    """name as a device with packet_size bytes user records stores it: cut
+    to the bytes of its name field, the whole name when the size is not
+    known"""
+    data = (name or '').encode()
+    size = USER_NAME_SIZES.get(packet_size)
+    if size:
+        data = data[:size]
+    return data.split(b'\x00')[0].decode(errors='ignore').strip()
+
+
+def same_name(device_name, name, packet_size):
+    """Whether the name read from the device is name, as truncated by a
+    device with packet_size bytes user records"""
+    return bool(device_name) and device_name == stored_name(name, packet_size)
+
+
+def push_users(job):
+    """Push job['users'] (user_id: name) to the device of job['params'],
+    inside a disable device window.
+
+    Returns the pushed user ids, the (user_id, error) failures and the
+    user_values() of the user table read back from the device."""
+    conn = open_device(job['params'])
+    pushed = []
+    failed = []
+    try:
+        conn.disable_device()
+        current = {user.user_id: user for user in conn.get_users()}
+        for user_id, name in job['users'].items():
+            user = current.get(user_id)
+            if user and same_name(user.name, name, conn.user_packet_size):
+                continue
+            try:
+                if user:
+                    conn.set_user(uid=user.uid, name=name, privilege=user.privilege, password=user.password,
+                                  group_id=user.group_id, user_id=user_id, card=user.card)
+                else:
+                    conn.set_user(name=name, user_id=user_id)
+                pushed.append(user_id)
+            except Exception as e:
+                failed.append((user_id, str(e)))
+        users = [user_values(user) for user in conn.get_users()]
+    finally:
+        try:
+            conn.enable_device()
+        finally:
+            conn.disconnect()
+    return {'pushed': pushed, 'failed': failed, 'users': users}
+
+
+def read_templates(job):
+    """Download the fingerprint templates of the device of job['params']
+
+    Returns a list of (user_id, slot, valid, template bytes)."""
+    conn = open_device(job['params'])
+    try:
+        users = {user.uid: user.user_id for user in conn.get_users()}
+        return [(users[finger.uid], str(finger.fid), finger.valid, finger.template)
+                for finger in conn.get_templates() if finger.uid in users]
+    finally:
+        conn.disconnect()
+
+
+def write_templates(job):
+    """Upload job['templates'] ({user_id: [(slot, valid, template bytes)]})
+    to the device of job['params'], TEMPLATE_BATCH_SIZE users per buffer.
+
+    Returns the (user_id, slot) pairs sent."""
+    conn = open_device(job['params'])
+    sent = []
+    try:
+        conn.disable_device()
+        users = {user.user_id: user for user in conn.get_users()}
+        items = [(users[user_id], fingers) for user_id, fingers in job['templates'].items() if user_id in users]
+        for start in range(0, len(items), TEMPLATE_BATCH_SIZE):
+            batch = items[start:start + TEMPLATE_BATCH_SIZE]
+            save_templates(conn, [
+                [user, [Finger(user.uid, int(slot), valid, template) for slot, valid, template in fingers]]
+                for user, fingers in batch])
+            sent.extend((user.user_id, slot) for user, fingers in batch for slot, _valid, _template in fingers)
+    finally:
+        try:
+            conn.enable_device()
+        finally:
+            conn.disconnect()
+    return sent
+
+
+def save_templates(conn, user_templates):
+    """Send the [user, [fingers]] lists of user_templates.
+
+    The pyzk 0.9 release has no HR_save_usertemplates, it sends one
+    save_user_template per user. The pyzk sources of the upstream repository
+    after 0.9 add HR_save_usertemplates, which sends them in one buffered
+    upload."""
+    if hasattr(conn, 'HR_save_usertemplates'):
+        return conn.HR_save_usertemplates(user_templates)
+    for user, fingers in user_templates:
+        conn.save_user_template(user, fingers)
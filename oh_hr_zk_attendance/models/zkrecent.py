@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import OrderedDict
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class RecentKeys:
+    """Bounded in-memory set of the keys of recently ingested events
+
+    Every key remembers the epoch of its event. Keys are evicted when their
+    event falls before the re-fetched window, or oldest first once the set
+    holds maxsize keys."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, items):
+        """Remember the (key, epoch) pairs of items"""
+        with self._lock:
+            for key, epoch in items:
+                self._keys[key] = epoch
+                self._keys.move_to_end(key)
+            while len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+
+    def evict(self, before):
+        """Forget the keys of the events older than the epoch before"""
+        with self._lock:
+            for key in [key for key, epoch in self._keys.items() if epoch < before]:
+                del self._keys[key]
+
+
+def recent_keys(dbname, machine_id, maxsize):
+    """Returns the RecentKeys of a machine, shared by the threads of the process"""
+    with _registry_lock:
+        keys = _registry.get((dbname, machine_id))
+        if keys is None:
+            keys = _registry[(dbname, machine_id)] = RecentKeys(maxsize)
+        return keys
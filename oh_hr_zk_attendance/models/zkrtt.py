@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+# Bounds of the retransmission timeout, in seconds
+RTO_MIN = 0.2
+RTO_MAX = 10.0
+# Timeout used before the first sample, as in RFC 6298
+RTO_INITIAL = 1.0
+
+
+class RttEstimator:
+    """Round trip time estimator of a device session
+
+    Implements the smoothed RTT and RTT variance of RFC 6298 (TCP SRTT and
+    RTTVAR), all values are in seconds"""
+
+    ALPHA = 1 / 8.0
+    BETA = 1 / 4.0
+    K = 4
+
+    def __init__(self, srtt=None, rttvar=None):
+        self.srtt = srtt or None
+        self.rttvar = rttvar if srtt else None
+        if self.srtt and not self.rttvar:
+            self.rttvar = self.srtt / 2
+        self.backoff = 1
+
+    def sample(self, rtt):
+        """Feed the measured round trip of a request that was not retransmitted"""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.backoff = 1
+
+    def timeout(self):
+        """Retransmission timeout of the next command"""
+        if self.srtt is None:
+            rto = RTO_INITIAL
+        else:
+            rto = self.srtt + self.K * self.rttvar
+        return min(RTO_MAX, max(RTO_MIN, rto) * self.backoff)
+
+    def chunk_timeout(self):
+        """Timeout between two data chunks of a bulk transfer
+
+        The device streams the chunks back to back, so a gap longer than a
+        round trip and its variance means the transfer stalled"""
+        if self.srtt is None:
+            return RTO_INITIAL * 2
+        return min(RTO_MAX, max(RTO_MIN, 2 * self.srtt + self.K * self.rttvar))
+
+    def expire(self):
+        """Double the timeout after a retransmission (Karn's algorithm)"""
+        self.backoff = min(self.backoff * 2, 64)
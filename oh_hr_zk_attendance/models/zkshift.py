@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+from collections import defaultdict
+
+import pytz
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# (opening, closing) punch types of the intervals summed per day
+WORK = (0, 1)           # check in, check out
+BREAK = (2, 3)          # break out, break in
+OVERTIME = (4, 5)       # overtime in, overtime out
+KINDS = (WORK, BREAK, OVERTIME)
+# Punch type of the punches which are none of the above
+PUNCH_OTHER = 255
+# Longest interval between an opening punch and its closing punch, a longer
+# one is taken as a missed punch and not counted.
+MAX_INTERVAL = 16 * 3600
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def day_number(date):
+    """Returns the days since 1970-01-01 of date"""
+    return date.toordinal() - _EPOCH_ORDINAL
+
+
+def _hour_offset(tz, hour, cache):
+    """UTC offset in seconds of tz during the hour (hours since the epoch),
+    the offsets only change on hour boundaries"""
+    key = (tz.zone, hour)
+    offset = cache.get(key)
+    if offset is None:
+        offset = cache[key] = int(datetime.datetime.fromtimestamp(hour * 3600, tz).utcoffset().total_seconds())
+    return offset
+
+
+def day_totals(employees, epochs, punches, timezones):
+    """Sum the worked, break and overtime seconds of punches per employee
+    and local day.
+
+    employees, epochs (UTC seconds) and punches (punch types) are parallel
+    sequences sorted by employee then time. timezones maps the employees to
+    their timezone name, UTC when missing. An interval opens on a punch of
+    the opening type of its kind and closes on the next punch of the same
+    kind if it is the closing one; it counts for the local day of its
+    opening punch. The breaks are deducted from the worked time.
+
+    Returns a dict mapping (employee, day number) to the [worked, break,
+    overtime] seconds."""
+    zones = {employee: pytz.timezone(name or 'UTC') for employee, name in timezones.items()}
+    if np is not None and len(epochs):
+        return _day_totals_numpy(employees, epochs, punches, zones)
+    totals = defaultdict(lambda: [0, 0, 0])
+    cache = {}
+    last = {}
+    for employee, epoch, punch in zip(employees, epochs, punches):
+        for index, (opening, closing) in enumerate(KINDS):
+            if punch != opening and punch != closing:
+                continue
+            previous = last.get((employee, index))
+            if punch == closing and previous and previous[0] == opening and epoch - previous[1] <= MAX_INTERVAL:
+                start = previous[1]
+                tz = zones.get(employee, pytz.utc)
+                day = (start + _hour_offset(tz, start // 3600, cache)) // 86400
+                totals[(employee, day)][index] += epoch - start
+            last[(employee, index)] = (punch, epoch)
+    for values in totals.values():
+        values[0] = max(values[0] - values[1], 0)
+    return dict(totals)
+
+
+def _local_days(employees, epochs, zones):
+    hours = epochs // 3600
+    offsets = np.zeros(len(epochs), dtype=np.int64)
+    cache = {}
+    for employee in np.unique(employees):
+        tz = zones.get(int(employee), pytz.utc)
+        rows = employees == employee
+        unique_hours, inverse = np.unique(hours[rows], return_inverse=True)
+        offsets[rows] = np.array([_hour_offset(tz, int(hour), cache) for hour in unique_hours],
+                                 dtype=np.int64)[inverse]
+    return (epochs + offsets) // 86400
+
+
+def _day_totals_numpy(employees, epochs, punches, zones):
+    employees = np.asarray(employees, dtype=np.int64)
+    epochs = np.asarray(epochs, dtype=np.int64)
+    punches = np.asarray(punches, dtype=np.int64)
+    keys, durations = [], []
+    for index, (opening, closing) in enumerate(KINDS):
+        rows = (punches == opening) | (punches == closing)
+        emp, ts, pt = employees[rows], epochs[rows], punches[rows]
+        length = ts[1:] - ts[:-1]
+        match = (pt[:-1] == opening) & (pt[1:] == closing) & (emp[:-1] == emp[1:]) & (length <= MAX_INTERVAL)
+        emp, start, length = emp[:-1][match], ts[:-1][match], length[match]
+        days = _local_days(emp, start, zones)
+        keys.append(np.stack([emp, days, np.full(len(emp), index, dtype=np.int64)], axis=1))
+        durations.append(length)
+    keys = np.concatenate(keys)
+    durations = np.concatenate(durations)
+    if not len(keys):
+        return {}
+    groups, inverse = np.unique(keys[:, :2], axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    sums = np.zeros((len(groups), len(KINDS)), dtype=np.int64)
+    np.add.at(sums, (inverse, keys[:, 2]), durations)
+    sums[:, 0] = np.maximum(sums[:, 0] - sums[:, 1], 0)
+    return {(int(employee), int(day)): [int(value) for value in values]
+            for (employee, day), values in zip(groups, sums)}
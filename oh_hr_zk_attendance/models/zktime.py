@@ -1,48 +1,18 @@
-from struct import pack, unpack
+from struct import pack, unpack_from
 from .zkconst import *
 
 
-def reverseHex(hexstr):
-    tmp = ''
-    for i in reversed( xrange( len(hexstr)/2 ) ):
-        tmp += hexstr[i*2:(i*2)+2]
-    
-    return tmp
-
-
 def zksettime(self, t):
-    """Start a connection with the time clock"""
-    command = CMD_SET_TIME
-    command_string = pack('I',encode_time(t))
-    chksum = 0
-    session_id = self.session_id
-    reply_id = unpack('HHHH', self.data_recv[:8])[3]
-
-    buf = self.createHeader(command, chksum, session_id,
-        reply_id, command_string)
-    self.zkclient.sendto(buf, self.address)
+    """Set the clock of the time clock to the datetime t"""
     try:
-        self.data_recv, addr = self.zkclient.recvfrom(1024)
-        self.session_id = unpack('HHHH', self.data_recv[:8])[2]
-        return self.data_recv[8:]
-    except:
+        return bytes(self.request(CMD_SET_TIME, pack('<I', encode_time(t)), retries=0))
+    except Exception:
         return False
     
 
 def zkgettime(self):
-    """Start a connection with the time clock"""
-    command = CMD_GET_TIME
-    command_string = ''
-    chksum = 0
-    session_id = self.session_id
-    reply_id = unpack('HHHH', self.data_recv[:8])[3]
-
-    buf = self.createHeader(command, chksum, session_id,
-        reply_id, command_string)
-    self.zkclient.sendto(buf, self.address)
+    """Current time of the time clock, as a naive datetime"""
     try:
-        self.data_recv, addr = self.zkclient.recvfrom(1024)
-        self.session_id = unpack('HHHH', self.data_recv[:8])[2]
-        return decode_time( int( reverseHex( self.data_recv[8:].encode("hex") ), 16 ) )
-    except:
+        return decode_time(unpack_from('<I', self.request(CMD_GET_TIME))[0])
+    except Exception:
         return False
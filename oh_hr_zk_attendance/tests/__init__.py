@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+from . import test_zkbatch
+from . import test_zklib
+from . import test_zkarchive
+from . import test_zkpyzk
+from . import test_zkmetrics
+from . import test_sync_metric
+from . import test_partition
+from . import test_purge
+from . import test_machine_backfill
+from . import test_pairing
+from . import test_zkexport
+from . import test_export_query
+from . import test_zkshift
+from . import test_attendance_day
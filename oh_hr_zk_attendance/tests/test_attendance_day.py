@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from odoo.tests.common import TransactionCase, tagged
+
+DAY = datetime.date(2024, 3, 4)
+NEXT_DAY = DAY + datetime.timedelta(days=1)
+
+
+@tagged('post_install', '-at_install')
+class TestAttendanceDays(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Day = cls.env['zk.attendance.day']
+        cls.employee = cls.env['hr.employee'].create({'name': 'Shift Employee', 'tz': 'UTC'})
+
+    def punch(self, when, punch_type):
+        return self.env['zk.machine.attendance'].create({
+            'employee_id': self.employee.id, 'device_id': '400', 'check_in': when, 'punching_time': when,
+            'punch_type': punch_type,
+        })
+
+    def compute(self):
+        return self.Day._compute_period(DAY, NEXT_DAY, [self.employee.id])
+
+    def days(self):
+        return {day.date: day.worked_hours for day in self.Day.search([('employee_id', '=', self.employee.id)])}
+
+    def test_night_shift_days(self):
+        self.punch(datetime.datetime(2024, 3, 4, 22, 0), '0')
+        self.punch(datetime.datetime(2024, 3, 5, 6, 0), '1')
+        self.assertEqual(self.compute(), 2)
+        self.assertEqual(self.days(), {DAY: 8.0, NEXT_DAY: 0.0})
+        # Nothing changed, nothing is written again
+        self.assertEqual(self.compute(), 0)
+
+    def test_emptied_day_recomputes_day_before(self):
+        self.punch(datetime.datetime(2024, 3, 4, 22, 0), '0')
+        check_out = self.punch(datetime.datetime(2024, 3, 5, 6, 0), '1')
+        self.compute()
+        check_out.unlink()
+        # The next day is deleted and the night shift it closed is open again
+        self.assertEqual(self.compute(), 1)
+        self.assertEqual(self.days(), {DAY: 0.0})
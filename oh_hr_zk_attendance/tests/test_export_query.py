@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from odoo.tests.common import TransactionCase, new_test_user, tagged
+
+PUNCH_TIME = datetime.datetime(2024, 3, 4, 8, 0)
+
+
+@tagged('post_install', '-at_install')
+class TestExportQuery(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.company = cls.env.company
+        cls.other_company = cls.env['res.company'].create({'name': 'Export Other Company'})
+        cls.machine = cls.env['zk.machine'].create({'name': '10.0.0.50', 'port_no': 4370})
+        cls.employee = cls.env['hr.employee'].create({'name': 'Export Employee', 'company_id': cls.company.id})
+        cls.foreign = cls.env['hr.employee'].create({'name': 'Export Foreign', 'company_id': cls.other_company.id})
+        cls.env['zk.machine.attendance'].create([{
+            'employee_id': employee.id, 'device_id': '300', 'machine_id': machine.id if machine else False,
+            'check_in': PUNCH_TIME, 'punching_time': PUNCH_TIME + datetime.timedelta(minutes=minutes),
+        } for minutes, employee, machine in [(0, cls.employee, cls.machine), (1, cls.employee, None),
+                                             (2, cls.foreign, cls.machine)]])
+        cls.user = new_test_user(cls.env, login='zk_export_user', company_id=cls.company.id,
+                                 company_ids=[(6, 0, cls.company.ids)],
+                                 groups='hr.group_hr_user,hr_attendance.group_hr_attendance_user')
+
+    def export(self, env=None, **values):
+        wizard = (env or self.env)['zk.export.wizard'].create(dict({
+            'date_from': PUNCH_TIME - datetime.timedelta(hours=1),
+            'date_to': PUNCH_TIME + datetime.timedelta(hours=1),
+        }, **values))
+        query, params = wizard._export_query()
+        self.env.cr.execute(query, params)
+        return [(employee, machine) for _time, employee, _device, machine, *_rest in self.env.cr.fetchall()]
+
+    def test_unknown_machine_without_machines(self):
+        self.assertIn(('Export Employee', None), self.export())
+        self.assertNotIn(('Export Employee', None), self.export(include_unknown_machine=False))
+
+    def test_unknown_machine_with_machines(self):
+        machines = [(6, 0, self.machine.ids)]
+        self.assertIn(('Export Employee', None), self.export(machine_ids=machines))
+        self.assertEqual(self.export(machine_ids=machines, include_unknown_machine=False),
+                         [('Export Employee', '10.0.0.50'), ('Export Foreign', '10.0.0.50')])
+
+    def test_readable_employees_only(self):
+        self.assertIn(('Export Foreign', '10.0.0.50'), self.export())
+        self.assertEqual(self.export(self.env(user=self.user)),
+                         [('Export Employee', '10.0.0.50'), ('Export Employee', None)])
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import calendar
+import datetime
+from unittest.mock import patch
+
+from odoo.tests.common import TransactionCase, tagged
+
+from ..models.zkbatch import PunchBatch
+
+PUNCH_TIME = datetime.datetime(2024, 3, 1, 8, 30)
+
+
+@tagged('post_install', '-at_install')
+class TestPunchMachine(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Punch = cls.env['zk.machine.attendance']
+        cls.site_a, cls.site_b = cls.env['res.partner'].create([{'name': 'Site A'}, {'name': 'Site B'}])
+        cls.machine_a, cls.machine_b, cls.machine_a2 = cls.env['zk.machine'].create([
+            {'name': '10.0.0.30', 'port_no': 4370, 'address_id': cls.site_a.id},
+            {'name': '10.0.0.31', 'port_no': 4370, 'address_id': cls.site_b.id},
+            {'name': '10.0.0.32', 'port_no': 4370, 'address_id': cls.site_a.id},
+        ])
+        cls.env['zk.machine.user'].create([
+            {'machine_id': machine.id, 'user_id': user_id}
+            for machine, user_id in [(cls.machine_a, '100'), (cls.machine_b, '100'), (cls.machine_b, '101'),
+                                     (cls.machine_a, '102'), (cls.machine_a2, '102')]
+        ])
+        cls.employee = cls.env['hr.employee'].create({'name': 'Backfill Employee'})
+
+    def punch(self, device_id, address=None, machine=None, when=PUNCH_TIME):
+        return self.Punch.create({
+            'employee_id': self.employee.id, 'device_id': device_id, 'check_in': when, 'punching_time': when,
+            'address_id': address.id if address else False, 'machine_id': machine.id if machine else False,
+        })
+
+    def test_backfill_machine(self):
+        at_address = self.punch('100', self.site_a)
+        only_enrolled = self.punch('101', self.site_a)
+        ambiguous = self.punch('102', self.site_a)
+        not_enrolled = self.punch('103', self.site_a)
+        with patch.object(self.env.cr, 'commit'):
+            self.Punch._cron_backfill_machine(batch_size=2)
+        self.Punch.invalidate_model()
+        self.assertEqual(at_address.machine_id, self.machine_a)
+        self.assertEqual(only_enrolled.machine_id, self.machine_b)
+        for punch in ambiguous | not_enrolled:
+            self.assertFalse(punch.machine_id)
+            self.assertTrue(punch.machine_unknown)
+
+    def test_known_punches_of_the_machine(self):
+        self.punch('100', machine=self.machine_b)
+        self.punch('100', when=PUNCH_TIME + datetime.timedelta(minutes=5))
+        epoch = calendar.timegm(PUNCH_TIME.timetuple())
+        batch = PunchBatch()
+        batch.append('100', epoch, 0, 0, self.machine_a.id)
+        batch.append('100', epoch + 300, 0, 0, self.machine_a.id)
+        # The punch of the other machine is not a duplicate, the one stored
+        # without a machine is.
+        self.assertEqual(self.machine_a._known_punches(batch), {('100', epoch + 300)})
+        self.assertEqual(self.machine_b._known_punches(batch), {('100', epoch), ('100', epoch + 300)})
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import calendar
+import datetime
+
+from odoo.exceptions import ValidationError
+from odoo.tests.common import TransactionCase, tagged
+
+from ..models.zkbatch import PUNCH_UNKNOWN, PunchBatch
+
+DAY = datetime.datetime(2024, 3, 4)
+
+
+def at(hour):
+    return DAY + datetime.timedelta(hours=hour)
+
+
+@tagged('post_install', '-at_install')
+class TestPairPunches(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Attendance = cls.env['hr.attendance']
+        cls.machine = cls.env['zk.machine'].create({'name': '10.0.0.40', 'port_no': 4370})
+        cls.employee = cls.env['hr.employee'].create({'name': 'Pairing Employee', 'device_id': '200'})
+
+    def batch(self, punches):
+        batch = PunchBatch()
+        for hour, punch in punches:
+            batch.append('200', calendar.timegm(at(hour).timetuple()), 1, punch, self.machine.id)
+        return batch
+
+    def attendances(self):
+        return self.Attendance.search([('employee_id', '=', self.employee.id)], order='check_in')
+
+    def test_pair_typed_and_unknown_punches(self):
+        rows = self.machine._pair_punches(self.batch([(8, 0), (12, 1), (13, PUNCH_UNKNOWN), (17, PUNCH_UNKNOWN)]),
+                                          {'200': self.employee.id}, set())
+        self.assertEqual([row[3] for row in rows], [0, 1, 0, 1])
+        self.assertEqual([(att.check_in, att.check_out, att.worked_hours) for att in self.attendances()],
+                         [(at(8), at(12), 4.0), (at(13), at(17), 4.0)])
+
+    def test_check_out_closes_stored_attendance(self):
+        stored = self.Attendance.create({'employee_id': self.employee.id, 'check_in': at(7)})
+        self.machine._pair_punches(self.batch([(15, 1)]), {'200': self.employee.id}, set())
+        self.assertEqual(stored.check_out, at(15))
+        self.assertEqual(stored.worked_hours, 8.0)
+        self.assertEqual(self.attendances(), stored)
+
+    def test_created_employee_checks_in(self):
+        self.machine._pair_punches(self.batch([(9, 1)]), {'200': self.employee.id}, {self.employee.id})
+        attendance = self.attendances()
+        self.assertEqual((attendance.check_in, attendance.check_out), (at(9), False))
+
+    def test_validity_checked_once(self):
+        with self.Attendance._zk_bulk_apply() as attendances:
+            attendances.create([
+                {'employee_id': self.employee.id, 'check_in': at(8), 'check_out': at(12)},
+                {'employee_id': self.employee.id, 'check_in': at(13), 'check_out': at(17)},
+            ])
+        self.assertEqual(len(self.attendances()), 2)
+
+    def test_validity_overlap(self):
+        with self.assertRaisesRegex(ValidationError, 'already checked in'):
+            with self.Attendance._zk_bulk_apply() as attendances:
+                attendances.create([
+                    {'employee_id': self.employee.id, 'check_in': at(8), 'check_out': at(12)},
+                    {'employee_id': self.employee.id, 'check_in': at(10), 'check_out': at(14)},
+                ])
+
+    def test_validity_two_open(self):
+        with self.assertRaisesRegex(ValidationError, "hasn't checked out"):
+            with self.Attendance._zk_bulk_apply() as attendances:
+                attendances.create([
+                    {'employee_id': self.employee.id, 'check_in': at(8)},
+                    {'employee_id': self.employee.id, 'check_in': at(10)},
+                ])
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from odoo import fields
+from odoo.tests.common import TransactionCase, tagged
+
+from ..models.zk_partition import ARCHIVE_SCHEMA, RETENTION_PARAM
+
+
+@tagged('post_install', '-at_install')
+class TestPunchPartitions(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Punch = cls.env['zk.machine.attendance']
+        cls.employee = cls.env['hr.employee'].create({'name': 'Partition Employee', 'device_id': '9001'})
+
+    def punch(self, when):
+        return self.Punch.create({'employee_id': self.employee.id, 'device_id': '9001',
+                                  'check_in': when, 'punching_time': when})
+
+    def table_of(self, punch):
+        self.env.cr.execute("SELECT tableoid::regclass::text FROM zk_machine_attendance WHERE id = %s", [punch.id])
+        return (self.env.cr.fetchone() or [None])[0]
+
+    def archived(self, name, punch):
+        self.env.cr.execute(f'SELECT count(*) FROM "{ARCHIVE_SCHEMA}"."{name}" WHERE id = %s', [punch.id])
+        return self.env.cr.fetchone()[0]
+
+    def test_update_keeps_partitioned_table(self):
+        self.assertEqual(self.Punch._table_kind(), 'p')
+        # What a module update does to the model
+        self.Punch._auto_init()
+        self.Punch.init()
+        self.assertEqual(self.Punch._table_kind(), 'p')
+        self.assertTrue(self.table_of(self.punch(fields.Datetime.now())))
+
+    def test_create_partition_moves_default_rows(self):
+        punch = self.punch(datetime.datetime(2099, 1, 15, 8, 0))
+        self.assertEqual(self.table_of(punch), 'zk_machine_attendance_pdefault')
+        name = self.Punch._create_partition(datetime.date(2099, 1, 1))
+        self.assertEqual(self.Punch._partitions()[datetime.date(2099, 1, 1)], name)
+        self.assertEqual(self.table_of(punch), name)
+
+    def test_retention_archives_old_months(self):
+        self.env['ir.config_parameter'].sudo().set_param(RETENTION_PARAM, '12')
+        in_default = self.punch(datetime.datetime(2000, 1, 10, 8, 0))
+        self.Punch._create_partition(datetime.date(2000, 2, 1))
+        in_partition = self.punch(datetime.datetime(2000, 2, 10, 8, 0))
+        recent = self.punch(fields.Datetime.now())
+        self.Punch._cron_maintain_partitions()
+        self.assertIsNone(self.table_of(in_default))
+        self.assertIsNone(self.table_of(in_partition))
+        self.assertEqual(self.archived('zk_machine_attendance_p200001', in_default), 1)
+        self.assertEqual(self.archived('zk_machine_attendance_p200002', in_partition), 1)
+        self.assertEqual(self.table_of(recent), 'zk_machine_attendance_p%s' % fields.Date.today().strftime('%Y%m'))
+        self.assertNotIn(datetime.date(2000, 2, 1), self.Punch._partitions())
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import datetime
+from unittest.mock import patch
+
+from odoo.modules.registry import Registry
+from odoo.tests.common import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestPurgePunches(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Punch = cls.env['zk.machine.attendance']
+        cls.machine = cls.env['zk.machine'].create({'name': '10.0.0.20', 'port_no': 4370})
+        cls.other = cls.env['zk.machine'].create({'name': '10.0.0.21', 'port_no': 4370})
+        cls.employee = cls.env['hr.employee'].create({'name': 'Purge Employee', 'device_id': '9002'})
+        cls.start = datetime.datetime(2024, 3, 1)
+
+    def punches(self, machine, count, start):
+        return self.Punch.create([{
+            'employee_id': self.employee.id, 'device_id': '9002', 'machine_id': machine.id,
+            'check_in': start + datetime.timedelta(hours=hour),
+            'punching_time': start + datetime.timedelta(hours=hour),
+        } for hour in range(count)])
+
+    def test_purge_in_chunks(self):
+        purged = self.punches(self.machine, 5, self.start)
+        kept = self.punches(self.machine, 1, self.start + datetime.timedelta(days=10))
+        with patch.object(Registry, 'cursor', autospec=True, side_effect=Registry.cursor) as cursor:
+            deleted = self.machine._purge_punches(self.start, self.start + datetime.timedelta(days=1), chunk_size=2)
+        self.assertEqual(deleted, 5)
+        # Two full chunks, then a short one ending the purge
+        self.assertEqual(cursor.call_count, 3)
+        self.assertFalse(purged.exists())
+        self.assertTrue(kept.exists())
+
+    def test_purge_scoped_to_machine(self):
+        purged = self.punches(self.machine, 2, self.start)
+        other = self.punches(self.other, 2, self.start)
+        unknown = self.punches(self.machine, 1, self.start)
+        unknown.machine_id = False
+        self.env.flush_all()
+        deleted = self.machine._purge_punches(date_to=self.start + datetime.timedelta(days=1))
+        self.assertEqual(deleted, 2)
+        self.assertFalse(purged.exists())
+        self.assertEqual(len(other.exists()), 2)
+        self.assertTrue(unknown.exists())
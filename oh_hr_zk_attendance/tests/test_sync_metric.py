@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase, tagged
+
+from ..models.zkmetrics import SyncMetrics, render
+
+
+@tagged('post_install', '-at_install')
+class TestSyncMetricSeries(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.machine = cls.env['zk.machine'].create({'name': '10.0.0.10', 'port_no': 4370})
+        cls.Metric = cls.env['zk.sync.metric']
+
+    def test_increments_add_up(self):
+        for status in (200, 200, 401):
+            metrics = SyncMetrics()
+            metrics.isapi_response(self.machine.id, status)
+            self.Metric._add_series(metrics.drain())
+        series = {(name, labels['code']): value for name, labels, value in self.Metric._series()
+                  if labels['machine_id'] == self.machine.id}
+        self.assertEqual(series, {('zk_isapi_responses_total', '200'): 2.0,
+                                  ('zk_isapi_responses_total', '401'): 1.0})
+        body = render(self.Metric._series())
+        self.assertIn('zk_isapi_responses_total{code="200",machine_id="%s"} 2' % self.machine.id, body)
+
+    def test_deleted_machine_skipped(self):
+        machine = self.env['zk.machine'].create({'name': '10.0.0.11', 'port_no': 4370})
+        metrics = SyncMetrics()
+        metrics.inc('zk_zklib_timeouts_total', machine.id, value=3)
+        machine.unlink()
+        count = self.Metric.search_count([])
+        self.Metric._add_series(metrics.drain())
+        self.assertEqual(self.Metric.search_count([]), count)
+
+    def test_transaction_metrics_shared(self):
+        self.assertIs(self.Metric._metrics(), self.Metric._metrics())
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import os
+import struct
+import tempfile
+
+from odoo.tests.common import BaseCase
+
+from ..models.zkarchive import HIK_EVENTS, INDEX, ZK_ATTLOG, LogArchive, pack_zk, unpack_zk, zk_delta
+
+
+class TestLogArchive(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.archive = LogArchive(directory.name)
+
+    def test_append_and_frames(self):
+        self.assertTrue(self.archive.append(ZK_ATTLOG, b'first', fetched_at=10))
+        self.assertTrue(self.archive.append(HIK_EVENTS, b'[]', fetched_at=20))
+        self.assertTrue(self.archive.append(ZK_ATTLOG, b'second', fetched_at=30))
+        self.assertEqual([(entry.kind, payload) for entry, payload in self.archive.frames()],
+                         [(ZK_ATTLOG, b'first'), (HIK_EVENTS, b'[]'), (ZK_ATTLOG, b'second')])
+        self.assertEqual([payload for _entry, payload in self.archive.frames(since=20)], [b'[]', b'second'])
+
+    def test_repeated_payload_is_skipped(self):
+        self.assertTrue(self.archive.append(ZK_ATTLOG, b'log'))
+        self.assertFalse(self.archive.append(ZK_ATTLOG, b'log'))
+        self.assertTrue(self.archive.append(HIK_EVENTS, b'log'))
+        self.assertEqual(len(self.archive.entries()), 2)
+
+    def test_empty_archive(self):
+        self.assertEqual(list(self.archive.frames()), [])
+        self.assertIsNone(self.archive.last(ZK_ATTLOG))
+        self.assertEqual(self.archive.compact(100), 0)
+
+    def test_last(self):
+        self.archive.append(ZK_ATTLOG, b'first')
+        self.archive.append(ZK_ATTLOG, b'second')
+        self.archive.append(HIK_EVENTS, b'[]')
+        self.assertEqual(self.archive.last(ZK_ATTLOG), b'second')
+        self.assertEqual(self.archive.last(HIK_EVENTS), b'[]')
+
+    def test_compact_keeps_recent_and_last_payloads(self):
+        self.archive.append(ZK_ATTLOG, b'old', fetched_at=10)
+        self.archive.append(HIK_EVENTS, b'[1]', fetched_at=20)
+        self.archive.append(ZK_ATTLOG, b'last', fetched_at=30)
+        self.archive.append(HIK_EVENTS, b'[2]', fetched_at=40)
+        self.assertEqual(self.archive.compact(35), 2)
+        self.assertEqual([payload for _entry, payload in self.archive.frames()], [b'last', b'[2]'])
+        self.assertEqual(self.archive.compact(35), 0)
+        self.assertTrue(self.archive.append(ZK_ATTLOG, b'next', fetched_at=50))
+        self.assertEqual(self.archive.last(ZK_ATTLOG), b'next')
+
+    def test_interrupted_compaction(self):
+        self.archive.append(ZK_ATTLOG, b'old', fetched_at=10)
+        self.archive.append(ZK_ATTLOG, b'last', fetched_at=30)
+        # Interrupted before log.bin was replaced: the new files are dropped
+        for path in (self.archive.data_path, self.archive.index_path):
+            with open(path + '.new', 'wb') as f:
+                f.write(b'partial')
+        self.assertEqual(self.archive.last(ZK_ATTLOG), b'last')
+        self.assertFalse(os.path.exists(self.archive.index_path + '.new'))
+        # Interrupted after log.bin was replaced: the new index is moved too
+        entries = self.archive.entries()
+        self.archive.compact(20)
+        with open(self.archive.index_path, 'rb') as f:
+            index = f.read()
+        with open(self.archive.index_path + '.new', 'wb') as f:
+            f.write(index)
+        with open(self.archive.index_path, 'wb') as f:
+            f.write(b''.join(INDEX.pack(*entry) for entry in entries))
+        self.assertEqual([payload for _entry, payload in self.archive.frames()], [b'last'])
+
+    def test_pack_zk(self):
+        meta = {'records': 2, 'users': {'1': '1001'}}
+        self.assertEqual(unpack_zk(pack_zk(meta, b'\x01\x02')), (meta, b'\x01\x02'))
+
+
+def attlog(*records):
+    body = b''.join(records)
+    return struct.pack('<I', len(body)) + body
+
+
+class TestZkDelta(BaseCase):
+
+    def test_first_archive_takes_the_whole_log(self):
+        data, meta = zk_delta(attlog(b'a' * 8, b'b' * 8), 2)
+        self.assertEqual(data, attlog(b'a' * 8, b'b' * 8))
+        self.assertEqual((meta['records'], meta['end']), (2, 2))
+
+    def test_only_new_records(self):
+        _data, meta = zk_delta(attlog(b'a' * 8, b'b' * 8), 2)
+        self.assertIsNone(zk_delta(attlog(b'a' * 8, b'b' * 8), 2, meta))
+        data, meta = zk_delta(attlog(b'a' * 8, b'b' * 8, b'c' * 8), 3, meta)
+        self.assertEqual(data, attlog(b'c' * 8))
+        self.assertEqual((meta['records'], meta['end']), (1, 3))
+
+    def test_cleared_log_is_taken_again(self):
+        _data, meta = zk_delta(attlog(b'a' * 8, b'b' * 8), 2)
+        data, meta = zk_delta(attlog(b'c' * 8), 1, meta)
+        self.assertEqual(data, attlog(b'c' * 8))
+        data, meta = zk_delta(attlog(b'd' * 8, b'e' * 8), 2, meta)
+        self.assertEqual(data, attlog(b'd' * 8, b'e' * 8))
+
+    def test_full_log_payload_metadata(self):
+        data, meta = zk_delta(attlog(b'a' * 8, b'b' * 8, b'c' * 8), 3, {'records': 2})
+        self.assertEqual(data, attlog(b'c' * 8))
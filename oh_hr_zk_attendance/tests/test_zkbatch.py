@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import calendar
+import datetime
+import random
+import struct
+
+import pytz
+
+from odoo.tests.common import BaseCase
+
+from ..models import zkbatch
+from ..models.zkbatch import PUNCH_UNKNOWN, PunchBatch, _ATTLOG_FORMATS, zk_time_to_epoch
+from ..models.zkconst import decode_time, encode_time
+
+EPOCH = calendar.timegm((2024, 3, 1, 8, 30, 0))
+
+
+def attlog(records):
+    """CMD_ATTLOG_RRQ buffer of packed records"""
+    data = b''.join(records)
+    return struct.pack('<I', len(data)) + data
+
+
+class TestPunchBatchDecoders(BaseCase):
+
+    def test_zk_time_to_epoch(self):
+        t = encode_time(datetime.datetime(2024, 3, 1, 8, 30, 0))
+        self.assertEqual(zk_time_to_epoch(t), EPOCH)
+        self.assertEqual(decode_time(t), datetime.datetime(2024, 3, 1, 8, 30, 0))
+
+    def test_from_attlog_40(self):
+        t = encode_time(datetime.datetime(2024, 3, 1, 8, 30, 0))
+        data = attlog([_ATTLOG_FORMATS[40].pack(1, b'1001', 1, t, 0),
+                       _ATTLOG_FORMATS[40].pack(2, b'1002', 15, t + 60, 1)])
+        batch = PunchBatch.from_attlog(data, 2, 7)
+        self.assertEqual(list(batch.rows()), [('1001', EPOCH, 1, 0, 7), ('1002', EPOCH + 60, 15, 1, 7)])
+
+    def test_from_attlog_16(self):
+        t = encode_time(datetime.datetime(2024, 3, 1, 8, 30, 0))
+        data = attlog([_ATTLOG_FORMATS[16].pack(1001, t, 1, 0, 0)])
+        self.assertEqual(list(PunchBatch.from_attlog(data, 1, 7).rows()), [('1001', EPOCH, 1, 0, 7)])
+
+    def test_from_attlog_8_uses_uids(self):
+        t = encode_time(datetime.datetime(2024, 3, 1, 8, 30, 0))
+        data = attlog([_ATTLOG_FORMATS[8].pack(3, 1, t, 1), _ATTLOG_FORMATS[8].pack(4, 1, t, 0)])
+        batch = PunchBatch.from_attlog(data, 2, 7, {3: '1003'})
+        self.assertEqual([row[0] for row in batch.rows()], ['1003', '4'])
+
+    def test_from_attlog_empty(self):
+        self.assertEqual(len(PunchBatch.from_attlog(b'', 0, 7)), 0)
+        self.assertEqual(len(PunchBatch.from_attlog(struct.pack('<I', 0), 0, 7)), 0)
+
+    def test_from_hik_events(self):
+        events = [
+            {'time': '2024-03-01T16:30:00+08:00', 'employeeNoString': '1001', 'minor': 75, 'name': 'Ann'},
+            {'time': '2024-03-01T08:31:00Z', 'cardNo': '99'},
+            {'time': '2024-03-01T08:32:00Z'},
+            {'employeeNoString': '1001'},
+        ]
+        batch, names = PunchBatch.from_hik_events(events, 7, {'99': '1002'})
+        self.assertEqual(list(batch.rows()), [('1001', EPOCH, 15, PUNCH_UNKNOWN, 7),
+                                              ('1002', EPOCH + 60, 4, PUNCH_UNKNOWN, 7)])
+        self.assertEqual(names, {'1001': 'Ann'})
+
+
+class TestPunchBatchOperations(BaseCase):
+
+    def make_batch(self, rows):
+        batch = PunchBatch()
+        for user_id, epoch in rows:
+            batch.append(user_id, epoch, 1, 0, 7)
+        return batch
+
+    def test_window(self):
+        batch = self.make_batch([('1', 10), ('1', 20), ('2', 30)])
+        self.assertEqual([e for _u, e, *_r in batch.window(20).rows()], [20, 30])
+        self.assertEqual([e for _u, e, *_r in batch.window(None, 30).rows()], [10, 20])
+        self.assertEqual([e for _u, e, *_r in batch.window(11, 20).rows()], [])
+
+    def test_unique_keeps_first(self):
+        batch = self.make_batch([('1', 10), ('2', 10), ('1', 10), ('1', 11)])
+        self.assertEqual([(u, e) for u, e, *_r in batch.unique().rows()], [('1', 10), ('2', 10), ('1', 11)])
+
+    def test_exclude(self):
+        batch = self.make_batch([('1', 100), ('1', 200), ('2', 100)])
+        kept = batch.exclude({('1', 100), ('3', 100)})
+        self.assertEqual([(u, e) for u, e, *_r in kept.rows()], [('1', 200), ('2', 100)])
+
+    def test_exclude_with_tolerance(self):
+        batch = self.make_batch([('1', 100), ('1', 200), ('2', 100)])
+        kept = batch.exclude({('1', 195), ('2', 110)}, tolerance=5)
+        self.assertEqual([(u, e) for u, e, *_r in kept.rows()], [('1', 100), ('2', 100)])
+
+    def test_shift_to_utc(self):
+        batch = self.make_batch([('1', EPOCH)])
+        batch.shift_to_utc(pytz.timezone('Asia/Kolkata'))
+        self.assertEqual(batch.epochs[0], EPOCH - 5 * 3600 - 1800)
+
+    def test_select_users_and_sort(self):
+        batch = self.make_batch([('2', 30), ('1', 20), ('3', 10)])
+        self.assertEqual([(u, e) for u, e, *_r in batch.select_users({'1', '2'}).sort().rows()],
+                         [('1', 20), ('2', 30)])
+
+
+class TestPunchBatchNumpyParity(BaseCase):
+    """The numpy and pure Python code paths give the same batches"""
+
+    def run_pipeline(self, batch):
+        batch.shift_to_utc(pytz.timezone('Europe/Brussels'))
+        batch.shift(-30)
+        batch = batch.window(EPOCH - 86400, EPOCH + 40 * 86400).unique()
+        batch = batch.exclude({('1001', EPOCH + 3600)}, tolerance=120)
+        return list(batch.sort().rows())
+
+    def test_parity(self):
+        if zkbatch.np is None:
+            self.skipTest("numpy is not installed")
+        rnd = random.Random(0)
+        rows = [('%d' % rnd.randint(1000, 1010), EPOCH + rnd.randint(-2 * 86400, 45 * 86400))
+                for _i in range(2000)]
+        rows += rows[:100]
+
+        def build():
+            batch = PunchBatch()
+            for user_id, epoch in rows:
+                batch.append(user_id, epoch, 1, epoch % 2, 7)
+            return batch
+
+        with_numpy = self.run_pipeline(build())
+        np, zkbatch.np = zkbatch.np, None
+        try:
+            without_numpy = self.run_pipeline(build())
+        finally:
+            zkbatch.np = np
+        self.assertEqual(with_numpy, without_numpy)
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from odoo.tests.common import BaseCase
+
+from ..models.zkexport import CsvEncoder, encode_batches
+
+
+class TestExportEncoders(BaseCase):
+
+    def test_csv(self):
+        rows = [(datetime.datetime(2024, 3, 1, 8, 30), 'Doe, John', '1001', '10.0.0.1', 'Check In', 'Finger', None)]
+        data = b''.join(encode_batches(CsvEncoder(), iter([rows, [], rows])))
+        lines = data.decode().splitlines()
+        self.assertEqual(lines[0], 'punching_time,employee,device_id,machine,punch_type,attendance_type,address')
+        self.assertEqual(lines[1:], ['2024-03-01 08:30:00,"Doe, John",1001,10.0.0.1,Check In,Finger,'] * 2)
+
+    def test_no_empty_chunk(self):
+        self.assertNotIn(b'', list(encode_batches(CsvEncoder(), iter([[], []]))))
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+import os
+import random
+import socket
+import struct
+import threading
+
+from odoo.tests.common import BaseCase
+
+from ..models.zkconst import CMD_ACK_OK, CMD_VERSION, USHRT_MAX
+from ..models.zklib import HEADER, ZKLib, checksum
+from ..models.zkrtt import RTO_MAX, RTO_MIN, RttEstimator
+
+EMULATOR_PORT = 14980
+
+
+def reference_checksum(p):
+    """Checksum loop of zkemsdk.c"""
+    chksum = 0
+    while len(p) > 1:
+        chksum += struct.unpack('<H', p[:2])[0]
+        p = p[2:]
+        if chksum > USHRT_MAX:
+            chksum -= USHRT_MAX
+    if p:
+        chksum += p[-1]
+    while chksum > USHRT_MAX:
+        chksum -= USHRT_MAX
+    chksum = ~chksum
+    while chksum < 0:
+        chksum += USHRT_MAX
+    return chksum
+
+
+def load_emulator():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tools', 'zk_emulator.py')
+    spec = importlib.util.spec_from_file_location('zk_emulator', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestRttEstimator(BaseCase):
+
+    def test_first_sample(self):
+        rtt = RttEstimator()
+        rtt.sample(0.1)
+        self.assertAlmostEqual(rtt.srtt, 0.1)
+        self.assertAlmostEqual(rtt.rttvar, 0.05)
+        self.assertAlmostEqual(rtt.timeout(), 0.3)
+
+    def test_backoff(self):
+        rtt = RttEstimator(0.01, 0.001)
+        self.assertEqual(rtt.timeout(), RTO_MIN)
+        for _i in range(10):
+            rtt.expire()
+        self.assertEqual(rtt.timeout(), RTO_MAX)
+        rtt.sample(0.01)
+        self.assertEqual(rtt.timeout(), RTO_MIN)
+
+
+class TestZKLib(BaseCase):
+
+    def test_checksum(self):
+        rnd = random.Random(0)
+        for size in (0, 1, 8, 9, 100, 1031):
+            packet = bytes(rnd.getrandbits(8) for _i in range(size))
+            self.assertEqual(checksum(packet), reference_checksum(packet), size)
+        self.assertEqual(checksum(b'\xff' * 1024), reference_checksum(b'\xff' * 1024))
+
+    def test_stale_replies_are_discarded(self):
+        """A reply carrying another reply id, like the late reply to a
+        retransmitted command, is not taken for the reply of the next one"""
+        device = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        device.bind(('127.0.0.1', 0))
+        device.settimeout(5)
+
+        def serve():
+            for _i in range(2):
+                data, address = device.recvfrom(1024)
+                command, _chksum, session_id, reply_id = HEADER.unpack_from(data)
+                device.sendto(HEADER.pack(CMD_ACK_OK, 0, session_id, (reply_id - 1) % USHRT_MAX) + b'stale', address)
+                device.sendto(HEADER.pack(CMD_ACK_OK, 0, session_id, reply_id) + b'%d' % command, address)
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        zk = ZKLib('127.0.0.1', device.getsockname()[1])
+        try:
+            self.assertEqual(bytes(zk.request(CMD_VERSION)), b'%d' % CMD_VERSION)
+            self.assertEqual(bytes(zk.request(CMD_VERSION + 1)), b'%d' % (CMD_VERSION + 1))
+        finally:
+            thread.join()
+            zk.zkclient.close()
+            device.close()
+
+    def test_emulated_device(self):
+        emulator = load_emulator()
+        options = emulator.Options(users=20, records=300)
+        with emulator.Fleet(zk=1, base_port=EMULATOR_PORT, options=options) as fleet:
+            device = fleet.devices[0]
+            zk = ZKLib('127.0.0.1', device.port)
+            try:
+                self.assertTrue(zk.connect())
+                users = zk.getUser()
+                attendance = zk.getAttendance()
+                zk.disconnect()
+            finally:
+                zk.zkclient.close()
+        self.assertEqual(len(users), 20)
+        self.assertEqual(len(attendance), 300)
+        self.assertEqual({user_id for user_id, _status, _time in attendance} - {u[0] for u in users.values()},
+                         set())
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import json
+import multiprocessing
+import os
+
+from odoo.tests.common import BaseCase
+
+from ..models.zkjournal import SyncJournal
+from ..models.zkmetrics import SyncMetrics, render
+
+
+class FakeSession:
+    retransmits = 2
+    timeouts = 1
+
+
+def stored(rows):
+    """(name, labels, value) series of drained rows, as zk.sync.metric
+    _series reads them back once added"""
+    series = {}
+    for name, machine_id, labels, value in rows:
+        key = (name, machine_id, labels)
+        series[key] = series.get(key, 0) + value
+    return [(name, dict(json.loads(labels), machine_id=machine_id), float(value))
+            for (name, machine_id, labels), value in series.items()]
+
+
+def run_sync(conn):
+    """Account a sync the way the cron process does and send the drained rows"""
+    metrics = SyncMetrics()
+    journal = SyncJournal()
+    journal.timings['fetch'] = 0.3
+    journal.count('stored', 12)
+    metrics.sync_done(7, journal)
+    metrics.zklib_session(7, FakeSession())
+    metrics.isapi_response(7, 200)
+    metrics.isapi_response(7, 'error')
+    conn.send((os.getpid(), metrics.drain()))
+    conn.close()
+
+
+class TestSyncMetrics(BaseCase):
+
+    def test_drain_forgets(self):
+        metrics = SyncMetrics()
+        metrics.inc('zk_sync_runs_total', 1, {'outcome': 'done'})
+        metrics.inc('zk_sync_runs_total', 1, {'outcome': 'done'})
+        self.assertEqual(metrics.drain(), [('zk_sync_runs_total', 1, '{"outcome": "done"}', 2)])
+        self.assertEqual(metrics.drain(), [])
+
+    def test_histogram_buckets(self):
+        metrics = SyncMetrics()
+        metrics.observe('zk_sync_duration_seconds', 1, 0.2)
+        metrics.observe('zk_sync_duration_seconds', 1, 0.25)
+        metrics.observe('zk_sync_duration_seconds', 1, 900)
+        body = render(stored(metrics.drain()))
+        self.assertIn('zk_sync_duration_seconds_bucket{le="0.1",machine_id="1"} 0', body)
+        self.assertIn('zk_sync_duration_seconds_bucket{le="0.25",machine_id="1"} 2', body)
+        self.assertIn('zk_sync_duration_seconds_bucket{le="300.0",machine_id="1"} 2', body)
+        self.assertIn('zk_sync_duration_seconds_bucket{le="+Inf",machine_id="1"} 3', body)
+        self.assertIn('zk_sync_duration_seconds_sum{machine_id="1"} 900.45', body)
+        self.assertIn('zk_sync_duration_seconds_count{machine_id="1"} 3', body)
+
+    def test_scrape_from_another_process(self):
+        """The process rendering the metrics never ran the sync, it only has
+        the rows the syncing process stored."""
+        reader, writer = multiprocessing.get_context('fork').Pipe(duplex=False)
+        process = multiprocessing.get_context('fork').Process(target=run_sync, args=(writer,))
+        process.start()
+        writer.close()
+        pid, rows = reader.recv()
+        process.join()
+        self.assertNotEqual(pid, os.getpid())
+        body = render(stored(rows), [('zk_sync_backlog_machines', 'gauge', "Backlog", [({}, 0)])])
+        self.assertIn('zk_sync_runs_total{machine_id="7",outcome="done"} 1', body)
+        self.assertIn('zk_punches_ingested_total{machine_id="7"} 12', body)
+        self.assertIn('zk_zklib_retransmits_total{machine_id="7"} 2', body)
+        self.assertIn('zk_zklib_timeouts_total{machine_id="7"} 1', body)
+        self.assertIn('zk_isapi_responses_total{code="200",machine_id="7"} 1', body)
+        self.assertIn('zk_isapi_responses_total{code="error",machine_id="7"} 1', body)
+        self.assertIn('zk_sync_fetch_seconds_bucket{le="0.5",machine_id="7"} 1', body)
+        self.assertIn('zk_sync_backlog_machines 0', body)
+        self.assertNotIn('process=', body)
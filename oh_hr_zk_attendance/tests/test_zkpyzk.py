@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import BaseCase
+
+from ..models.zkpyzk import same_name, stored_name
+
+
+class TestDeviceNames(BaseCase):
+
+    def test_stored_name(self):
+        self.assertEqual(stored_name('Alexander Smith', 28), 'Alexande')
+        self.assertEqual(stored_name('Alexander Smith', 72), 'Alexander Smith')
+        self.assertEqual(stored_name('Alexander Smith', 0), 'Alexander Smith')
+        # A character cut by the record is dropped
+        self.assertEqual(stored_name('Zoë Zoë', 28), 'Zoë Zo')
+        self.assertEqual(stored_name(False, 28), '')
+
+    def test_same_name(self):
+        self.assertTrue(same_name('Alexande', 'Alexander Smith', 28))
+        self.assertFalse(same_name('Alexande', 'Alexander Smith', 72))
+        self.assertFalse(same_name('A', 'Alice', 28))
+        self.assertFalse(same_name('Alice', 'Alice Martin', 72))
+        self.assertTrue(same_name('Alice', 'Alice', 0))
+        self.assertFalse(same_name('', 'Alice', 28))
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import calendar
+import datetime
+import random
+
+from odoo.tests.common import BaseCase
+
+from ..models import zkshift
+from ..models.zkshift import MAX_INTERVAL, day_number, day_totals
+
+DAY = day_number(datetime.date(2024, 3, 4))
+START = DAY * 86400
+
+
+class TestDayTotals(BaseCase):
+
+    def test_worked_break_overtime(self):
+        punches = [(8, 0), (12, 2), (13, 3), (17, 1), (18, 4), (20, 5)]
+        totals = day_totals([1] * len(punches), [START + hour * 3600 for hour, _p in punches],
+                            [punch for _h, punch in punches], {1: 'UTC'})
+        self.assertEqual(totals, {(1, DAY): [8 * 3600, 3600, 2 * 3600]})
+
+    def test_night_shift_counts_for_opening_day(self):
+        totals = day_totals([1, 1], [START + 22 * 3600, START + 30 * 3600], [0, 1], {1: 'UTC'})
+        self.assertEqual(totals, {(1, DAY): [8 * 3600, 0, 0]})
+
+    def test_local_day(self):
+        # 20:00 UTC is the next day in Asia/Tokyo
+        totals = day_totals([1, 1], [START + 20 * 3600, START + 21 * 3600], [0, 1], {1: 'Asia/Tokyo'})
+        self.assertEqual(totals, {(1, DAY + 1): [3600, 0, 0]})
+
+    def test_unmatched_and_long_intervals_are_ignored(self):
+        epochs = [START, START + 3600, START + 7200, START + 7200 + MAX_INTERVAL + 1]
+        totals = day_totals([1, 1, 1, 1], epochs, [1, 0, 0, 1], {1: 'UTC'})
+        self.assertEqual(totals, {})
+
+    def test_employees_are_not_mixed(self):
+        totals = day_totals([1, 2], [START, START + 3600], [0, 1], {1: 'UTC', 2: 'UTC'})
+        self.assertEqual(totals, {})
+
+    def test_empty(self):
+        self.assertEqual(day_totals([], [], [], {}), {})
+
+    def test_numpy_parity(self):
+        if zkshift.np is None:
+            self.skipTest("numpy is not installed")
+        rnd = random.Random(1)
+        employees, epochs, punches = [], [], []
+        # around the end of the daylight saving time in Europe
+        start = calendar.timegm((2024, 10, 20, 0, 0, 0))
+        for employee in (1, 2, 3):
+            epoch = start
+            for _i in range(500):
+                epoch += rnd.randint(60, 30000)
+                employees.append(employee)
+                epochs.append(epoch)
+                punches.append(rnd.choice([0, 1, 0, 1, 2, 3, 4, 5, 255]))
+        timezones = {1: 'Europe/Brussels', 2: 'Asia/Kolkata', 3: False}
+        with_numpy = day_totals(employees, epochs, punches, timezones)
+        np, zkshift.np = zkshift.np, None
+        try:
+            without_numpy = day_totals(employees, epochs, punches, timezones)
+        finally:
+            zkshift.np = np
+        self.assertTrue(with_numpy)
+        self.assertEqual(with_numpy, without_numpy)
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+#############################################################################
+#
+#    Cybrosys Technologies Pvt. Ltd.
+#
+#    Copyright (C) 2022-TODAY Cybrosys Technologies(<https://www.cybrosys.com>)
+#    Author: Cybrosys Techno Solutions(<https://www.cybrosys.com>)
+#
+#    You can modify it under the terms of the GNU LESSER
+#    GENERAL PUBLIC LICENSE (LGPL v3), Version 3.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU LESSER GENERAL PUBLIC LICENSE (LGPL v3) for more details.
+#
+#    You should have received a copy of the GNU LESSER GENERAL PUBLIC LICENSE
+#    (LGPL v3) along with this program.
+#    If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Benchmarks of the attendance ingestion hot paths
+
+    python3 zk_benchmark.py --sizes 1000,10000,100000 --save baseline.json
+    python3 zk_benchmark.py --compare baseline.json
+
+The protocol benchmarks (packet checksum, time decoding, attendance record
+decoding, ZKLib reads from an emulated device) only need the module
+sources. With --database, the ingestion benchmarks also run inside Odoo:
+_hik_process_events on synthetic events and a full download_attendance
+from an emulated ZK device. They need odoo importable (run with the Odoo
+python, --addons-path and the config of the database). Every size runs in
+its own transaction, rolled back at the end.
+
+Each benchmark reports items per second (best of --repeat runs), the peak
+memory traced by tracemalloc during a separate run, and for the Odoo ones
+the SQL queries per punch. --save writes the results as JSON, --compare
+reads a previous file and exits with status 1 when an items per second
+rate dropped, or a queries per punch count grew, by more than --tolerance.
+"""
+
+import argparse
+import datetime
+import importlib
+import itertools
+import json
+import os
+import platform
+import struct
+import sys
+import time
+import tracemalloc
+import types
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULE_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, TOOLS_DIR)
+
+import zk_emulator  # noqa: E402
+
+BENCH_PORT = 14970
+
+
+def load_protocol_modules():
+    """Import zklib, zkconst and zkbatch from the module sources without
+    importing the Odoo models package"""
+    name = 'zk_benchmark_models'
+    if name not in sys.modules:
+        package = types.ModuleType(name)
+        package.__path__ = [os.path.join(MODULE_DIR, 'models')]
+        sys.modules[name] = package
+    return (importlib.import_module(name + '.zklib'), importlib.import_module(name + '.zkconst'),
+            importlib.import_module(name + '.zkbatch'))
+
+
+def measure(func, size, repeat, sql_cursor=None):
+    """Run func() repeat times, then once under tracemalloc
+
+    func returns the number of items it processed, size is used when it
+    returns None."""
+    best = None
+    queries = None
+    for _i in range(repeat):
+        before = sql_cursor.sql_log_count if sql_cursor is not None else 0
+        start = time.perf_counter()
+        items = func() or size
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, items)
+        if sql_cursor is not None:
+            queries = (sql_cursor.sql_log_count - before) / float(items or 1)
+    tracemalloc.start()
+    try:
+        func()
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    elapsed, items = best
+    result = {
+        'items': items,
+        'seconds': round(elapsed, 6),
+        'per_second': round(items / elapsed, 1) if elapsed else None,
+        'peak_kb': round(peak / 1024.0, 1),
+    }
+    if queries is not None:
+        result['queries_per_punch'] = round(queries, 4)
+    return result
+
+
+def attlog_buffer(size):
+    """Raw CMD_ATTLOG_RRQ buffer of size 40 bytes records"""
+    start = int(time.time()) - size
+    records = b''.join(zk_emulator.ATTLOG_RECORD.pack(
+        i % 500, b'%d' % (1000 + i % 500), 1, zk_emulator.encode_time(start + i), i % 2) for i in range(size))
+    return struct.pack('<I', len(records)) + records
+
+
+def hik_events(size, users):
+    """AcsEvent dicts of the persons of an emulated Hikvision device"""
+    start = int(time.time()) - size
+    return [{
+        'major': 5,
+        'minor': 75,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(start + i)),
+        'employeeNoString': user_id,
+        'name': name,
+        'serialNo': i + 1,
+    } for i, (_uid, user_id, name) in zip(range(size), itertools.cycle(users))]
+
+
+def protocol_benchmarks(sizes, repeat):
+    zklib, zkconst, zkbatch = load_protocol_modules()
+    results = {}
+    client = zklib.ZKLib('127.0.0.1', BENCH_PORT)
+    client.zkclient.close()
+
+    for size in sizes:
+        packet = bytes(range(256)) * 4 + bytes(8)
+
+        def checksum():
+            create = client.createChkSum
+            for _i in range(size):
+                create(packet)
+        results.setdefault('createChkSum', {})[str(size)] = measure(checksum, size, repeat)
+
+        timestamps = [zk_emulator.encode_time(int(time.time()) - i * 37) for i in range(size)]
+
+        def decode_time():
+            decode = zkconst.decode_time
+            for t in timestamps:
+                decode(t)
+        results.setdefault('decode_time', {})[str(size)] = measure(decode_time, size, repeat)
+
+        def zk_time_to_epoch():
+            decode = zkbatch.zk_time_to_epoch
+            for t in timestamps:
+                decode(t)
+        results.setdefault('zk_time_to_epoch', {})[str(size)] = measure(zk_time_to_epoch, size, repeat)
+
+        data = attlog_buffer(size)
+
+        def from_attlog():
+            return len(zkbatch.PunchBatch.from_attlog(data, size, 1))
+        results.setdefault('PunchBatch.from_attlog', {})[str(size)] = measure(from_attlog, size, repeat)
+
+        options = zk_emulator.Options(users=min(size, 5000), records=size)
+        with zk_emulator.Fleet(zk=1, base_port=BENCH_PORT, options=options):
+            def zklib_attendance():
+                zk = zklib.ZKLib('127.0.0.1', BENCH_PORT)
+                try:
+                    zk.connect()
+                    attendance = zk.getAttendance()
+                    zk.disconnect()
+                finally:
+                    zk.zkclient.close()
+                return len(attendance or ())
+
+            def zklib_users():
+                zk = zklib.ZKLib('127.0.0.1', BENCH_PORT)
+                try:
+                    zk.connect()
+                    users = zk.getUser()
+                    zk.disconnect()
+                finally:
+                    zk.zkclient.close()
+                return len(users or ())
+            results.setdefault('ZKLib.getAttendance', {})[str(size)] = measure(zklib_attendance, size, repeat)
+            results.setdefault('ZKLib.getUser', {})[str(size)] = measure(zklib_users, options.users, repeat)
+    return results
+
+
+def odoo_benchmarks(sizes, repeat, database, config):
+    import odoo
+    from odoo.api import Environment, SUPERUSER_ID
+    odoo.tools.config.parse_config(['-c', config] if config else [])
+    registry = odoo.registry(database)
+    results = {}
+    for size in sizes:
+        options = zk_emulator.Options(users=min(size, 5000), records=size)
+        fleet = zk_emulator.Fleet(zk=1, hik=1, base_port=BENCH_PORT, options=options)
+        zk_values, hik_values = fleet.machine_values()
+        events = hik_events(size, fleet.devices[1].users)
+        with fleet, registry.cursor() as cr:
+            env = Environment(cr, SUPERUSER_ID, {})
+            hik = env['zk.machine'].create(hik_values)
+
+            def process_events():
+                # The persons are read from the emulated device on the first
+                # unknown user, as during a real first download.
+                with cr.savepoint():
+                    raise _Rollback(hik._hik_process_events(hik, events))
+
+            results.setdefault('_hik_process_events', {})[str(size)] = measure(
+                _catch_rollback(process_events), size, repeat, sql_cursor=cr)
+
+            zk = env['zk.machine'].create(zk_values)
+
+            def download():
+                with cr.savepoint():
+                    zk.download_attendance()
+                    env.flush_all()
+                    raise _Rollback(size)
+
+            results.setdefault('download_attendance', {})[str(size)] = measure(
+                _catch_rollback(download), size, repeat, sql_cursor=cr)
+            cr.rollback()
+    return results
+
+
+class _Rollback(Exception):
+    """Raised to roll a benchmark savepoint back, carries the item count"""
+
+    def __init__(self, items):
+        super().__init__(items)
+        self.items = items
+
+
+def _catch_rollback(func):
+    def run():
+        try:
+            func()
+        except _Rollback as e:
+            return e.items
+    return run
+
+
+def compare(results, baseline, tolerance):
+    """Print the changes against baseline, returns the regressions"""
+    regressions = []
+    for bench, by_size in sorted(results.items()):
+        for size, current in sorted(by_size.items(), key=lambda item: int(item[0])):
+            previous = baseline.get('results', {}).get(bench, {}).get(size)
+            if not previous:
+                continue
+            line = "%-28s %8s" % (bench, size)
+            if previous.get('per_second') and current.get('per_second'):
+                ratio = current['per_second'] / previous['per_second']
+                line += "  %12.1f/s  %+6.1f%%" % (current['per_second'], (ratio - 1) * 100)
+                if ratio < 1 - tolerance:
+                    regressions.append((bench, size, 'per_second', previous['per_second'], current['per_second']))
+            if previous.get('queries_per_punch') is not None and current.get('queries_per_punch') is not None:
+                line += "  %.3f queries/punch (was %.3f)" % (current['queries_per_punch'],
+                                                           previous['queries_per_punch'])
+                if current['queries_per_punch'] > previous['queries_per_punch'] * (1 + tolerance) + 0.001:
+                    regressions.append((bench, size, 'queries_per_punch', previous['queries_per_punch'],
+                                        current['queries_per_punch']))
+            print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--sizes', default='1000,10000,100000', help="comma separated log sizes")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per benchmark, the best is kept")
+    parser.add_argument('--database', help="Odoo database of the ingestion benchmarks")
+    parser.add_argument('--config', help="Odoo configuration file")
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON results of a previous run to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+
+    results = protocol_benchmarks(sizes, args.repeat)
+    if args.database:
+        results.update(odoo_benchmarks(sizes, args.repeat, args.database, args.config))
+    report = {
+        'date': datetime.datetime.utcnow().replace(microsecond=0).isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    for bench, by_size in sorted(results.items()):
+        for size, result in sorted(by_size.items(), key=lambda item: int(item[0])):
+            print("%-28s %8s  %12s/s  %10.1f KiB%s" % (
+                bench, size, result['per_second'], result['peak_kb'],
+                "  %.3f queries/punch" % result['queries_per_punch'] if 'queries_per_punch' in result else ''))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("\nCompared with %s (%s):" % (args.compare, baseline.get('date')))
+        regressions = compare(results, baseline, args.tolerance)
+        for bench, size, metric, before, after in regressions:
+            print("REGRESSION %s[%s] %s: %s -> %s" % (bench, size, metric, before, after))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,583 @@
+# -*- coding: utf-8 -*-
+#############################################################################
+#
+#    Cybrosys Technologies Pvt. Ltd.
+#
+#    Copyright (C) 2022-TODAY Cybrosys Technologies(<https://www.cybrosys.com>)
+#    Author: Cybrosys Techno Solutions(<https://www.cybrosys.com>)
+#
+#    You can modify it under the terms of the GNU LESSER
+#    GENERAL PUBLIC LICENSE (LGPL v3), Version 3.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU LESSER GENERAL PUBLIC LICENSE (LGPL v3) for more details.
+#
+#    You should have received a copy of the GNU LESSER GENERAL PUBLIC LICENSE
+#    (LGPL v3) along with this program.
+#    If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Emulated ZKTeco and Hikvision devices serving synthetic logs
+
+Runs a fleet of fake devices on localhost, to drive ZKLib, pyzk and the
+cron_download of the module without hardware:
+
+    python3 zk_emulator.py --zk 20 --hik 5 --records 10000 --users 200 \\
+        --latency 5 --loss 0.01
+
+Every ZK device listens on one port for both UDP and TCP and answers the
+commands used by the module: connect, device options, free sizes, get and
+set time, the direct user and attendance reads of ZKLib (CMD_PREPARE_DATA
+then CMD_DATA chunks) and the buffered reads of pyzk (1503/1504). Any other
+command is acknowledged. Every Hikvision device serves the ISAPI
+deviceInfo, capabilities, UserInfo, CardInfo and AcsEvent searches over
+HTTP, without checking the credentials.
+
+Each device has its own users (ids offset by the device index) so that the
+punches of the fleet do not overlap once stored. The attendance log of a ZK
+device is built on its first read and kept in memory, about 40 bytes per
+record.
+
+The machines to create in Odoo are printed as JSON on startup. The module
+can also be imported and the Fleet class used from a benchmark or a test.
+"""
+
+import argparse
+import calendar
+import json
+import random
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+CMD_CONNECT = 1000
+CMD_EXIT = 1001
+CMD_OPTIONS_RRQ = 11
+CMD_USERTEMP_RRQ = 9
+CMD_ATTLOG_RRQ = 13
+CMD_GET_FREE_SIZES = 50
+CMD_GET_PINWIDTH = 69
+CMD_GET_TIME = 201
+CMD_SET_TIME = 202
+CMD_GET_VERSION = 1100
+CMD_PREPARE_DATA = 1500
+CMD_DATA = 1501
+CMD_FREE_DATA = 1502
+CMD_PREPARE_BUFFER = 1503
+CMD_READ_BUFFER = 1504
+CMD_ACK_OK = 2000
+
+HEADER = struct.Struct('<4H')
+TCP_TOP = struct.Struct('<HHI')
+TCP_MAGIC = (0x5050, 0x7D82)
+# Payload of the CMD_DATA packets sent over UDP
+UDP_CHUNK = 1024
+# UDP packets sent back to back before pacing
+UDP_BURST = 16
+
+USER_RECORD = struct.Struct('<HB8s24sIx7sx24s')
+ATTLOG_RECORD = struct.Struct('<H24sBIB8x')
+
+
+def encode_time(epoch):
+    """Timestamp format of the clocks for seconds since the epoch, in the
+    local time of the device"""
+    t = time.gmtime(epoch)
+    return ((t.tm_year % 100) * 12 * 31 + (t.tm_mon - 1) * 31 + t.tm_mday - 1) * 86400 \
+        + (t.tm_hour * 60 + t.tm_min) * 60 + t.tm_sec
+
+
+def decode_time(t):
+    second, t = t % 60, t // 60
+    minute, t = t % 60, t // 60
+    hour, t = t % 24, t // 24
+    day, t = t % 31 + 1, t // 31
+    month, t = t % 12 + 1, t // 12
+    return calendar.timegm((t + 2000, month, day, hour, minute, second))
+
+
+class Options:
+    """Behaviour shared by the emulated devices"""
+
+    def __init__(self, users=100, records=1000, days=30, latency=0.0, loss=0.0, drift=0, tz_offset=0,
+                 page_size=30, udp_rate=20000, seed=0):
+        self.users = users
+        self.records = records
+        self.days = days
+        # seconds added before each reply
+        self.latency = latency
+        # probability of dropping a request
+        self.loss = loss
+        # largest clock drift of a device, in seconds
+        self.drift = drift
+        # hours between the device local time and UTC
+        self.tz_offset = tz_offset
+        self.page_size = page_size
+        # UDP packets sent per second during a transfer, the devices do not
+        # burst faster than the receive buffer of the client can absorb
+        self.udp_rate = udp_rate
+        self.seed = seed
+
+
+class EmulatedDevice:
+    """Synthetic users and punches of one device"""
+
+    def __init__(self, index, port, options):
+        self.index = index
+        self.port = port
+        self.options = options
+        rnd = random.Random(options.seed * 100003 + index)
+        self.clock_offset = rnd.randint(-options.drift, options.drift) if options.drift else 0
+        first = 1000 + index * options.users
+        self.users = [(uid, str(first + uid), 'Emulated User %s' % (first + uid))
+                      for uid in range(1, options.users + 1)]
+        self._rnd = rnd
+        self._punches = None
+        self._lock = threading.Lock()
+        self._running = False
+        self._threads = []
+
+    def now(self):
+        """Local time of the device clock, as seconds since the epoch"""
+        return time.time() + self.options.tz_offset * 3600 + self.clock_offset
+
+    def punches(self):
+        """(uid, user_id, utc epoch, punch) of the log, oldest first"""
+        with self._lock:
+            if self._punches is None:
+                end = int(time.time())
+                start = end - self.options.days * 86400
+                epochs = sorted(self._rnd.randint(start, end) for _i in range(self.options.records))
+                state = {}
+                punches = []
+                for epoch in epochs:
+                    uid, user_id, _name = self.users[self._rnd.randrange(len(self.users))]
+                    punch = state[uid] = 1 - state.get(uid, 1)
+                    punches.append((uid, user_id, epoch, punch))
+                self._punches = punches
+            return self._punches
+
+    def _delay(self):
+        if self.options.latency:
+            time.sleep(self.options.latency)
+
+    def _dropped(self):
+        return self.options.loss and self._rnd.random() < self.options.loss
+
+
+class ZkDevice(EmulatedDevice):
+    """ZK device answering over UDP and TCP on the same port"""
+
+    def __init__(self, index, port, options):
+        super().__init__(index, port, options)
+        self._buffers = {}
+        self._sessions = 0
+        self._attlog = None
+
+    def start(self):
+        self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._udp.bind(('127.0.0.1', self.port))
+        self._udp.settimeout(0.5)
+        self._tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._tcp.bind(('127.0.0.1', self.port))
+        self._tcp.listen(16)
+        self._tcp.settimeout(0.5)
+        self._running = True
+        for target in (self._serve_udp, self._serve_tcp):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._running = False
+        for thread in self._threads:
+            thread.join()
+        self._udp.close()
+        self._tcp.close()
+
+    # Data
+
+    def user_data(self):
+        records = b''.join(USER_RECORD.pack(uid, 0, b'', name.encode(), 0, b'1', user_id.encode())
+                           for uid, user_id, name in self.users)
+        return struct.pack('<I', len(records)) + records
+
+    def attendance_data(self):
+        with self._lock:
+            attlog = self._attlog
+        if attlog is None:
+            offset = self.options.tz_offset * 3600
+            records = b''.join(ATTLOG_RECORD.pack(uid, user_id.encode(), 1, encode_time(epoch + offset), punch)
+                               for uid, user_id, epoch, punch in self.punches())
+            attlog = struct.pack('<I', len(records)) + records
+            with self._lock:
+                self._attlog = attlog
+        return attlog
+
+    def read(self, command):
+        if command == CMD_ATTLOG_RRQ:
+            return self.attendance_data()
+        if command == CMD_USERTEMP_RRQ:
+            return self.user_data()
+        return struct.pack('<I', 0)
+
+    # Protocol
+
+    def packet(self, command, session_id, reply_id, payload=b''):
+        return HEADER.pack(command, 0, session_id, reply_id) + payload
+
+    def transfer(self, session_id, reply_id, data, tcp):
+        """Packets of a CMD_PREPARE_DATA transfer, a single CMD_DATA packet
+        over TCP"""
+        if tcp:
+            return [self.packet(CMD_DATA, session_id, reply_id, bytes(data))]
+        packets = [self.packet(CMD_PREPARE_DATA, session_id, reply_id, struct.pack('<I', len(data)))]
+        view = memoryview(data)
+        packets.extend(self.packet(CMD_DATA, session_id, reply_id, view[i:i + UDP_CHUNK].tobytes())
+                       for i in range(0, len(data), UDP_CHUNK))
+        packets.append(self.packet(CMD_ACK_OK, session_id, reply_id))
+        return packets
+
+    def handle(self, data, tcp=False):
+        """Returns the packets answering the command packet data"""
+        command, _chksum, session_id, reply_id = HEADER.unpack_from(data)
+        payload = data[HEADER.size:]
+        ok = [self.packet(CMD_ACK_OK, session_id, reply_id)]
+        if command == CMD_CONNECT:
+            with self._lock:
+                self._sessions += 1
+                session_id = self._sessions % 0xFFFF
+            return [self.packet(CMD_ACK_OK, session_id, reply_id)]
+        if command == CMD_EXIT:
+            self._buffers.pop(session_id, None)
+            return ok
+        if command == CMD_GET_FREE_SIZES:
+            fields = [0] * 20
+            fields[4] = len(self.users)
+            fields[8] = self.options.records
+            fields[14], fields[15], fields[16] = 3000, 3000, 100000
+            return [self.packet(CMD_ACK_OK, session_id, reply_id,
+                                struct.pack('<20i', *fields) + struct.pack('<3i', 0, 0, 0))]
+        if command == CMD_OPTIONS_RRQ:
+            name = bytes(payload).split(b'\x00', 1)[0]
+            value = {
+                b'~SerialNumber': b'EMU%05d' % self.index,
+                b'~DeviceName': b'Emulated ZK %d' % self.index,
+                b'~Platform': b'ZEM560_TFT',
+                b'~ZKFPVersion': b'10',
+                b'~ExtendFmt': b'1',
+                b'FaceFunOn': b'0',
+                b'~PIN2Width': b'9',
+            }.get(name, b'')
+            return [self.packet(CMD_ACK_OK, session_id, reply_id, name + b'=' + value + b'\x00')]
+        if command == CMD_GET_VERSION:
+            return [self.packet(CMD_ACK_OK, session_id, reply_id, b'Ver 6.60 Emulated\x00')]
+        if command == CMD_GET_PINWIDTH:
+            return [self.packet(CMD_ACK_OK, session_id, reply_id, b'\x09')]
+        if command == CMD_GET_TIME:
+            return [self.packet(CMD_ACK_OK, session_id, reply_id,
+                                struct.pack('<I', encode_time(int(self.now()))))]
+        if command == CMD_SET_TIME:
+            local = decode_time(struct.unpack_from('<I', payload)[0])
+            self.clock_offset = local - time.time() - self.options.tz_offset * 3600
+            return ok
+        if command == CMD_PREPARE_BUFFER:
+            _flag, inner, _fct, _ext = struct.unpack_from('<bhii', payload)
+            data = self.read(inner)
+            self._buffers[session_id] = data
+            return [self.packet(CMD_ACK_OK, session_id, reply_id, struct.pack('<BI', 0, len(data)))]
+        if command == CMD_READ_BUFFER:
+            start, size = struct.unpack_from('<ii', payload)
+            data = memoryview(self._buffers.get(session_id, b''))[start:start + size]
+            return self.transfer(session_id, reply_id, data, tcp)
+        if command == CMD_FREE_DATA:
+            self._buffers.pop(session_id, None)
+            return ok
+        if command in (CMD_ATTLOG_RRQ, CMD_USERTEMP_RRQ):
+            return self.transfer(session_id, reply_id, self.read(command), tcp)
+        return ok
+
+    def _serve_udp(self):
+        while self._running:
+            try:
+                data, address = self._udp.recvfrom(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if len(data) < HEADER.size or self._dropped():
+                continue
+            self._delay()
+            for i, packet in enumerate(self.handle(data), 1):
+                self._udp.sendto(packet, address)
+                if not i % UDP_BURST:
+                    time.sleep(UDP_BURST / self.options.udp_rate)
+
+    def _serve_tcp(self):
+        while self._running:
+            try:
+                conn, _address = self._tcp.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            thread = threading.Thread(target=self._serve_connection, args=(conn,), daemon=True)
+            thread.start()
+
+    def _serve_connection(self, conn):
+        conn.settimeout(60)
+        try:
+            while self._running:
+                top = self._recv_exact(conn, TCP_TOP.size)
+                if not top:
+                    break
+                magic1, magic2, length = TCP_TOP.unpack(top)
+                if (magic1, magic2) != TCP_MAGIC:
+                    break
+                data = self._recv_exact(conn, length)
+                if not data:
+                    break
+                self._delay()
+                for packet in self.handle(data, tcp=True):
+                    conn.sendall(TCP_TOP.pack(TCP_MAGIC[0], TCP_MAGIC[1], len(packet)) + packet)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _recv_exact(conn, size):
+        chunks = []
+        while size:
+            chunk = conn.recv(size)
+            if not chunk:
+                return b''
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+
+class HikDevice(EmulatedDevice):
+    """Hikvision device serving the ISAPI access control searches"""
+
+    def start(self):
+        device = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                device._dispatch(self, 'GET')
+
+            def do_POST(self):
+                device._dispatch(self, 'POST')
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self._server.daemon_threads = True
+        self._running = True
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        self._running = False
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _dispatch(self, handler, method):
+        body = b''
+        length = int(handler.headers.get('Content-Length') or 0)
+        if length:
+            body = handler.rfile.read(length)
+        if self._dropped():
+            handler.close_connection = True
+            return
+        self._delay()
+        path = urlsplit(handler.path).path
+        routes = {
+            ('GET', '/ISAPI/System/deviceInfo'): self._device_info,
+            ('GET', '/ISAPI/AccessControl/AcsEvent/capabilities'): self._event_capabilities,
+            ('GET', '/ISAPI/AccessControl/UserInfo/capabilities'): self._user_capabilities,
+            ('GET', '/ISAPI/AccessControl/UserInfo/Count'): self._user_count,
+            ('GET', '/ISAPI/AccessControl/CardInfo/Count'): self._card_count,
+            ('POST', '/ISAPI/AccessControl/AcsEvent'): self._search_events,
+            ('POST', '/ISAPI/AccessControl/UserInfo/Search'): self._search_users,
+            ('POST', '/ISAPI/AccessControl/CardInfo/Search'): self._search_cards,
+        }
+        route = routes.get((method, path))
+        if route is None:
+            status, content_type, content = 404, 'application/json', b'{"statusCode": 4}'
+        else:
+            try:
+                payload = json.loads(body or b'{}')
+            except ValueError:
+                payload = {}
+            status, content_type, content = route(payload)
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(content)))
+        handler.end_headers()
+        handler.wfile.write(content)
+
+    @staticmethod
+    def _json(data):
+        return 200, 'application/json', json.dumps(data).encode()
+
+    def _device_info(self, payload):
+        xml = ('<?xml version="1.0" encoding="UTF-8"?>'
+               '<DeviceInfo xmlns="http://www.hikvision.com/ver20/XMLSchema">'
+               '<deviceName>Emulated Hik %d</deviceName><model>DS-K1T671M</model>'
+               '<serialNumber>HIKEMU%05d</serialNumber><firmwareVersion>V3.2.30</firmwareVersion>'
+               '</DeviceInfo>') % (self.index, self.index)
+        return 200, 'application/xml', xml.encode()
+
+    def _event_capabilities(self, payload):
+        return self._json({'AcsEvent': {'AcsEventCond': {'maxResults': {'@min': 1, '@max': self.options.page_size}}}})
+
+    def _user_capabilities(self, payload):
+        return self._json({'UserInfo': {'UserInfoSearchCond': {
+            'maxResults': {'@min': 1, '@max': self.options.page_size}}}})
+
+    def _user_count(self, payload):
+        return self._json({'UserInfoCount': {'userNumber': len(self.users)}})
+
+    def _card_count(self, payload):
+        return self._json({'CardInfoCount': {'cardNumber': len(self.users)}})
+
+    def _page(self, cond, items):
+        position = int(cond.get('searchResultPosition') or 0)
+        size = min(int(cond.get('maxResults') or self.options.page_size), self.options.page_size)
+        page = items[position:position + size]
+        if not items:
+            status = 'NO MATCH'
+        elif position + len(page) < len(items):
+            status = 'MORE'
+        else:
+            status = 'OK'
+        return page, {'searchID': cond.get('searchID'), 'responseStatusStrg': status,
+                      'numOfMatches': len(page), 'totalMatches': len(items)}
+
+    def _search_users(self, payload):
+        cond = payload.get('UserInfoSearchCond') or {}
+        persons = [{'employeeNo': user_id, 'name': name, 'userType': 'normal'} for _uid, user_id, name in self.users]
+        page, result = self._page(cond, persons)
+        return self._json({'UserInfoSearch': dict(result, UserInfo=page)})
+
+    def _search_cards(self, payload):
+        cond = payload.get('CardInfoSearchCond') or {}
+        cards = [{'employeeNo': user_id, 'cardNo': '9%s' % user_id, 'cardType': 'normalCard'}
+                 for _uid, user_id, _name in self.users]
+        page, result = self._page(cond, cards)
+        return self._json({'CardInfoSearch': dict(result, CardInfo=page)})
+
+    def _search_events(self, payload):
+        cond = payload.get('AcsEventCond') or {}
+        start = self._parse_time(cond.get('startTime'), 0)
+        end = self._parse_time(cond.get('endTime'), float('inf'))
+        major = int(cond.get('major') or 0)
+        minor = int(cond.get('minor') or 0)
+        if major not in (0, 5) or minor not in (0, 75):
+            events = []
+        else:
+            names = {user_id: name for _uid, user_id, name in self.users}
+            events = [{
+                'major': 5,
+                'minor': 75,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(epoch)),
+                'employeeNoString': user_id,
+                'name': names[user_id],
+                'serialNo': serial,
+            } for serial, (_uid, user_id, epoch, _punch) in enumerate(self.punches(), 1) if start <= epoch <= end]
+        page, result = self._page(cond, events)
+        return self._json({'AcsEvent': dict(result, InfoList=page)})
+
+    @staticmethod
+    def _parse_time(value, default):
+        if not value:
+            return default
+        try:
+            stamp = time.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+        except ValueError:
+            return default
+        epoch = calendar.timegm(stamp)
+        zone = value[19:]
+        if zone and zone not in ('Z', 'z'):
+            sign = -1 if zone[0] == '-' else 1
+            hours, _sep, minutes = zone[1:].partition(':')
+            epoch -= sign * (int(hours or 0) * 3600 + int(minutes or 0) * 60)
+        return epoch
+
+
+class Fleet:
+    """Emulated devices on consecutive localhost ports, the ZK ones first"""
+
+    def __init__(self, zk=1, hik=0, base_port=14370, options=None):
+        options = options or Options()
+        self.devices = [ZkDevice(index, base_port + index, options) for index in range(zk)]
+        self.devices += [HikDevice(zk + index, base_port + zk + index, options) for index in range(hik)]
+
+    def start(self):
+        for device in self.devices:
+            device.start()
+        return self
+
+    def stop(self):
+        for device in self.devices:
+            device.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def machine_values(self):
+        """Values of the zk.machine records of the fleet"""
+        return [{
+            'name': '127.0.0.1',
+            'port_no': device.port,
+            'device_type': 'hik' if isinstance(device, HikDevice) else 'zk',
+        } for device in self.devices]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--zk', type=int, default=1, help="emulated ZK devices")
+    parser.add_argument('--hik', type=int, default=0, help="emulated Hikvision devices")
+    parser.add_argument('--base-port', type=int, default=14370, help="port of the first device")
+    parser.add_argument('--users', type=int, default=100, help="users per device")
+    parser.add_argument('--records', type=int, default=1000, help="punches per device")
+    parser.add_argument('--days', type=int, default=30, help="days covered by the punches")
+    parser.add_argument('--latency', type=float, default=0.0, help="milliseconds added before each reply")
+    parser.add_argument('--loss', type=float, default=0.0, help="probability of dropping a request")
+    parser.add_argument('--drift', type=int, default=0, help="largest clock drift of a device, in seconds")
+    parser.add_argument('--tz-offset', type=int, default=0, help="hours between the device time and UTC")
+    parser.add_argument('--page-size', type=int, default=30, help="ISAPI search page limit")
+    parser.add_argument('--udp-rate', type=int, default=20000, help="UDP packets per second of a transfer")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    options = Options(users=args.users, records=args.records, days=args.days, latency=args.latency / 1000.0,
+                      loss=args.loss, drift=args.drift, tz_offset=args.tz_offset, page_size=args.page_size,
+                      udp_rate=args.udp_rate, seed=args.seed)
+    fleet = Fleet(args.zk, args.hik, args.base_port, options).start()
+    print(json.dumps(fleet.machine_values(), indent=2))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fleet.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from odoo import api, fields, models, _
+
+from ..models.zkfleet import fleet_map
+from ..models.zkpyzk import push_users, same_name
+
+_logger = logging.getLogger(__name__)
+
+
+class ZkEnrolmentWizard(models.TransientModel):
+    _name = 'zk.enrolment.wizard'
+    _description = 'Push Employees to Biometric Devices'
+
+    machine_ids = fields.Many2many('zk.machine', string='Machines', domain=[('device_type', '=', 'zk')],
+                                   default=lambda self: self._default_machine_ids())
+    line_ids = fields.One2many('zk.enrolment.wizard.line', 'wizard_id', string='Report', readonly=True)
+    state = fields.Selection([('draft', 'Draft'), ('done', 'Done')], default='draft')
+
+    @api.model
+    def _default_machine_ids(self):
+        if self.env.context.get('active_model') == 'zk.machine':
+            return self.env['zk.machine'].browse(self.env.context.get('active_ids')).filtered(
+                lambda machine: machine.device_type == 'zk')
+        return self.env['zk.machine'].search([('device_type', '=', 'zk')])
+
+    def action_push(self):
+        """Push the employees missing or renamed on each machine.
+
+        The diff against the cached user table of every machine is computed
+        first, only the machines with changes are contacted, all at once."""
+        self.ensure_one()
+        self.line_ids.unlink()
+        Machine = self.env['zk.machine']
+        lines = []
+        jobs = []
+        for machine in self.machine_ids:
+            cached = {user.user_id: user.name for user in machine.device_user_ids}
+            wanted = machine._enrolment_users()
+            changes = {user_id: name for user_id, name in wanted.items()
+                       if not same_name(cached.get(user_id), name, machine.user_packet_size)}
+            if changes:
+                jobs.append({'machine_id': machine.id, 'params': machine._zk_params(), 'users': changes})
+            else:
+                lines.append({'machine_id': machine.id, 'device_users': len(cached), 'state': 'skipped',
+                              'message': _("Up to date")})
+        for job, result, error in fleet_map(push_users, jobs):
+            machine = Machine.browse(job['machine_id'])
+            vals = {'machine_id': machine.id, 'to_push': len(job['users'])}
+            if error:
+                _logger.warning("Enrolment push to %s failed: %s", machine.name, error)
+                vals.update(state='error', device_users=len(machine.device_user_ids),
+                            message=Machine._zk_error_message(error))
+            else:
+                machine._update_device_users(result['users'])
+                vals.update(state='failed' if result['failed'] else 'done', device_users=len(result['users']),
+                            pushed=len(result['pushed']), failed=len(result['failed']),
+                            message='\n'.join("%s: %s" % failure for failure in result['failed']))
+            lines.append(vals)
+        self.write({'state': 'done', 'line_ids': [(0, 0, vals) for vals in lines]})
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+
+class ZkEnrolmentWizardLine(models.TransientModel):
+    _name = 'zk.enrolment.wizard.line'
+    _description = 'Biometric Device Enrolment Report'
+
+    wizard_id = fields.Many2one('zk.enrolment.wizard', required=True, ondelete='cascade')
+    machine_id = fields.Many2one('zk.machine', string='Machine', readonly=True)
+    device_users = fields.Integer(string='Users on Device', readonly=True)
+    to_push = fields.Integer(string='Changed', readonly=True)
+    pushed = fields.Integer(string='Pushed', readonly=True)
+    failed = fields.Integer(string='Failed', readonly=True)
+    state = fields.Selection([('skipped', 'Up to date'), ('done', 'Done'), ('failed', 'Partially Failed'),
+                              ('error', 'Error')], string='Status', readonly=True)
+    message = fields.Text(string='Message', readonly=True)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+from ..models.zkexport import EXPORT_COLUMNS, EXPORT_ENCODERS, pyarrow
+
+
+class ZkExportWizard(models.TransientModel):
+    _name = 'zk.export.wizard'
+    _description = 'Export Biometric Punches'
+
+    date_from = fields.Datetime(string='From', required=True)
+    date_to = fields.Datetime(string='To', required=True, default=fields.Datetime.now,
+                              help="Punches at or after this time are not exported")
+    machine_ids = fields.Many2many('zk.machine', string='Machines',
+                                   default=lambda self: self._default_machine_ids(),
+                                   help="Leave empty to export the punches of all the machines")
+    include_unknown_machine = fields.Boolean(string='Punches Without Machine', default=True,
+                                             help="Also export the punches stored before the machines were "
+                                                  "recorded whose machine is not known, with or without "
+                                                  "selected machines")
+    employee_ids = fields.Many2many('hr.employee', string='Employees',
+                                    help="Leave empty to export the punches of all the employees")
+    file_format = fields.Selection([('csv', 'CSV'), ('parquet', 'Parquet')], string='Format',
+                                   required=True, default='csv',
+                                   help="Parquet needs the pyarrow library on the server")
+
+    @api.model
+    def _default_machine_ids(self):
+        if self.env.context.get('active_model') == 'zk.machine':
+            return self.env['zk.machine'].browse(self.env.context.get('active_ids'))
+        return self.env['zk.machine']
+
+    def action_export(self):
+        self.ensure_one()
+        if self.date_from >= self.date_to:
+            raise UserError(_("The start of the export must be before its end."))
+        if self.file_format == 'parquet' and pyarrow is None:
+            raise UserError(_("Please install the pyarrow library to export in Parquet."))
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/zk_attendance/export/{self.id}',
+            'target': 'new',
+        }
+
+    def _export_filename(self):
+        encoder = EXPORT_ENCODERS[self.file_format]
+        return f"punches-{self.date_from:%Y%m%d}-{self.date_to:%Y%m%d}.{encoder.extension}"
+
+    def _export_query(self):
+        """Returns the query and parameters selecting the punches of the
+        export in EXPORT_COLUMNS order, oldest first.
+
+        The query bypasses the record rules: only the punches of the
+        employees the user can read are selected."""
+        self.ensure_one()
+        where = ["a.punching_time >= %s", "a.punching_time < %s"]
+        params = [self.date_from, self.date_to]
+        if self.machine_ids:
+            where.append("(a.machine_id IN %s OR a.machine_id IS NULL)" if self.include_unknown_machine
+                         else "a.machine_id IN %s")
+            params.append(tuple(self.machine_ids.ids))
+        elif not self.include_unknown_machine:
+            where.append("a.machine_id IS NOT NULL")
+        domain = [('id', 'in', self.employee_ids.ids)] if self.employee_ids else []
+        Employee = self.env['hr.employee'].with_context(active_test=False)
+        employees, employee_params = Employee._search(domain).subselect()
+        where.append(f"a.employee_id IN ({employees})")
+        params.extend(employee_params)
+        query = """
+            SELECT a.punching_time, e.name, a.device_id, m.name, a.punch_type, a.attendance_type, p.name
+              FROM zk_machine_attendance a
+         LEFT JOIN hr_employee e ON e.id = a.employee_id
+         LEFT JOIN zk_machine m ON m.id = a.machine_id
+         LEFT JOIN res_partner p ON p.id = a.address_id
+             WHERE {}
+          ORDER BY a.punching_time, a.id
+        """.format(' AND '.join(where))
+        return query, params
+
+    def _export_labels(self):
+        """Returns a dict mapping the index of a selection column of the
+        export to the labels of its values."""
+        fields_ = self.env['zk.machine.attendance']._fields
+        return {
+            EXPORT_COLUMNS.index(name): dict(fields_[name]._description_selection(self.env))
+            for name in ('punch_type', 'attendance_type')
+        }
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from odoo import fields, models, _
+
+from ..models.zkcommand import run_command
+from ..models.zkfleet import fleet_map
+
+_logger = logging.getLogger(__name__)
+
+
+class ZkFleetCommandWizard(models.TransientModel):
+    _name = 'zk.fleet.command.wizard'
+    _description = 'Run a Command on Biometric Devices'
+
+    machine_ids = fields.Many2many('zk.machine', string='Machines', domain=[('device_type', '=', 'zk')],
+                                   default=lambda self: self.env['zk.enrolment.wizard']._default_machine_ids())
+    command = fields.Selection([
+        ('clock', 'Measure Clock Drift'),
+        ('set_clock', 'Set Device Clocks'),
+        ('info', 'Read Device Information'),
+    ], string='Command', default='clock', required=True,
+        help="Measure Clock Drift stores the drift of each device, subtracted from its punches at download.\n"
+             "Set Device Clocks sets the devices to the server time, then measures them again.")
+    line_ids = fields.One2many('zk.fleet.command.wizard.line', 'wizard_id', string='Results', readonly=True)
+    state = fields.Selection([('draft', 'Draft'), ('done', 'Done')], default='draft')
+
+    def action_run(self):
+        """Run the command on all the machines at once and collect the
+        results"""
+        self.ensure_one()
+        self.line_ids.unlink()
+        Machine = self.env['zk.machine']
+        lines = []
+        now = fields.Datetime.now()
+        jobs = [machine._command_job(self.command) for machine in self.machine_ids]
+        for job, result, error in fleet_map(run_command, jobs):
+            machine = Machine.browse(job['machine_id'])
+            if error:
+                _logger.warning("Command %s on %s failed: %s", self.command, machine.name, error)
+                lines.append({'machine_id': machine.id, 'state': 'error', 'result': str(error)})
+                continue
+            vals = {}
+            if result['srtt'] is not None:
+                vals.update(rtt_srtt=result['srtt'] * 1000.0, rtt_var=result['rttvar'] * 1000.0)
+            if 'clock_drift' in result:
+                vals.update(clock_drift=result['clock_drift'], clock_checked_at=now)
+            if 'serial_number' in result:
+                vals.update(device_name=result['device_name'], serial_number=result['serial_number'],
+                            platform=result['platform'], firmware_version=result['firmware'])
+            machine.write(vals)
+            lines.append({
+                'machine_id': machine.id,
+                'state': 'done',
+                'clock_drift': result.get('clock_drift', 0),
+                'rtt': result.get('clock_rtt') or (result['srtt'] or 0) * 1000.0,
+                'result': '\n'.join("%s: %s" % (key, value) for key, value in result.items()
+                                    if key not in ('srtt', 'rttvar', 'clock_drift', 'clock_rtt')),
+            })
+        self.write({'state': 'done', 'line_ids': [(0, 0, vals) for vals in lines]})
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+
+class ZkFleetCommandWizardLine(models.TransientModel):
+    _name = 'zk.fleet.command.wizard.line'
+    _description = 'Biometric Device Command Result'
+
+    wizard_id = fields.Many2one('zk.fleet.command.wizard', required=True, ondelete='cascade')
+    machine_id = fields.Many2one('zk.machine', string='Machine', readonly=True)
+    state = fields.Selection([('done', 'Done'), ('error', 'Error')], string='Status', readonly=True)
+    clock_drift = fields.Integer(string='Clock Drift (s)', readonly=True)
+    rtt = fields.Float(string='RTT (ms)', readonly=True)
+    result = fields.Text(string='Result', readonly=True)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+
+class ZkPurgeWizard(models.TransientModel):
+    _name = 'zk.purge.wizard'
+    _description = 'Purge Biometric Punches'
+
+    machine_ids = fields.Many2many('zk.machine', string='Machines', required=True,
+                                   default=lambda self: self._default_machine_ids())
+    date_from = fields.Datetime(string='From', help="Leave empty to purge from the oldest punch")
+    date_to = fields.Datetime(string='To', required=True, default=fields.Datetime.now,
+                              help="Punches at or after this time are kept")
+    deleted = fields.Integer(string='Punches Deleted', readonly=True)
+    state = fields.Selection([('draft', 'Draft'), ('done', 'Done')], default='draft')
+
+    @api.model
+    def _default_machine_ids(self):
+        if self.env.context.get('active_model') == 'zk.machine':
+            return self.env['zk.machine'].browse(self.env.context.get('active_ids'))
+        return self.env['zk.machine']
+
+    def action_purge(self):
+        self.ensure_one()
+        if self.date_from and self.date_from >= self.date_to:
+            raise UserError(_("The start of the purge must be before its end."))
+        deleted = sum(machine._purge_punches(self.date_from, self.date_to) for machine in self.machine_ids)
+        self.write({'state': 'done', 'deleted': deleted})
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from odoo import api, fields, models, _
+
+from ..models.zkfleet import fleet_map
+from ..models.zkpyzk import read_templates, write_templates
+
+_logger = logging.getLogger(__name__)
+
+
+class ZkTemplateSyncWizard(models.TransientModel):
+    _name = 'zk.template.sync.wizard'
+    _description = 'Replicate Biometric Templates'
+
+    machine_ids = fields.Many2many('zk.machine', string='Machines', domain=[('device_type', '=', 'zk')],
+                                   default=lambda self: self.env['zk.enrolment.wizard']._default_machine_ids())
+    mode = fields.Selection([('both', 'Download and Push'), ('download', 'Download Only'), ('push', 'Push Only')],
+                            string='Mode', default='both', required=True,
+                            help="Download fills the template store from the machines, push sends the stored "
+                                 "templates the machines are missing.")
+    line_ids = fields.One2many('zk.template.sync.wizard.line', 'wizard_id', string='Report', readonly=True)
+    state = fields.Selection([('draft', 'Draft'), ('done', 'Done')], default='draft')
+
+    def action_sync(self):
+        """Download the templates of every machine, then push to every machine
+        the stored templates it does not hold, the machines are contacted in
+        parallel at each step."""
+        self.ensure_one()
+        self.line_ids.unlink()
+        Machine = self.env['zk.machine']
+        report = {machine.id: {'machine_id': machine.id, 'state': 'done', 'message': ''}
+                  for machine in self.machine_ids}
+        if self.mode in ('both', 'download'):
+            jobs = [{'machine_id': machine.id, 'params': machine._zk_params()} for machine in self.machine_ids]
+            for job, result, error in fleet_map(read_templates, jobs):
+                vals = report[job['machine_id']]
+                if error:
+                    _logger.warning("Template download from machine %s failed: %s", job['machine_id'], error)
+                    vals.update(state='error', message=Machine._zk_error_message(error))
+                    continue
+                vals.update(downloaded=len(result), stored=Machine.browse(job['machine_id'])._store_templates(result))
+        if self.mode in ('both', 'push'):
+            jobs = []
+            for machine in self.machine_ids:
+                if report[machine.id]['state'] == 'error':
+                    continue
+                missing = machine._missing_templates()
+                if missing:
+                    jobs.append({'machine_id': machine.id, 'params': machine._zk_params(), 'templates': missing})
+            for job, result, error in fleet_map(write_templates, jobs):
+                vals = report[job['machine_id']]
+                vals['to_push'] = sum(len(fingers) for fingers in job['templates'].values())
+                if error:
+                    _logger.warning("Template push to machine %s failed: %s", job['machine_id'], error)
+                    vals.update(state='error', message=Machine._zk_error_message(error))
+                    continue
+                vals['pushed'] = len(result)
+                machine = Machine.browse(job['machine_id'])
+                self._record_pushed(machine, result)
+        self.write({'state': 'done', 'line_ids': [(0, 0, vals) for vals in report.values()]})
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    @api.model
+    def _record_pushed(self, machine, pushed):
+        """Mark the (user_id, slot) templates pushed to the machine as present"""
+        employees = {user.user_id: user.employee_id.id for user in machine.device_user_ids if user.employee_id}
+        keys = {(employees[user_id], slot) for user_id, slot in pushed if user_id in employees}
+        present = {}
+        for tmpl in self.env['zk.employee.template'].search([('employee_id', 'in', [key[0] for key in keys])]):
+            if (tmpl.employee_id.id, tmpl.slot) in keys:
+                present[(tmpl.employee_id.id, tmpl.slot)] = tmpl.checksum
+        machine._set_template_presence(present)
+
+
+class ZkTemplateSyncWizardLine(models.TransientModel):
+    _name = 'zk.template.sync.wizard.line'
+    _description = 'Biometric Template Replication Report'
+
+    wizard_id = fields.Many2one('zk.template.sync.wizard', required=True, ondelete='cascade')
+    machine_id = fields.Many2one('zk.machine', string='Machine', readonly=True)
+    downloaded = fields.Integer(string='Downloaded', readonly=True)
+    stored = fields.Integer(string='New in Store', readonly=True)
+    to_push = fields.Integer(string='Missing', readonly=True)
+    pushed = fields.Integer(string='Pushed', readonly=True)
+    state = fields.Selection([('done', 'Done'), ('error', 'Error')], string='Status', readonly=True)
+    message = fields.Text(string='Message', readonly=True)